@@ -0,0 +1,97 @@
+"""
+Admission control for browser/OCR-heavy endpoints.
+
+Each endpoint gets a budget of "cost units" (roughly pages being OCR'd at
+once), a bounded wait queue and a maximum wait. Over the queue limit -> 429,
+waited too long -> 503, both with a Retry-After estimate. Limits are per
+worker process. app.py turns AdmissionRejected into the HTTP response.
+"""
+import contextlib
+import threading
+import time
+
+from common import env_int
+
+def _admission_pool(name, capacity, max_queue, max_wait):
+  key = name.upper()
+  return {
+    "capacity": env_int(f"ADMIT_{key}_CAPACITY", capacity),
+    "max_queue": env_int(f"ADMIT_{key}_QUEUE", max_queue),
+    "max_wait": env_int(f"ADMIT_{key}_MAX_WAIT", max_wait),
+    "cond": threading.Condition(),
+    "in_use": 0,
+    "active": 0,
+    "waiting": 0,
+    "admitted": 0,
+    "rejected_queue_full": 0,
+    "rejected_timeout": 0,
+    "avg_seconds": 10.0,  # EWMA of service time, seeds Retry-After
+  }
+
+ADMISSION_POOLS = {
+  "upload": _admission_pool("upload", capacity=2, max_queue=4, max_wait=30),
+  "upload_grade_pdf": _admission_pool("upload_grade_pdf", capacity=6, max_queue=8, max_wait=60),
+  "upload_registration_summary_pdf": _admission_pool("upload_registration_summary_pdf", capacity=4, max_queue=8, max_wait=30),
+  # /upload_document's first-page render + OCR before it routes to one of the above
+  "classify": _admission_pool("classify", capacity=4, max_queue=16, max_wait=10),
+}
+
+class AdmissionRejected(Exception):
+  def __init__(self, status, retry_after, reason):
+    super().__init__(reason)
+    self.status = status
+    self.retry_after = retry_after
+    self.reason = reason
+
+def _retry_after_seconds(pool) -> int:
+  backlog = pool["waiting"] + pool["active"]
+  return max(1, int(pool["avg_seconds"] * (backlog + 1) / max(1, pool["capacity"])))
+
+def _admit(pool, cost):
+  deadline = time.monotonic() + pool["max_wait"]
+  with pool["cond"]:
+    if pool["in_use"] + cost > pool["capacity"]:
+      if pool["waiting"] >= pool["max_queue"]:
+        pool["rejected_queue_full"] += 1
+        raise AdmissionRejected(429, _retry_after_seconds(pool), "Server busy: queue is full")
+      pool["waiting"] += 1
+      try:
+        while pool["in_use"] + cost > pool["capacity"]:
+          remaining = deadline - time.monotonic()
+          if remaining <= 0:
+            pool["rejected_timeout"] += 1
+            raise AdmissionRejected(503, _retry_after_seconds(pool), "Server busy: timed out waiting for capacity")
+          pool["cond"].wait(remaining)
+      finally:
+        pool["waiting"] -= 1
+    pool["in_use"] += cost
+    pool["active"] += 1
+    pool["admitted"] += 1
+
+def _release(pool, cost, elapsed):
+  with pool["cond"]:
+    pool["in_use"] -= cost
+    pool["active"] -= 1
+    pool["avg_seconds"] = 0.8 * pool["avg_seconds"] + 0.2 * elapsed
+    pool["cond"].notify_all()
+
+@contextlib.contextmanager
+def admission_slot(name, cost=1):
+  """Hold `cost` units of `name`'s pool for the with-block; raises AdmissionRejected when not admitted."""
+  pool = ADMISSION_POOLS[name]
+  cost = min(cost, pool["capacity"])
+  _admit(pool, cost)
+  started = time.monotonic()
+  try:
+    yield
+  finally:
+    _release(pool, cost, time.monotonic() - started)
+
+def admission_stats() -> dict:
+  """Counters and current load of every pool (for /admin/admission)."""
+  out = {}
+  for name, pool in ADMISSION_POOLS.items():
+    with pool["cond"]:
+      out[name] = {k: v for k, v in pool.items() if k != "cond"}
+      out[name]["avg_seconds"] = round(pool["avg_seconds"], 3)
+  return out
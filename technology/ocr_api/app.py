@@ -84,26 +84,63 @@ def parse_grade_for_review(raw_text: str) -> str:
   out.append(f"Total no of Units {total_units}\n")
   return "\n".join(out)
 
-from flask import Flask, request, jsonify, send_from_directory, Response  # <-- added Response
+from flask import Flask, request, jsonify, send_from_directory, Response, g, has_request_context, copy_current_request_context  # <-- added Response
 from PIL import Image, ImageOps  # <-- added ImageOps for inversion
+from PIL import features as pil_features
 import pytesseract
 import re
 import io
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+from pdf2image.exceptions import PDFPopplerTimeoutError
 from pyzbar.pyzbar import decode
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import TimeoutException as SeleniumTimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 import time
 from reportlab.lib.pagesizes import letter
 from pdfrw import PdfReader, PdfWriter, PageMerge
+from pdfrw.buildxobj import pagexobj
 from reportlab.pdfgen import canvas
 import os
 import tempfile  # for DPI preprocessing
 from datetime import datetime
+from collections import deque
 import shutil
+import subprocess
 import traceback
+import atexit
+import signal
+import functools
+import threading
+import json
+import hashlib
+import hmac
+import uuid
+import random
+import sys
+import logging
+import fnmatch
+import concurrent.futures
+from werkzeug.utils import secure_filename
+from common import RESULTS_DIR, env_int, atomic_write_text, atomic_save_image
+from ocrlog import log, log_event, debug_log, warn_log
+from admission import AdmissionRejected, admission_slot, admission_stats
+from record_store import (find_record_by_document, save_verified_record, get_student_records, get_record_by_id,
+                          find_near_duplicate, remember_phash, add_pending_verification, pending_verifications,
+                          finish_verification_attempt, get_verification, count_pending_verifications)
+from portal_client import (PORTAL_POOL_SIZE, PORTAL_BROWSER_MAX_USES, PORTAL_RETRY_INTERVAL, PORTAL_RETRY_MAX_ATTEMPTS,
+                           PortalUnavailable, BrowserPool, portal_host, portal_page_url, note_portal_stat,
+                           portal_breaker_before_call, portal_breaker_after_call, portal_cache_get, portal_cache_put,
+                           portal_client_stats)
+from curriculum import (YEAR_ORDINAL_MAP, split_program_track_year, to_semester_word,
+                        curriculum_units, snap_course_code, validate_course_codes)
+from gwa import get_gwa_rules, compute_gwa, compute_gwa_by_term, render_grade_with_units_table, gwa_rows_problem
+from profiling import (PROFILES_DIR, PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, start_cprofile, stop_cprofile,
+                       start_sampling, stop_sampling, save_profile, profile_index)
+from janitor import note_artifact_access, ensure_janitor_started, wake_janitor, janitor_stats
+from classification import CLASSIFY_MIN_TEXT, DOC_ANCHORS, classify_text
 
 POPPLER_PATH = os.environ.get("POPPLER_PATH", "/usr/bin")
 CHROME_BINARY = (os.environ.get("GOOGLE_CHROME_BIN")
@@ -201,111 +238,357 @@ def parse_grade_for_review(raw_text: str) -> str:
   out.append(f"Total no of Units {total_units}\n")
   return "\n".join(out)
 
-# --- NEW: Parse Grades and Units, output Weighted Grades table with totals ---
+# --- COG course table -> structured rows for the GWA engine (gwa.py) ---
+def parse_cog_course_rows(raw_text: str, rules: dict = None) -> list:
+  """
+  Turn the course table of a raw COG text into rows:
+  {"index", "code", "title", "units", "grade", "section", "instructor"}.
+  Units/grade are the first "<integer> <grade>" token pair after the code, so
+  digits inside titles ("Capstone Project 1", "Computer Networking 4") are skipped.
+  """
+  rules = rules or get_gwa_rules()
+  non_numeric = {g.upper() for g in rules.get("non_numeric_grades", [])}
+  rows = []
+  header_found = False
+  for line in (ln.strip() for ln in (raw_text or "").splitlines()):
+    if line.startswith("# Course Code"):
+      header_found = True
+      continue
+    if not header_found or not re.match(r"^\d+ ", line):
+      continue
+    tokens = line.split()
+    code_idx = -1
+    course_code = ""
+    for i in range(1, len(tokens) - 1):
+      if re.match(r'^[A-Za-z]{2,6}$', tokens[i]) and re.match(r'^\d{3}$', tokens[i + 1]):
+        code_idx = i
+        course_code = f"{tokens[i].upper()} {tokens[i + 1]}"
+        break
+    if code_idx == -1:
+      continue
+    snapped = snap_course_code(course_code)
+    if snapped:
+      course_code = snapped["code"]
+
+    units = None
+    grade = None
+    grade_idx = -1
+    for j in range(code_idx + 2, len(tokens) - 1):
+      nxt = tokens[j + 1]
+      if re.match(r"^\d+$", tokens[j]) and (nxt.upper() in non_numeric or _normalize_grade_token(nxt)):
+        units, grade_idx = tokens[j], j + 1
+        break
+    if units is None:
+      # Legacy fallback: first integer after the code, grade right after it
+      for j in range(code_idx + 2, len(tokens)):
+        if re.match(r"^\d+$", tokens[j]):
+          units = tokens[j]
+          grade_idx = j + 1 if j + 1 < len(tokens) else -1
+          break
+    if units is None:
+      # OCR sometimes drops the units column; take units from the curriculum catalog
+      catalog_units = curriculum_units(course_code)
+      if catalog_units is not None:
+        units = str(catalog_units)
+        grade_idx = next((k for k in range(code_idx + 2, len(tokens)) if _normalize_grade_token(tokens[k])), -1)
+
+    title_end = grade_idx - 1 if grade_idx != -1 else len(tokens)
+    if grade_idx != -1:
+      raw_grade = tokens[grade_idx]
+      grade = raw_grade.upper() if raw_grade.upper() in non_numeric else _normalize_grade_token(raw_grade)
+    rest = tokens[grade_idx + 1:] if grade_idx != -1 else []
+    rows.append({
+      "index": int(tokens[0]),
+      "code": course_code,
+      "title": " ".join(tokens[code_idx + 2:max(code_idx + 2, title_end)]),
+      "units": int(units) if units is not None else None,
+      "grade": grade,
+      "section": rest[0] if rest else "",
+      "instructor": " ".join(rest[1:])
+    })
+  return rows
+
 def parse_grade_with_units(raw_text: str) -> str:
     """
     Parse raw COG text and output a table: Grades | Units | Weighted Grades.
     Includes a Total row for Units and Weighted Grades, and Weighted Average.
-    Skips NSTP 111 and NSTP 121 from totals and table.
+    Exclusions (NSTP, ...) come from GWA_RULES; see compute_gwa() for the JSON form.
     """
-    lines = [ln.strip() for ln in raw_text.splitlines() if ln.strip()]
-    table = []
-    header_found = False
-    total_units = 0
-    total_weighted = 0.0
-    for line in lines:
-        if line.startswith("# Course Code"):
-            header_found = True
-            continue
-        if header_found and re.match(r"^\d+ ", line):
-            tokens = line.split()
-            units = None
-            grade = None
-            code_idx = -1
-            course_code = None
-            for i in range(1, len(tokens) - 1):
-                if re.match(r'^[A-Za-z]{2,6}$', tokens[i]) and re.match(r'^\d{3}$', tokens[i + 1]):
-                    code_idx = i
-                    course_code = f"{tokens[i].upper()} {tokens[i+1]}"
-                    break
-            # Skip NSTP 111 and NSTP 121
-            if course_code in {"NSTP 111", "NSTP 121"}:
-                continue
-            if code_idx != -1:
-                for j in range(code_idx + 2, len(tokens)):
-                    if re.match(r"^\d+$", tokens[j]):
-                        units = tokens[j]
-                        if j + 1 < len(tokens):
-                            grade = tokens[j + 1]
-                        break
-            norm_grade = _normalize_grade_token(grade) if grade else None
-            try:
-                g_val = float(norm_grade) if norm_grade and norm_grade not in {"INC", "DROP"} else None
-                u_val = int(units) if units else None
-                weighted = g_val * u_val if g_val is not None and u_val is not None else ""
-                if u_val is not None:
-                    total_units += u_val
-                if weighted != "" and isinstance(weighted, (int, float)):
-                    total_weighted += weighted
-            except Exception:
-                weighted = ""
-            table.append([norm_grade or "", units or "", str(weighted) if weighted != "" else ""])
-    # Build table string
-    out = ["Grades | Units | Weighted Grades |"]
-    for row in table:
-        out.append(f"{row[0]:<6} | {row[1]:<5} | {row[2]:<14}|")
-    # Add totals row
-    out.append(f"Total:   | {total_units:<5} | {total_weighted:<14}|")
-    # Add Weighted Average row (4 decimal places when numeric)
-    if total_units > 0:
-        weighted_average = total_weighted / total_units
-        weighted_average_str = f"{weighted_average:.4f}"
-    else:
-        weighted_average_str = ""
-    out.append(f"Weighted Average: {weighted_average_str}")
-    return "\n".join(out)
+    return render_grade_with_units_table(compute_gwa(parse_cog_course_rows(raw_text)))
 
-# --- Endpoint to serve Grade_with_Units.txt ---
+def write_grade_with_units(raw_text: str) -> dict:
+  """Compute the GWA once and write both views: Grade_with_Units.txt and Grade_with_Units.json."""
+  gwa = compute_gwa(parse_cog_course_rows(raw_text))
+  atomic_write_text(os.path.join(RESULTS_DIR, "Grade_with_Units.txt"), render_grade_with_units_table(gwa))
+  atomic_write_text(os.path.join(RESULTS_DIR, "Grade_with_Units.json"), json.dumps(gwa, indent=2))
+  return gwa
+
+# --- Endpoint to serve Grade_with_Units.txt (?format=json for the structured result) ---
 @app.route('/grade_with_units', methods=['GET'])
 def grade_with_units():
-  raw_cog_path = os.path.join(RESULTS_DIR, "raw_cog_text.txt")
-  if not os.path.exists(raw_cog_path):
+  cog = get_ingestion_record("cog")
+  if not cog or cog.get("gwa") is None:
     return jsonify({"error": "raw_cog_text.txt not found"}), 400
-  with open(raw_cog_path, "r", encoding="utf-8") as f:
-    raw_text = f.read()
-  result = parse_grade_with_units(raw_text)
-  # Optionally save to results/Grade_with_Units.txt
-  atomic_write_text(os.path.join(RESULTS_DIR, "Grade_with_Units.txt"), result)
-  return Response(result, mimetype="text/plain")
+  if request.args.get("format") == "json":
+    return jsonify(cog["gwa"])
+  table = derived_view("grade_with_units", lambda r: render_grade_with_units_table(r["gwa"]), cog)
+  return Response(table, mimetype="text/plain")
+
+@app.route('/gwa', methods=['POST'])
+def gwa_endpoint():
+  """
+  Compute GWA/eligibility from structured rows, no OCR involved.
+  Body: {"rows": [{"code", "units", "grade"}, ...]}
+     or {"terms": {"2024-2025 FIRST": [rows], ...}} for per-term + cumulative.
+  """
+  data = request.get_json(silent=True)
+  if not isinstance(data, dict):
+    return jsonify({"error": "Expected a JSON object with rows or terms"}), 400
+  if data.get("terms") is not None:
+    if not isinstance(data["terms"], dict):
+      return jsonify({"error": "terms must be an object of {label: rows}"}), 400
+    for label, rows in data["terms"].items():
+      problem = gwa_rows_problem(rows, f"terms[{label!r}]")
+      if problem:
+        return jsonify({"error": problem}), 400
+    return jsonify(compute_gwa_by_term(data["terms"]))
+  if data.get("rows") is not None:
+    problem = gwa_rows_problem(data["rows"])
+    if problem:
+      return jsonify({"error": problem}), 400
+    return jsonify(compute_gwa(data["rows"]))
+  return jsonify({"error": "Provide rows or terms"}), 400
 
 # === Paths ===
-RESULTS_DIR = "/opt/ocr_api/results"
-os.makedirs(RESULTS_DIR, exist_ok=True)  # ensure results/ exists
+# RESULTS_DIR and the atomic write helpers are in common.py
 PUBLIC_RESULTS_BASE = os.environ.get("PUBLIC_RESULTS_BASE_URL", "https://ocr.achievemate.website/results").rstrip("/")
 
 # === Canonical result files you are watching ===
 RESULT_FILE_COE = os.path.join(RESULTS_DIR, "result_certificate_of_enrollment.txt")
 RESULT_FILE_COURSE = os.path.join(RESULTS_DIR, "result_course_grade.txt")
 
-def atomic_write_text(path, text):
-  """Write text atomically to avoid partial writes on Windows/Linux."""
-  tmp = f"{path}.tmp"
-  with open(tmp, "w", encoding="utf-8", newline="\n") as f:
-    f.write(text)
-    f.flush()
-    os.fsync(f.fileno())
-  os.replace(tmp, path)
-
-def debug_log(message: str):
-  """Emit a timestamped debug line to stdout for terminal visibility."""
-  try:
-    stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-  except Exception:
-    stamp = "UNKNOWN"
-  print(f"[DEBUG {stamp}] {message}", flush=True)
+# === Logging ===
+# Records are written off the request path (see ocrlog.py). Every line carries
+# the request id (X-Request-ID in/out) and endpoint. Verbose (debug) lines are
+# kept for a LOG_VERBOSE_SAMPLE_RATE fraction of requests, decided once per
+# request so a sampled request logs completely.
+LOG_VERBOSE_SAMPLE_RATE = float(os.environ.get("LOG_VERBOSE_SAMPLE_RATE", "1.0"))
+
+def _log_context() -> dict:
+  if not has_request_context():
+    return {}
+  return {"request_id": getattr(g, "request_id", None), "endpoint": request.endpoint}
+
+class RequestLogFilter(logging.Filter):
+  """Tags records logged on a request thread; drops debug lines of unsampled requests."""
+  def filter(self, record):
+    if not has_request_context():
+      return True
+    if record.levelno <= logging.DEBUG and not getattr(g, "log_verbose", True):
+      return False
+    record.fields = {**_log_context(), **getattr(record, "fields", {})}
+    return True
+
+log.addFilter(RequestLogFilter())
+
+@app.before_request
+def _start_request_log():
+  g.request_id = (request.headers.get("X-Request-ID", "") or uuid.uuid4().hex[:16])[:64]
+  g.log_verbose = LOG_VERBOSE_SAMPLE_RATE >= 1.0 or random.random() < LOG_VERBOSE_SAMPLE_RATE
+
+@app.after_request
+def _finish_request_log(response):
+  started = getattr(g, "request_started", None)
+  fields = {"method": request.method, "path": request.path, "status": response.status_code}
+  if started is not None:
+    fields["duration_ms"] = round((time.monotonic() - started) * 1000.0, 1)
+  timings = getattr(g, "stage_timings", None)
+  if timings:
+    fields["stage_timings_ms"] = {k: round(v * 1000.0, 1) for k, v in timings.items()}
+  usage = getattr(g, "resource_usage", None)
+  if usage:
+    fields["resources"] = usage
+  log_event(logging.INFO, "request", **fields)
+  response.headers["X-Request-ID"] = getattr(g, "request_id", "")
+  return response
 
 debug_log(f"PUBLIC_RESULTS_BASE={PUBLIC_RESULTS_BASE}")
 
+# === Request deadlines and per-stage budgets ===
+# Every request gets an end-to-end deadline (X-Request-Deadline header may
+# shorten it). Each stage takes min(remaining, its own cap) and passes it to
+# the tool doing the work: poppler and Tesseract get subprocess timeouts (the
+# process is killed on expiry), Chrome gets page-load/script timeouts.
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "120"))
+STAGE_TIMEOUTS = {
+  "pdf_render": float(os.environ.get("STAGE_TIMEOUT_PDF_RENDER", "30")),
+  "qr_portal": float(os.environ.get("STAGE_TIMEOUT_QR_PORTAL", "25")),
+  "ocr": float(os.environ.get("STAGE_TIMEOUT_OCR", "30")),  # per Tesseract call
+  "classify": float(os.environ.get("STAGE_TIMEOUT_CLASSIFY", "10")),
+}
+
+class DeadlineExceeded(Exception):
+  def __init__(self, stage):
+    super().__init__(f"Deadline exceeded during {stage}")
+    self.stage = stage
+
+@app.before_request
+def _start_request_deadline():
+  budget = REQUEST_DEADLINE_SECONDS
+  try:
+    asked = float(request.headers.get("X-Request-Deadline", "") or budget)
+    budget = max(1.0, min(budget, asked))
+  except ValueError:
+    pass
+  g.request_started = time.monotonic()
+  g.deadline = g.request_started + budget
+  g.stage_timeouts = []
+  g.stage_timings = {}
+  g.pages_rendered = 0
+
+@app.errorhandler(DeadlineExceeded)
+def _deadline_exceeded(e):
+  elapsed = time.monotonic() - getattr(g, "request_started", time.monotonic())
+  warn_log(f"{request.path} deadline exceeded", stage=e.stage, duration_ms=round(elapsed * 1000.0, 1))
+  return jsonify({
+    "error": "Deadline exceeded",
+    "stage": e.stage,
+    "elapsed_seconds": round(elapsed, 2)
+  }), 504
+
+def stage_budget(stage: str) -> float:
+  """Seconds this stage may use; raises DeadlineExceeded when the request has none left."""
+  cap = STAGE_TIMEOUTS.get(stage, REQUEST_DEADLINE_SECONDS)
+  if not has_request_context() or not hasattr(g, "deadline"):
+    return cap
+  remaining = g.deadline - time.monotonic()
+  if remaining <= 0:
+    raise DeadlineExceeded(stage)
+  return min(cap, remaining)
+
+def note_stage_timeout(stage: str):
+  """Record a stage that hit its own cap but let the request carry on."""
+  if has_request_context() and hasattr(g, "stage_timeouts"):
+    g.stage_timeouts.append(stage)
+  warn_log(f"stage {stage} timed out", stage=stage)
+
+def stage_timeouts() -> list:
+  return list(getattr(g, "stage_timeouts", [])) if has_request_context() else []
+
+def note_stage_time(stage: str, seconds: float):
+  """Accumulate wall time per stage for this request (profiles and logs report it)."""
+  if has_request_context() and hasattr(g, "stage_timings"):
+    g.stage_timings[stage] = g.stage_timings.get(stage, 0.0) + seconds
+  debug_log("stage done", stage=stage, duration_ms=round(seconds * 1000.0, 1))
+
+def ocr_image(image, stage="ocr", timeout=None, **kwargs) -> str:
+  """
+  pytesseract.image_to_string with a per-call timeout (Tesseract is killed when it expires).
+  Worker threads have no request context: pass `timeout` computed on the request thread.
+  """
+  t0 = time.monotonic()
+  note_child_spawn()
+  try:
+    return pytesseract.image_to_string(image, timeout=timeout or stage_budget(stage), **kwargs)
+  except RuntimeError as e:
+    if "timeout" in str(e).lower():
+      raise DeadlineExceeded(stage)
+    raise
+  finally:
+    note_stage_time(stage, time.monotonic() - t0)
+
+def ocr_words(image, stage="ocr", timeout=None, config="") -> list:
+  """
+  Word-level Tesseract output: [{text, conf, left, top, width, height, block, line}, ...]
+  (conf is -1 for non-word boxes, which are dropped).
+  """
+  t0 = time.monotonic()
+  note_child_spawn()
+  try:
+    data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT,
+                                     timeout=timeout or stage_budget(stage))
+  except RuntimeError as e:
+    if "timeout" in str(e).lower():
+      raise DeadlineExceeded(stage)
+    raise
+  finally:
+    note_stage_time(stage, time.monotonic() - t0)
+  words = []
+  for i, text in enumerate(data.get("text", [])):
+    conf = float(data["conf"][i])
+    if conf < 0 or not str(text).strip():
+      continue
+    words.append({
+      "text": str(text).strip(), "conf": conf,
+      "left": data["left"][i], "top": data["top"][i],
+      "width": data["width"][i], "height": data["height"][i],
+      "block": data["block_num"][i], "line": (data["block_num"][i], data["par_num"][i], data["line_num"][i]),
+    })
+  return words
+
+def render_pdf(pdf_bytes: bytes, stage="pdf_render", **kwargs):
+  """convert_from_bytes with a poppler timeout (pdftoppm is killed when it expires)."""
+  t0 = time.monotonic()
+  note_child_spawn()
+  try:
+    images = convert_from_bytes(pdf_bytes, poppler_path=POPPLER_PATH, timeout=stage_budget(stage), **kwargs)
+  except PDFPopplerTimeoutError:
+    raise DeadlineExceeded(stage)
+  finally:
+    note_stage_time(stage, time.monotonic() - t0)
+  if has_request_context() and hasattr(g, "pages_rendered"):
+    g.pages_rendered += len(images)
+  return images
+
+def launch_chrome():
+  if not CHROME_BINARY:
+    raise RuntimeError("Chrome/Chromium binary not found. Install google-chrome or chromium-browser and set GOOGLE_CHROME_BIN if needed.")
+  chrome_options = Options()
+  chrome_options.add_argument("--headless=new")
+  chrome_options.add_argument("--no-sandbox")
+  chrome_options.add_argument("--disable-dev-shm-usage")
+  chrome_options.binary_location = CHROME_BINARY
+
+  # Own process group, so a wedged chromedriver + its Chrome children can be killed together
+  service = Service(ChromeDriverManager().install(), popen_kw={"start_new_session": True})
+  driver = webdriver.Chrome(service=service, options=chrome_options)
+  note_child_spawn()
+  register_browser_group(driver.service.process.pid)
+  driver.set_window_size(995, 795)
+  return driver
+
+def load_portal_page(driver, url, stage="qr_portal", settle_seconds=3):
+  """driver.get() bounded by the stage budget, then a short settle wait for client-side rendering."""
+  budget = stage_budget(stage)
+  driver.set_page_load_timeout(budget)
+  driver.set_script_timeout(budget)
+  t0 = time.monotonic()
+  try:
+    driver.get(url)
+    time.sleep(min(settle_seconds, stage_budget(stage)))
+  except SeleniumTimeoutException:
+    raise DeadlineExceeded(stage)
+  finally:
+    note_stage_time(stage, time.monotonic() - t0)
+
+def quit_driver(driver, grace_seconds=5):
+  """driver.quit() can hang on a wedged browser; kill the whole process group if it does."""
+  if not driver:
+    return
+  t = threading.Thread(target=driver.quit, daemon=True)
+  t.start()
+  t.join(grace_seconds)
+  proc = getattr(getattr(driver, "service", None), "process", None)
+  if proc is not None and (t.is_alive() or proc.poll() is None):
+    try:
+      os.killpg(proc.pid, signal.SIGKILL)
+      warn_log(f"killed chromedriver process group {proc.pid}")
+    except Exception:
+      pass
+  if proc is not None:
+    # The registry entry stays until the group is empty; the reaper kills stragglers
+    _live_browser_pgids.discard(proc.pid)
+
 # === Image Scaling Only ===
 def scale_image(image, scale_factor=2):
   new_size = (int(image.width * scale_factor), int(image.height * scale_factor))
@@ -329,21 +612,93 @@ def crop_to_content(image, pad=20, threshold=240):
   except Exception:
     return image
 
+# === Deskew / orientation for photo uploads ===
+# Cheap, Tesseract-free estimate on a downsampled, binarized copy:
+# - quarter turns: the QR code's own orientation when one was decoded
+#   (zbar reports UP/RIGHT/DOWN/LEFT), otherwise the best row-profile score
+#   (text lines make it spiky) upright vs turned 90 degrees; Tesseract OSD is
+#   only asked to settle 90 vs 270 when there is no QR
+# - skew: the small angle that maximises the row-profile variance
+#   (coarse 1 degree steps, then 0.2 degree refinement)
+DESKEW_MAX_ANGLE = 15
+DESKEW_WORK_SIZE = 400
+DESKEW_MIN_ANGLE = 0.3  # below this, leave the image alone
+_QR_ORIENTATION_ROTATION = {"UP": 0, "RIGHT": 90, "DOWN": 180, "LEFT": 270}  # PIL rotate() degrees (CCW)
+
+def _binarized_small(image):
+  gray = image.convert("L")
+  factor = max(gray.size) // DESKEW_WORK_SIZE
+  if factor >= 2:
+    gray = gray.reduce(factor)  # box-average shrink, much cheaper than resize on full photos
+  ratio = DESKEW_WORK_SIZE / max(gray.size)
+  if ratio < 1:
+    gray = gray.resize((max(1, round(gray.width * ratio)), max(1, round(gray.height * ratio))), Image.BILINEAR)
+  gray = ImageOps.autocontrast(gray)
+  return gray.point(lambda v: 255 if v < 128 else 0)  # ink white, paper black (rotation fill = paper)
+
+def _row_profile_score(bw, angle=0.0) -> float:
+  rot = bw.rotate(angle, resample=Image.NEAREST, fillcolor=0) if angle else bw
+  rows = rot.resize((1, rot.height), Image.BOX).tobytes()
+  mean = sum(rows) / len(rows)
+  return sum((r - mean) ** 2 for r in rows) / len(rows)
+
+def _best_coarse_score(bw, step=3) -> float:
+  return max(_row_profile_score(bw, a) for a in range(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1, step))
+
+def estimate_skew(bw) -> float:
+  best = max(range(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1), key=lambda a: _row_profile_score(bw, a))
+  fine = [best + d / 5.0 for d in range(-4, 5)]
+  return max(fine, key=lambda a: _row_profile_score(bw, a))
+
+def _osd_rotation(image) -> int:
+  """Tesseract OSD 'Rotate' (clockwise) as PIL CCW degrees; 0 when OSD fails."""
+  try:
+    osd = pytesseract.image_to_osd(image, timeout=stage_budget("ocr"))
+    m = re.search(r"Rotate:\s*(\d+)", osd)
+    return (360 - int(m.group(1))) % 360 if m else 0
+  except Exception:
+    return 0
+
+def correct_orientation(image, qr_orientation=None):
+  """Rotate/deskew a photo upright -> (image, info with the angle applied)."""
+  t0 = time.monotonic()
+  bw = _binarized_small(image)
+  rotation, source = 0, None
+  if qr_orientation in _QR_ORIENTATION_ROTATION:
+    rotation, source = _QR_ORIENTATION_ROTATION[qr_orientation], "qr"
+  elif _best_coarse_score(bw.rotate(90, expand=True)) > 1.5 * _best_coarse_score(bw):
+    rotation, source = (_osd_rotation(image) or 90), "profile"
+  if rotation:
+    bw = bw.rotate(rotation, expand=True)
+  skew = estimate_skew(bw)
+  if abs(skew) < DESKEW_MIN_ANGLE:
+    skew = 0.0
+  angle = (rotation + skew) % 360
+  if angle:
+    image = image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor="white")
+  info = {
+    "rotation_degrees": rotation,
+    "skew_degrees": round(skew, 2),
+    "angle_applied": round(angle, 2),
+    "orientation_source": source,
+    "elapsed_ms": round((time.monotonic() - t0) * 1000.0, 1)
+  }
+  debug_log(f"orientation corrected by {info['angle_applied']} deg", stage="deskew", duration_ms=info["elapsed_ms"])
+  return image, info
+
 # === NEW: Preprocess uploaded image to ~300 DPI and min width 1024 px ===
 def set_image_dpi(file_path, min_width_px=1024, dpi=300):
   """
   Loads the image at file_path, ensures minimum width, saves to a temp PNG at 300 DPI,
   and returns the temp filename.
   """
-  im = Image.open(file_path)
-  width, height = im.size
-  factor = max(1.0, float(min_width_px) / float(width))
-  new_size = (int(width * factor), int(height * factor))
-  im_resized = im.resize(new_size, Image.LANCZOS)
-
-  tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-  tmp_name = tmp.name
-  tmp.close()
+  with Image.open(file_path) as im:
+    width, height = im.size
+    factor = max(1.0, float(min_width_px) / float(width))
+    new_size = (int(width * factor), int(height * factor))
+    im_resized = im.resize(new_size, Image.LANCZOS)
+
+  tmp_name = make_temp_png()
   im_resized.save(tmp_name, dpi=(dpi, dpi))
   return tmp_name
 
@@ -436,7 +791,24 @@ def fix_course_code(raw_code, raw_number):
   number = raw_number.strip()
   return f"{prefix}{number}"
 
-def extract_course_grade_only(lines):
+def _snap_row_course_code(tokens):
+  """
+  Fallback for grade rows whose code OCR garbled ('1T 321', 'IT32l', 'I T 321'):
+  try the first 1-3 tokens after the row number, joined, against the catalog.
+  """
+  for width in (2, 1, 3):
+    cand = "".join(tokens[1:1 + width])
+    if 4 <= len(cand) <= 10 and re.search(r"[A-Za-z]", cand) and re.search(r"[0-9OoIlSsBZ|]{3}$", cand):
+      snapped = snap_course_code(cand)
+      if snapped:
+        return snapped
+  return None
+
+def extract_course_grade_only(lines, corrections=None):
+  """
+  corrections: optional list; every course code snapped to the catalog is
+  appended as {"input", "code", "distance", "corrected"}.
+  """
   course_codes = []
   grades = []
   skipped_lines = []
@@ -454,6 +826,12 @@ def extract_course_grade_only(lines):
         course_code = tokens[i] + " " + tokens[i + 1]
         break
 
+    snapped = snap_course_code(course_code) if course_code else _snap_row_course_code(tokens)
+    if snapped and (snapped["corrected"] or not course_code):
+      course_code = snapped["code"]
+      if corrections is not None:
+        corrections.append(snapped)
+
     if not course_code:
       skipped_lines.append(f"[SKIPPED: Course code not found] {line}")
       continue
@@ -505,18 +883,31 @@ def extract_metadata(lines):
             program = program.split(w)[0].strip()
   return sr_code, sex, name, program
 
-def extract_course_data(line):
+def extract_course_data(line, corrections=None):
   line = re.sub(r"\s+", " ", line).strip()
-  if not re.search(r"\b([A-Za-z]{2,5})[- ]?(\d{3})\b", line):
-    return None
-
   match = re.search(r"\b([A-Za-z]{2,5})[- ]?(\d{3})\b", line)
   if not match:
-    return None
+    # Garbled code at the start of a COR course row ('1T 321', 'IT 32l')
+    garbled = re.match(r"([A-Za-z0-9|]{2,5})[- ]?([0-9OoIlSB|]{3})\b", line)
+    if not garbled or not re.search(r"[A-Za-z]", garbled.group(1)):
+      return None
+    snapped = snap_course_code(garbled.group(0))
+    if not snapped:
+      return None
+    if corrections is not None:
+      corrections.append(snapped)
+    return snapped["code"]
 
   prefix = match.group(1).upper()
   code = f"{prefix} {match.group(2)}"
 
+  snapped = snap_course_code(code)
+  if snapped and snapped["corrected"]:
+    if corrections is not None:
+      corrections.append(snapped)
+    code = snapped["code"]
+    prefix = code.split()[0]
+
   blacklist_prefixes = {"FEE", "SCUAA", "ANTI", "INS", "HEMF", "TOTAL", "DISCOUNT"}
   if prefix in blacklist_prefixes:
     return None
@@ -683,88 +1074,1241 @@ def compare_fields(a: dict, b: dict) -> dict:
   all_match = all(matches.values())
   return {"matches": matches, "all_match": all_match}
 
-_YEAR_ORDINAL_MAP = {
-  "1": "FIRST", "1ST": "FIRST", "FIRST": "FIRST",
-  "2": "SECOND", "2ND": "SECOND", "SECOND": "SECOND",
-  "3": "THIRD", "3RD": "THIRD", "THIRD": "THIRD",
-  "4": "FOURTH", "4TH": "FOURTH", "FOURTH": "FOURTH",
-}
-_SEM_WORD_MAP = {
-  "1ST": "FIRST", "1": "FIRST", "FIRST": "FIRST",
-  "2ND": "SECOND", "2": "SECOND", "SECOND": "SECOND",
-  "MIDYEAR": "MIDYEAR", "MID-YEAR": "MIDYEAR", "MID YEAR": "MIDYEAR",
-  "SUMMER": "SUMMER"
-}
+# --- Perceptual hash of a page (near-duplicate index: record_store.py) ---
+PHASH_SIZE = 16  # 16x16 difference hash = 256 bits
+
+def compute_dhash(image, hash_size=PHASH_SIZE) -> int:
+  """Difference hash of a small grayscale, margin-trimmed copy of the page."""
+  small = image.convert("L")
+  small.thumbnail((512, 512))
+  small = crop_to_content(small)
+  small = small.resize((hash_size + 1, hash_size), Image.BILINEAR)
+  px = list(small.getdata())
+  bits = 0
+  for row in range(hash_size):
+    offset = row * (hash_size + 1)
+    for col in range(hash_size):
+      bits = (bits << 1) | (1 if px[offset + col] > px[offset + col + 1] else 0)
+  return bits
+
+# --- Stored records: reuse opt-outs and read endpoints (store: record_store.py) ---
+def _wants_full_document() -> bool:
+  """full_document=1 (form field or query) disables stopping after the COG table ends."""
+  v = request.form.get("full_document") or request.args.get("full_document") or ""
+  return v.strip().lower() in ("1", "true", "yes")
+
+def _wants_fresh_run() -> bool:
+  """Client opt-out of any stored/reused result: form field or query ?fresh=1."""
+  val = request.form.get("fresh") or request.args.get("fresh") or ""
+  return val.strip().lower() in {"1", "true", "yes"}
+
+@app.route('/students/<sr_code>/records', methods=['GET'])
+def student_records(sr_code):
+  sr_code = _norm_sr_code(sr_code)
+  records = get_student_records(sr_code)
+  return jsonify({
+    "sr_code": sr_code,
+    "count": len(records),
+    "records": [{k: v for k, v in r.items() if k not in {"raw_text", "rows"}} for r in records]
+  })
 
-def _normalize_bs_prefix(text: str) -> str:
-  t = (text or "").strip()
-  m = re.match(r"^\s*B\.?\s*S\.?\s+(.*)$", t, flags=re.I)
-  if m:
-    return "BS " + m.group(1).strip()
-  return t
+@app.route('/students/<sr_code>/gwa', methods=['GET'])
+def student_cumulative_gwa(sr_code):
+  """Per-semester and cumulative GWA from stored, verified records (no uploads needed)."""
+  sr_code = _norm_sr_code(sr_code)
+  records = get_student_records(sr_code)
+  if not records:
+    return jsonify({"error": "No verified records for this SR code"}), 404
+  terms = {f"{r['academic_year']} {r['semester']}": r["rows"] for r in records}
+  return jsonify({"sr_code": sr_code, **compute_gwa_by_term(terms)})
+
+# === QR portal verification client ===
+# Browser pool, response cache and circuit breaker are in portal_client.py;
+# here a pooled browser loads the page and its screenshot is OCR'd.
+_portal_browsers = BrowserPool(PORTAL_POOL_SIZE, PORTAL_BROWSER_MAX_USES, launch_chrome, quit_driver)
+atexit.register(_portal_browsers.shutdown, grace_seconds=2)
+
+def fetch_portal_text(qr_url: str, use_cache=True, screenshot_path=None):
+  """
+  OCR text of the grade portal page behind a QR URL -> (raw_text, cached).
+  The screenshot is OCR'd in memory; a copy is then published to
+  screenshot_path (default results/qr_website_screenshot.png) for the app.
+  Raises PortalUnavailable while the host's circuit is open and
+  DeadlineExceeded when the page does not load within the stage budget.
+  """
+  if use_cache:
+    cached = portal_cache_get(qr_url)
+    if cached is not None:
+      return cached, True
+
+  page_url = portal_page_url(qr_url)
+  host = portal_host(page_url)
+  portal_breaker_before_call(host)
+  try:
+    checked_out = _portal_browsers.checkout(stage_budget("qr_portal"))
+    if checked_out is None:
+      raise DeadlineExceeded("qr_portal")
+  except Exception:
+    # No free slot in time or Chrome would not start: nothing the portal did
+    portal_breaker_after_call(host, ok=None)
+    raise
+  driver, uses = checked_out
+  note_portal_stat("fetches")
+  loaded = healthy = False
+  try:
+    load_portal_page(driver, page_url)
+    loaded = True
+    # In memory: concurrent fetches must never OCR each other's page
+    png = driver.get_screenshot_as_png()
+    healthy = True
 
-def split_program_track_year(program_str: str):
-  s = (program_str or "").strip()
+    with Image.open(io.BytesIO(png)) as screenshot:
+      cropped = crop_to_content(screenshot)
+      if cropped is not screenshot:
+        debug_log(f"portal screenshot cropped {screenshot.width}x{screenshot.height} -> {cropped.width}x{cropped.height}")
+      raw_text = ocr_image(scale_image(cropped, scale_factor=2), stage="qr_portal")
+      try:
+        atomic_save_image(cropped, screenshot_path or os.path.join(RESULTS_DIR, "qr_website_screenshot.png"))
+      except OSError as e:
+        warn_log(f"could not publish portal screenshot: {e}")
+  except Exception:
+    # Only a page that would not load counts against the portal; screenshot
+    # and OCR failures are ours
+    portal_breaker_after_call(host, ok=None if loaded else False)
+    raise
+  finally:
+    _portal_browsers.checkin(driver, uses, healthy)
+
+  # A page without any grade rows is an error page (5xx, maintenance) as far as we care
+  has_grades = bool(portal_grades(raw_text))
+  portal_breaker_after_call(host, ok=has_grades)
+  if has_grades:
+    portal_cache_put(qr_url, raw_text)  # only cache pages that actually carried grades
+  return raw_text, False
+
+def portal_grades(raw_text: str) -> list:
+  lines = [ln.strip() for ln in (raw_text or "").splitlines() if ln.strip()]
+  return extract_course_grade_only(lines)[3]
+
+# --- Deferred verifications (portal down/slow) ---
+_verification_worker_lock = threading.Lock()
+_verification_worker_started = False
+
+def queue_verification(qr_url, doc_sha256, raw_text, grades) -> int:
+  verification_id = add_pending_verification(qr_url, doc_sha256, raw_text, grades)
+  _ensure_verification_worker()
+  return verification_id
+
+def _retry_pending_verifications(limit=20):
+  for row in pending_verifications(limit):
+    status, record_id = "pending", None
+    try:
+      web_text, _ = fetch_portal_text(row["qr_url"])
+      grades_pdf = json.loads(row["grades_json"])
+      grades_web = portal_grades(web_text)
+      if grades_pdf and grades_web == grades_pdf:
+        status = "verified"
+        gwa = compute_gwa(parse_cog_course_rows(row["raw_text"]))
+        record_id = save_verified_record(row["doc_sha256"], parse_from_cog(row["raw_text"]), row["raw_text"], grades_pdf, grades_web, gwa, qr_url=row["qr_url"])
+      else:
+        status = "tampered"
+    except PortalUnavailable:
+      continue
+    except Exception as e:
+      warn_log(f"deferred verification {row['id']} failed: {e}")
+      if row["attempts"] + 1 >= PORTAL_RETRY_MAX_ATTEMPTS:
+        status = "failed"
+    finish_verification_attempt(row["id"], status, record_id)
+
+def _verification_worker():
+  while True:
+    time.sleep(PORTAL_RETRY_INTERVAL)
+    try:
+      _retry_pending_verifications()
+    except Exception as e:
+      warn_log(f"verification worker error: {e}")
+
+def _ensure_verification_worker():
+  global _verification_worker_started
+  with _verification_worker_lock:
+    if not _verification_worker_started:
+      threading.Thread(target=_verification_worker, name="portal-verify", daemon=True).start()
+      _verification_worker_started = True
+
+@app.route('/verifications/<int:verification_id>', methods=['GET'])
+def verification_status(verification_id):
+  verification = get_verification(verification_id)
+  if verification is None:
+    return jsonify({"error": "Unknown verification id"}), 404
+  return jsonify(verification)
+
+# === Admission control for browser/OCR-heavy endpoints ===
+# Pools, queues and limits are in admission.py; this is the HTTP side: the
+# view decorator, the 429/503 response with Retry-After and the per-request
+# cost functions.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+if not ADMIN_TOKEN:
+  warn_log("ADMIN_TOKEN is not set; /admin endpoints will answer 403")
+
+def admission_controlled(name, cost_fn=None):
+  """
+  Decorator: run the view only once `name`'s pool has room for cost_fn()
+  units (default 1; clamped to capacity so big documents still run alone).
+  A cost of 0 bypasses the pool (e.g. answers served from the record store).
+  """
+  def wrap(view):
+    @functools.wraps(view)
+    def inner(*args, **kwargs):
+      try:
+        cost = cost_fn() if cost_fn else 1
+      except Exception:
+        cost = 1
+      if cost <= 0:
+        return view(*args, **kwargs)
+      try:
+        with admission_slot(name, cost):
+          return view(*args, **kwargs)
+      except AdmissionRejected as e:
+        return admission_rejected_response(name, e)
+    return inner
+  return wrap
+
+def admission_rejected_response(name, e: AdmissionRejected):
+  debug_log(f"/{name} rejected ({e.status}): {e.reason}")
+  resp = jsonify({"error": e.reason, "retry_after": e.retry_after})
+  resp.status_code = e.status
+  resp.headers["Retry-After"] = str(e.retry_after)
+  return resp
+
+def _uploaded_pdf_bytes() -> bytes:
+  """Read the uploaded 'pdf' without consuming it for the view."""
+  f = _uploaded_file('pdf')
+  if f is None:
+    return b""
+  data = f.read()
+  f.stream.seek(0)
+  return data
+
+def _pdf_page_count(pdf_bytes: bytes) -> int:
+  try:
+    return int(pdfinfo_from_bytes(pdf_bytes, poppler_path=POPPLER_PATH).get("Pages", 1))
+  except Exception:
+    return max(1, len(re.findall(rb"/Type\s*/Page(?!s)", pdf_bytes)))
+
+def _grade_pdf_cost() -> int:
+  pdf_bytes = _uploaded_pdf_bytes()
+  if not pdf_bytes:
+    return 0  # the view answers 400 straight away
+  if not _wants_fresh_run():
+    try:
+      if find_record_by_document(hashlib.sha256(pdf_bytes).hexdigest()):
+        return 0
+    except Exception:
+      pass
+  g.pdf_page_count = _pdf_page_count(pdf_bytes)  # reused by the view's page source
+  return g.pdf_page_count
+
+def _admin_authorized() -> bool:
+  """Admin endpoints require X-Admin-Token; with no ADMIN_TOKEN configured they are closed."""
+  if not ADMIN_TOKEN:
+    return False
+  return hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+
+@app.route('/admin/portal', methods=['GET'])
+def admin_portal():
+  if not _admin_authorized():
+    return jsonify({"error": "Forbidden"}), 403
+  client = portal_client_stats()
+  return jsonify({
+    "stats": client["stats"],
+    "cache_entries": client["cache_entries"],
+    "idle_browsers": _portal_browsers.idle_count(),
+    "breakers": client["breakers"],
+    "pending_verifications": count_pending_verifications()
+  })
 
-  year_word = ""
-  m_year = re.search(r"/\s*(FIRST|SECOND|THIRD|FOURTH|1ST|2ND|3RD|4TH|[1-4])\s*$", s, flags=re.I)
-  if m_year:
-    yl_tok = m_year.group(1).upper()
-    year_word = _YEAR_ORDINAL_MAP.get(yl_tok, "")
-    left = s[:m_year.start()].rstrip()
+@app.route('/admin/admission', methods=['GET'])
+def admin_admission():
+  if not _admin_authorized():
+    return jsonify({"error": "Forbidden"}), 403
+  return jsonify(admission_stats())
+
+# === Opt-in request profiling (capture and profile index: profiling.py) ===
+# A request is profiled when:
+# - an admin sends X-Profile: cprofile|sample (always saved)
+# - it is picked by PROFILE_SAMPLE_RATE (statistical, always saved)
+# - PROFILE_SLOW_MS is set (statistical on every request, saved only when slower)
+# Unprofiled requests pay one header lookup and a random() call.
+@app.before_request
+def _maybe_start_profile():
+  mode, trigger = None, None
+  asked = request.headers.get("X-Profile", "").strip().lower()
+  if asked and _admin_authorized():
+    mode, trigger = ("cprofile" if asked == "cprofile" else "sample"), "header"
+  elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+    mode, trigger = "sample", "rate"
+  elif PROFILE_SLOW_MS:
+    mode, trigger = "sample", "slow"
+  if mode is None:
+    return
+  if mode == "cprofile":
+    g.cprofile = start_cprofile()
+    if g.cprofile is None:
+      mode = "sample"  # another request is being cProfiled
+  if mode == "sample":
+    g.profile_thread = threading.get_ident()
+    start_sampling(g.profile_thread)
+  g.profile_mode, g.profile_trigger = mode, trigger
+
+@app.after_request
+def _note_profile_status(response):
+  if getattr(g, "profile_mode", None):
+    g.profile_status = response.status_code
+  return response
+
+@app.teardown_request
+def _finish_profile(exc):
+  mode = getattr(g, "profile_mode", None)
+  if not mode:
+    return
+  elapsed_ms = (time.monotonic() - g.request_started) * 1000.0
+  stats = None
+  if mode == "cprofile":
+    stop_cprofile(g.cprofile)
+    stats = g.cprofile
   else:
-    left = s
-
-  left_upper = left.upper()
-  has_bs_prefix = bool(re.match(r"^\s*B\.?\s*S\.?\b", left_upper)) or left_upper.startswith("BS ")
-  has_bachelor = "BACHELOR" in left_upper
-
-  sep_idx = max(left.rfind('-'), left.rfind('–'))
-  if sep_idx != -1 and (has_bs_prefix or has_bachelor):
-    base_candidate = left[:sep_idx].strip()
-    track_candidate = left[sep_idx + 1:].strip().upper()
-    if has_bs_prefix:
-      base = _normalize_bs_prefix(base_candidate)
+    stats = stop_sampling(g.profile_thread)
+  if g.profile_trigger == "slow" and elapsed_ms < PROFILE_SLOW_MS:
+    return
+  try:
+    save_profile(mode, stats, {
+      "trigger": g.profile_trigger,
+      "endpoint": request.endpoint or "unknown",
+      "path": request.path,
+      "status": getattr(g, "profile_status", 500 if exc else None),
+      "elapsed_ms": round(elapsed_ms, 1),
+      "pages_rendered": getattr(g, "pages_rendered", 0),
+      "stage_timings_ms": {k: round(v * 1000.0, 1) for k, v in getattr(g, "stage_timings", {}).items()},
+      "stage_timeouts": stage_timeouts(),
+    })
+  except Exception as e:
+    warn_log(f"profile save failed: {e}")
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_profiles():
+  if not _admin_authorized():
+    return jsonify({"error": "Forbidden"}), 403
+  out = profile_index(request.args.get("endpoint"), request.args.get("limit", 50, type=int))
+  for meta in out:
+    meta["download"] = f"/admin/profiles/{meta['file']}"
+  return jsonify({"profiles": out})
+
+@app.route('/admin/profiles/<path:filename>', methods=['GET'])
+def admin_profile_download(filename):
+  if not _admin_authorized():
+    return jsonify({"error": "Forbidden"}), 403
+  return send_from_directory(PROFILES_DIR, filename, as_attachment=True)
+
+# === Submission previews ===
+# Page images are encoded off the request path: the request hands the PIL
+# image to a small executor and returns URLs immediately. Per submission
+# (keyed by document hash) we keep results/previews/<id>/full.png plus
+# mobile-sized <width>.webp|jpg files; the default width is made right away,
+# other widths on first access. /results waits for a file that is still
+# being encoded instead of returning 404.
+PREVIEW_WIDTHS = (320, 640, 1080)
+PREVIEW_DEFAULT_WIDTH = 640
+PREVIEW_QUALITY = env_int("PREVIEW_QUALITY", 80)
+PREVIEW_WAIT_SECONDS = 20
+PREVIEW_DEFAULT_FORMAT = "webp" if pil_features.check("webp") else "jpg"
+_preview_executor = concurrent.futures.ThreadPoolExecutor(
+  max_workers=env_int("PREVIEW_WORKERS", 2), thread_name_prefix="preview"
+)
+_pending_artifacts = {}  # results-relative path -> Future
+_pending_lock = threading.Lock()
+_PREVIEW_NAME_RE = re.compile(r"^previews/([0-9a-f]{8,64})/(\d+)\.(webp|jpg)$")
+
+def _preview_rel(preview_id: str, name: str) -> str:
+  return f"previews/{preview_id}/{name}"
+
+def _encode_preview(full_path: str, width: int, fmt: str) -> str:
+  out = os.path.join(os.path.dirname(full_path), f"{width}.{fmt}")
+  if os.path.exists(out):
+    return out
+  with Image.open(full_path) as im:
+    im = im.convert("RGB")
+    if im.width > width:
+      im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+    tmp = f"{out}.{uuid.uuid4().hex[:8]}.tmp"
+    if fmt == "webp":
+      im.save(tmp, "WEBP", quality=PREVIEW_QUALITY, method=4)
     else:
-      base = base_candidate
-    track = track_candidate
-  else:
-    base = _normalize_bs_prefix(left) if has_bs_prefix else left.strip()
-    track = ""
+      im.save(tmp, "JPEG", quality=PREVIEW_QUALITY, optimize=True, progressive=True)
+  os.replace(tmp, out)
+  return out
 
-  return base, track, year_word
+def _write_full_preview(image, preview_id: str, legacy_name=None):
+  folder = os.path.join(RESULTS_DIR, "previews", preview_id)
+  os.makedirs(folder, exist_ok=True)
+  full_path = os.path.join(folder, "full.png")
+  if not os.path.exists(full_path):
+    tmp = f"{full_path}.{uuid.uuid4().hex[:8]}.tmp"
+    image.save(tmp, "PNG", compress_level=3)
+    os.replace(tmp, full_path)
+  if legacy_name:
+    legacy_tmp = os.path.join(RESULTS_DIR, f"{legacy_name}.{uuid.uuid4().hex[:8]}.tmp")
+    shutil.copyfile(full_path, legacy_tmp)
+    os.replace(legacy_tmp, os.path.join(RESULTS_DIR, legacy_name))
+  _encode_preview(full_path, PREVIEW_DEFAULT_WIDTH, PREVIEW_DEFAULT_FORMAT)
+
+def _track_pending(rels, future):
+  with _pending_lock:
+    for rel in rels:
+      _pending_artifacts[rel] = future
+  def _done(_):
+    with _pending_lock:
+      for rel in rels:
+        if _pending_artifacts.get(rel) is future:
+          del _pending_artifacts[rel]
+  future.add_done_callback(_done)
+
+def wait_for_artifact(rel: str, timeout=PREVIEW_WAIT_SECONDS):
+  with _pending_lock:
+    future = _pending_artifacts.get(os.path.normpath(rel))
+  if future is not None:
+    try:
+      future.result(timeout=timeout)
+    except Exception as e:
+      warn_log(f"preview encode failed for {rel}: {e}")
 
-def to_semester_word(sem_val: str) -> str:
-  if not sem_val:
-    return ""
-  up = sem_val.upper()
-  if up in {"1ST", "FIRST", "1"}:
-    return "FIRST"
-  if up in {"2ND", "SECOND", "2"}:
-    return "SECOND"
-  return _SEM_WORD_MAP.get(up, "")
+def preview_exists(preview_id: str) -> bool:
+  return os.path.exists(os.path.join(RESULTS_DIR, "previews", preview_id, "full.png"))
+
+def queue_preview(image, preview_id: str, legacy_name=None):
+  """Encode full.png (+ optional legacy copy in RESULTS_DIR) and the default preview in the background."""
+  rels = [_preview_rel(preview_id, "full.png"),
+          _preview_rel(preview_id, f"{PREVIEW_DEFAULT_WIDTH}.{PREVIEW_DEFAULT_FORMAT}")]
+  if legacy_name:
+    rels.append(legacy_name)
+  future = _preview_executor.submit(_write_full_preview, image, preview_id, legacy_name)
+  _track_pending(rels, future)
+
+def preview_urls(preview_id: str) -> dict:
+  base = (PUBLIC_RESULTS_BASE or request.host_url).rstrip('/')
+  return {
+    "preview_id": preview_id,
+    "preview_url": f"{base}/{_preview_rel(preview_id, f'{PREVIEW_DEFAULT_WIDTH}.{PREVIEW_DEFAULT_FORMAT}')}",
+    "preview_urls": {
+      f"{w}w": f"{base}/{_preview_rel(preview_id, f'{w}.{PREVIEW_DEFAULT_FORMAT}')}" for w in PREVIEW_WIDTHS
+    },
+    "preview_full_url": f"{base}/{_preview_rel(preview_id, 'full.png')}"
+  }
+
+def _materialize_preview(filename: str):
+  """Lazily create previews/<id>/<width>.<fmt> from full.png on first access."""
+  m = _PREVIEW_NAME_RE.match(filename)
+  if not m or int(m.group(2)) not in PREVIEW_WIDTHS:
+    return
+  full_path = os.path.join(RESULTS_DIR, "previews", m.group(1), "full.png")
+  wait_for_artifact(_preview_rel(m.group(1), "full.png"))
+  if os.path.exists(full_path):
+    try:
+      _encode_preview(full_path, int(m.group(2)), m.group(3))
+    except Exception as e:
+      warn_log(f"preview {filename} failed: {e}")
+
+# === RESULTS_DIR retention janitor (sweeps and policies: janitor.py) ===
+@app.before_request
+def _ensure_janitor():
+  ensure_janitor_started()
+
+@app.route('/admin/janitor', methods=['GET', 'POST'])
+def admin_janitor():
+  """GET: retention metrics. POST: wake the janitor for an immediate sweep."""
+  if not _admin_authorized():
+    return jsonify({"error": "Forbidden"}), 403
+  if request.method == 'POST':
+    wake_janitor()
+  return jsonify(janitor_stats())
+
+# === Worker resource accounting and reaper ===
+# Long-running workers leak in three ways: Chrome/chromedriver left behind by a
+# failed driver.quit(), temp PNGs nobody unlinked, and RSS creep. Each request
+# records its RSS delta, the children it spawned (Tesseract, poppler, Chrome)
+# and the temp files it created; counters are process-wide, so with several
+# threads per worker the deltas include concurrent requests. Every browser
+# process group a worker starts is registered in BROWSER_REGISTRY_DIR, shared
+# by all workers. A reaper thread kills only registered groups whose worker is
+# gone or no longer owns them, plus this worker's own OCR children that outlived
+# every stage timeout; it never kills by name. It also removes stale temp
+# files, and a worker
+# whose RSS crosses WORKER_MAX_RSS_MB asks gunicorn to replace it (SIGTERM =
+# finish in-flight requests, then exit; the master starts a fresh worker).
+WORKER_MAX_RSS_MB = env_int("WORKER_MAX_RSS_MB", 1536)  # 0 = never recycle
+REAPER_INTERVAL = env_int("REAPER_INTERVAL", 60)
+REAPER_GRACE = env_int("REAPER_GRACE", 120)              # never touch younger processes
+REAPER_TMP_MAX_AGE = env_int("REAPER_TMP_MAX_AGE", 3600)
+RESOURCE_HISTORY = env_int("RESOURCE_HISTORY", 200)
+TMP_PREFIX = "ocrapi-"
+REAPER_TMP_PATTERNS = [f"{TMP_PREFIX}*", "tess_*"]        # ours and pytesseract's
+REAPER_OCR_NAMES = {"tesseract", "pdftoppm", "pdfinfo"}
+BROWSER_REGISTRY_DIR = os.environ.get(
+  "BROWSER_REGISTRY_DIR", os.path.join(os.path.dirname(RESULTS_DIR), ".browser_groups")
+)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_live_browser_pgids = set()  # process groups of drivers this worker still owns
+_resource_lock = threading.Lock()
+_resource_history = deque(maxlen=RESOURCE_HISTORY)
+_reaper_started = False
+_recycle_requested = False
+_resource_stats = {
+  "children_spawned": 0, "temp_files_created": 0, "requests": 0,
+  "reaper_runs": 0, "reaper_last_run": None, "reaped_processes": {}, "reaped_temp_files": 0,
+  "reaped_temp_bytes": 0, "errors": 0, "peak_rss_bytes": 0,
+}
+
+def rss_bytes() -> int:
+  try:
+    with open("/proc/self/statm", "r") as f:
+      return int(f.read().split()[1]) * _PAGE_SIZE
+  except (OSError, ValueError, IndexError):
+    return 0
+
+def note_child_spawn(count: int = 1):
+  with _resource_lock:
+    _resource_stats["children_spawned"] += count
+
+def make_temp_png() -> str:
+  """Closed, empty temp .png path the reaper recognizes; callers unlink it when done."""
+  tmp = tempfile.NamedTemporaryFile(delete=False, prefix=TMP_PREFIX, suffix=".png")
+  tmp.close()
+  with _resource_lock:
+    _resource_stats["temp_files_created"] += 1
+  if has_request_context() and hasattr(g, "temp_files"):
+    g.temp_files.append(tmp.name)
+  return tmp.name
+
+def _boot_time() -> float:
+  try:
+    with open("/proc/stat", "r") as f:
+      for line in f:
+        if line.startswith("btime"):
+          return float(line.split()[1])
+  except OSError:
+    pass
+  return 0.0
+
+_BOOT_TIME = _boot_time()
+
+def _proc_info(pid: int):
+  """{pid, ppid, pgid, uid, name, age_seconds} from /proc, or None if it is gone."""
+  try:
+    with open(f"/proc/{pid}/stat", "r") as f:
+      stat = f.read()
+    uid = os.stat(f"/proc/{pid}").st_uid
+  except (OSError, ValueError):
+    return None
+  # comm may contain spaces/parens: split around the last ')'
+  name = stat[stat.index("(") + 1:stat.rindex(")")]
+  rest = stat[stat.rindex(")") + 2:].split()
+  started = _BOOT_TIME + int(rest[19]) / _CLK_TCK
+  return {"pid": pid, "ppid": int(rest[1]), "pgid": int(rest[2]), "uid": uid,
+          "name": name, "started_at": round(started, 2), "age_seconds": round(time.time() - started, 1)}
+
+def _same_process(pid: int, started_at) -> bool:
+  """pid is alive and is still the process that started at started_at (not a reused pid)."""
+  info = _proc_info(pid)
+  return info is not None and abs(info["started_at"] - started_at) < 1.0
+
+def _all_processes() -> list:
+  procs = []
+  if not os.path.isdir("/proc"):
+    return procs
+  for entry in os.listdir("/proc"):
+    if entry.isdigit():
+      info = _proc_info(int(entry))
+      if info:
+        procs.append(info)
+  return procs
+
+def child_processes(procs=None) -> list:
+  """Every live descendant of this worker."""
+  procs = procs if procs is not None else _all_processes()
+  by_parent = {}
+  for p in procs:
+    by_parent.setdefault(p["ppid"], []).append(p)
+  out, stack = [], [os.getpid()]
+  while stack:
+    for child in by_parent.get(stack.pop(), []):
+      out.append(child)
+      stack.append(child["pid"])
+  return out
+
+def register_browser_group(pgid: int):
+  """Record a browser process group this worker started (see reap_processes)."""
+  _live_browser_pgids.add(pgid)
+  me, leader = _proc_info(os.getpid()), _proc_info(pgid)
+  entry = {"pgid": pgid, "owner_pid": os.getpid(), "owner_started_at": me and me["started_at"],
+           "leader_started_at": leader and leader["started_at"], "registered_at": time.time()}
+  try:
+    os.makedirs(BROWSER_REGISTRY_DIR, exist_ok=True)
+    atomic_write_text(os.path.join(BROWSER_REGISTRY_DIR, f"{pgid}.json"), json.dumps(entry))
+  except OSError as e:
+    warn_log(f"could not register browser group {pgid}: {e}")
+
+def unregister_browser_group(pgid: int):
+  _live_browser_pgids.discard(pgid)
+  try:
+    os.remove(os.path.join(BROWSER_REGISTRY_DIR, f"{pgid}.json"))
+  except FileNotFoundError:
+    pass
+  except OSError as e:
+    warn_log(f"could not unregister browser group {pgid}: {e}")
+
+def registered_browser_groups() -> list:
+  out = []
+  try:
+    names = os.listdir(BROWSER_REGISTRY_DIR)
+  except FileNotFoundError:
+    return out
+  for fn in names:
+    if not fn.endswith(".json"):
+      continue
+    try:
+      with open(os.path.join(BROWSER_REGISTRY_DIR, fn), "r", encoding="utf-8") as f:
+        out.append(json.load(f))
+    except (OSError, ValueError):
+      continue  # being written, or already removed
+  return out
+
+def _reap_candidates(procs) -> list:
+  """
+  (kind, target) pairs to kill. ("group", entry): a registered browser group
+  older than REAPER_GRACE whose worker has exited, or that belongs to this
+  worker but no live driver accounts for. ("process", proc): this worker's own
+  OCR child that has outlived every stage timeout.
+  """
+  now = time.time()
+  by_pgid = {}
+  for p in procs:
+    by_pgid.setdefault(p["pgid"], []).append(p)
+  out = []
+  for entry in registered_browser_groups():
+    pgid = entry["pgid"]
+    if now - entry["registered_at"] < REAPER_GRACE:
+      continue
+    leader = next((p for p in by_pgid.get(pgid, []) if p["pid"] == pgid), None)
+    if leader and entry.get("leader_started_at") and abs(leader["started_at"] - entry["leader_started_at"]) >= 1.0:
+      continue  # the id now belongs to someone else's group; dropped below
+    if entry["owner_pid"] == os.getpid():
+      stale = pgid not in _live_browser_pgids
+    else:
+      stale = not _same_process(entry["owner_pid"], entry.get("owner_started_at") or 0)
+    if stale:
+      out.append(("group", {**entry, "members": len(by_pgid.get(pgid, []))}))
+  ocr_max = max(STAGE_TIMEOUTS.values()) + REAPER_GRACE
+  for p in child_processes(procs):
+    if p["name"] in REAPER_OCR_NAMES and p["age_seconds"] > ocr_max:
+      out.append(("process", p))
+  return out
+
+def _note_reaped(name: str):
+  with _resource_lock:
+    by_name = _resource_stats["reaped_processes"]
+    by_name[name] = by_name.get(name, 0) + 1
+
+def reap_processes() -> list:
+  procs = _all_processes()
+  live_pgids = {p["pgid"] for p in procs}
+  # Drop registry entries whose group is gone or whose id was reused
+  for entry in registered_browser_groups():
+    leader = _proc_info(entry["pgid"])
+    reused = leader and entry.get("leader_started_at") and abs(leader["started_at"] - entry["leader_started_at"]) >= 1.0
+    if entry["pgid"] not in live_pgids or reused:
+      unregister_browser_group(entry["pgid"])
+  killed = []
+  for kind, target in _reap_candidates(procs):
+    try:
+      if kind == "group":
+        if target["members"]:
+          os.killpg(target["pgid"], signal.SIGKILL)
+        unregister_browser_group(target["pgid"])
+      else:
+        os.kill(target["pid"], signal.SIGKILL)
+    except ProcessLookupError:
+      if kind == "group":
+        unregister_browser_group(target["pgid"])
+      continue
+    except OSError as e:
+      _resource_stats["errors"] += 1
+      warn_log(f"reaper could not kill {kind} {target.get('pgid', target.get('pid'))}: {e}")
+      continue
+    killed.append({"kind": kind, **target})
+    _note_reaped("browser_group" if kind == "group" else target["name"])
+  if killed:
+    log_event(logging.WARNING, "reaper killed leaked processes", processes=killed)
+  return killed
+
+def _temp_files() -> list:
+  tmpdir = tempfile.gettempdir()
+  out = []
+  for fn in os.listdir(tmpdir):
+    if any(fnmatch.fnmatch(fn, pat) for pat in REAPER_TMP_PATTERNS):
+      try:
+        st = os.stat(os.path.join(tmpdir, fn))
+      except FileNotFoundError:
+        continue
+      out.append((os.path.join(tmpdir, fn), st.st_mtime, st.st_size))
+  return out
+
+def reap_temp_files(now=None) -> tuple:
+  now = now or time.time()
+  files, size = 0, 0
+  for path, mtime, nbytes in _temp_files():
+    if now - mtime < REAPER_TMP_MAX_AGE:
+      continue
+    try:
+      if os.path.isdir(path):
+        shutil.rmtree(path)
+      else:
+        os.remove(path)
+      files += 1
+      size += nbytes
+    except FileNotFoundError:
+      continue
+    except OSError as e:
+      _resource_stats["errors"] += 1
+      warn_log(f"reaper could not remove {path}: {e}")
+  with _resource_lock:
+    _resource_stats["reaped_temp_files"] += files
+    _resource_stats["reaped_temp_bytes"] += size
+  return files, size
+
+def _reaper_loop():
+  while True:
+    try:
+      reap_processes()
+      reap_temp_files()
+      _resource_stats["reaper_runs"] += 1
+      _resource_stats["reaper_last_run"] = datetime.now().isoformat(timespec="seconds")
+    except Exception as e:
+      _resource_stats["errors"] += 1
+      warn_log(f"reaper pass failed: {e}")
+    time.sleep(REAPER_INTERVAL)
+
+def _under_gunicorn() -> bool:
+  return "gunicorn" in os.environ.get("SERVER_SOFTWARE", "") or "gunicorn" in sys.modules
+
+def _maybe_recycle_worker(rss: int):
+  global _recycle_requested
+  if not WORKER_MAX_RSS_MB or _recycle_requested or rss < WORKER_MAX_RSS_MB * 1024 * 1024:
+    return
+  _recycle_requested = True
+  if not _under_gunicorn():
+    warn_log("worker RSS over limit but no process manager to replace it", rss_mb=rss // (1024 * 1024))
+    return
+  warn_log("worker RSS over limit; recycling", rss_mb=rss // (1024 * 1024), limit_mb=WORKER_MAX_RSS_MB)
+  os.kill(os.getpid(), signal.SIGTERM)
+
+@app.before_request
+def _start_resource_accounting():
+  global _reaper_started
+  if not _reaper_started and REAPER_INTERVAL > 0:
+    with _resource_lock:
+      if not _reaper_started:
+        threading.Thread(target=_reaper_loop, name="resource-reaper", daemon=True).start()
+        _reaper_started = True
+  g.resource_start = (rss_bytes(), _resource_stats["children_spawned"], _resource_stats["temp_files_created"])
+  g.temp_files = []
+
+@app.after_request
+def _finish_resource_accounting(response):
+  start = getattr(g, "resource_start", None)
+  if start is None:
+    return response
+  rss = rss_bytes()
+  usage = {
+    "rss_delta_bytes": rss - start[0],
+    "children_spawned": _resource_stats["children_spawned"] - start[1],
+    "temp_files_created": _resource_stats["temp_files_created"] - start[2],
+    "temp_files_left": sum(1 for p in g.temp_files if os.path.exists(p)),
+  }
+  g.resource_usage = usage
+  with _resource_lock:
+    _resource_stats["requests"] += 1
+    _resource_stats["peak_rss_bytes"] = max(_resource_stats["peak_rss_bytes"], rss)
+    _resource_history.append({"path": request.path, "status": response.status_code,
+                              "request_id": getattr(g, "request_id", None), "rss_bytes": rss, **usage})
+  # Recycle after this response has gone out
+  response.call_on_close(lambda: _maybe_recycle_worker(rss))
+  return response
+
+@app.route('/admin/resources', methods=['GET', 'POST'])
+def admin_resources():
+  """GET: RSS, children, temp files, reaper stats and recent per-request usage. POST: reap now."""
+  if not _admin_authorized():
+    return jsonify({"error": "Forbidden"}), 403
+  if request.method == 'POST':
+    reap_processes()
+    reap_temp_files()
+  procs = _all_processes()
+  children = child_processes(procs)
+  temps = _temp_files()
+  with _resource_lock:
+    stats = json.loads(json.dumps(_resource_stats))
+    history = list(_resource_history)
+  leaks = [h for h in history if h["temp_files_left"]]
+  return jsonify({
+    "pid": os.getpid(),
+    "rss_bytes": rss_bytes(),
+    "max_rss_mb": WORKER_MAX_RSS_MB,
+    "recycle_requested": _recycle_requested,
+    "children": [{k: p[k] for k in ("pid", "name", "pgid", "age_seconds")} for p in children],
+    "live_browser_pgids": sorted(_live_browser_pgids),
+    "registered_browser_groups": registered_browser_groups(),
+    "reap_candidates": [{"kind": kind, **target} for kind, target in _reap_candidates(procs)],
+    "temp_files": {"count": len(temps), "bytes": sum(t[2] for t in temps),
+                   "stale": sum(1 for t in temps if time.time() - t[1] >= REAPER_TMP_MAX_AGE)},
+    "stats": stats,
+    "recent_requests": history[-50:],
+    "requests_leaving_temp_files": len(leaks),
+    "rss_delta_top": sorted(history, key=lambda h: h["rss_delta_bytes"], reverse=True)[:10],
+  })
 
 # === Serve results/ files ===
 @app.route('/results/<path:filename>')
 def serve_results(filename):
-  return send_from_directory(RESULTS_DIR, filename)
+  wait_for_artifact(filename)
+  if filename.startswith("previews/") and not os.path.exists(os.path.join(RESULTS_DIR, filename)):
+    _materialize_preview(filename)
+  resp = send_from_directory(RESULTS_DIR, filename)
+  note_artifact_access(filename)
+  return resp
+
+# === COG page OCR with selective re-OCR of weak cells ===
+# The page is OCR'd once with word boxes and confidences. In every course row
+# the units and grade cells (the Units and Grade columns, i.e. the two tokens
+# right before the section code) are checked: a cell that does not parse, or
+# was read with low confidence, is cropped from the page, upscaled and re-OCR'd
+# alone with a digit/grade whitelist, and the re-read replaces it only when it
+# parses and has higher confidence. Rows whose grade is not numeric (INC, DRP,
+# no grade yet) are left alone. Only those few cells pay for a second pass,
+# never the whole page.
+REOCR_MIN_CONF = float(os.environ.get("REOCR_MIN_CONF", "75"))
+REOCR_SCALE = 3
+REOCR_CELL_CONFIG = {
+  "grade": "--psm 7 -c tessedit_char_whitelist=0123456789.INCDRPWUG",
+  "units": "--psm 7 -c tessedit_char_whitelist=0123456789",
+}
+_NUMBERISH_RE = re.compile(r"^[0-9OoIlSB.,:;·•|/]{1,5}$")
+_SECTION_RE = re.compile(r"^[A-Z]{2,}(?:-[A-Z0-9]+)+$")  # IT-BA-3101
+
+def _group_word_lines(words) -> list:
+  lines = {}
+  for w in words:
+    lines.setdefault(w["line"], []).append(w)
+  return [sorted(ws, key=lambda w: w["left"]) for _, ws in sorted(lines.items())]
+
+def _word_lines_to_text(lines) -> str:
+  out, prev_block = [], None
+  for ws in lines:
+    if prev_block is not None and ws[0]["block"] != prev_block:
+      out.append("")
+    out.append(" ".join(w["text"] for w in ws))
+    prev_block = ws[0]["block"]
+  return "\n".join(out)
+
+def _row_cells(tokens):
+  """
+  (units index or None, grade index) in a COG course row, or None for non-rows
+  and rows whose grade cell is not numeric. The columns run ... Units Grade
+  Section, so the cells are found by position from the section code.
+  """
+  if len(tokens) < 3 or not tokens[0].isdigit():
+    return None
+  start = 1
+  for i in range(1, len(tokens) - 1):
+    if re.match(r'^[A-Za-z]{2,6}$', tokens[i]) and re.match(r'^\d{3}$', tokens[i + 1]):
+      start = i + 2
+      break
+  section_i = next((i for i in range(start, len(tokens)) if _SECTION_RE.match(tokens[i])), None)
+  if section_i is None or section_i - 1 < start:
+    return None
+  grade_i = section_i - 1
+  if not _NUMBERISH_RE.match(tokens[grade_i]):
+    return None  # INC / DRP / blank: nothing to re-read
+  units_i = grade_i - 1 if grade_i - 1 >= start and _NUMBERISH_RE.match(tokens[grade_i - 1]) else None
+  return units_i, grade_i
+
+def _cell_value(kind: str, text: str):
+  if kind == "grade":
+    return _normalize_grade_token(text)
+  return text if re.fullmatch(r"\d{1,2}", text) else None
+
+def _reocr_cell(image, word, kind):
+  pad = max(4, word["height"] // 3)
+  box = (max(0, word["left"] - pad), max(0, word["top"] - pad),
+         min(image.width, word["left"] + word["width"] + pad), min(image.height, word["top"] + word["height"] + pad))
+  cell = scale_image(image.crop(box), scale_factor=REOCR_SCALE)
+  words = ocr_words(cell, config=REOCR_CELL_CONFIG[kind])
+  text = "".join(w["text"] for w in words)
+  if not words or not _cell_value(kind, text):
+    return None
+  return text, min(w["conf"] for w in words)
+
+def repair_weak_cells(image, lines) -> list:
+  """Re-OCR unparseable / low-confidence units and grade cells in place; returns the repairs made."""
+  repairs = []
+  for ws in lines:
+    cells = _row_cells([w["text"] for w in ws])
+    if not cells:
+      continue
+    for kind, idx in (("grade", cells[1]), ("units", cells[0])):
+      if idx is None:
+        continue
+      word = ws[idx]
+      if _cell_value(kind, word["text"]) and word["conf"] >= REOCR_MIN_CONF:
+        continue
+      reread = _reocr_cell(image, word, kind)
+      if not reread or reread[1] <= word["conf"]:
+        continue  # keep the page reading unless the cell re-read is surer
+      better, conf = reread
+      if better != word["text"]:
+        repairs.append({"row": ws[0]["text"], "cell": kind, "before": word["text"],
+                        "after": better, "conf": round(word["conf"], 1), "reread_conf": round(conf, 1)})
+        word["text"], word["conf"] = better, conf
+  return repairs
+
+def ocr_cog_page(image, config=""):
+  """OCR one COG page -> (text, cell repairs)."""
+  lines = _group_word_lines(ocr_words(image, config=config))
+  repairs = repair_weak_cells(image, lines)
+  if repairs:
+    debug_log(f"re-OCR'd {len(repairs)} weak cell(s)", stage="ocr")
+  return _word_lines_to_text(lines), repairs
+
+# === COG OCR cascade ===
+# A COG checks itself: "Total no of Course" / "Total no of Units" sit under
+# the course table. Pages are OCR'd with the cheap tier first (page as
+# rendered, optionally tessdata_fast); only when the parsed rows disagree with
+# those totals, or SR Code / Academic Year / Semester are missing, is the
+# slower tier (2x upscale, best model) run. A deadline hit while escalating
+# keeps the cheap result.
+TESSDATA_FAST_DIR = os.environ.get("TESSDATA_FAST_DIR", "")
+QR_SCAN_PAGES = env_int("QR_SCAN_PAGES", 2)
+OCR_TIERS = [
+  {"name": "fast", "scale": 1, "config": f"--tessdata-dir {TESSDATA_FAST_DIR}" if TESSDATA_FAST_DIR else ""},
+  {"name": "accurate", "scale": 2, "config": ""},
+]
+
+def cog_document_totals(raw_text: str):
+  """(Total no of Course, Total no of Units) printed on the COG, None when unreadable."""
+  courses = re.search(r"Total\s*no\.?\s*of\s*Course[s]?\s*:?\s*(\d+)", raw_text or "", re.I)
+  units = re.search(r"Total\s*no\.?\s*of\s*Units\s*:?\s*(\d+)", raw_text or "", re.I)
+  return (int(courses.group(1)) if courses else None), (int(units.group(1)) if units else None)
+
+def cog_consistency_problems(raw_text: str) -> list:
+  problems = []
+  fields = parse_from_cog(raw_text)
+  for key in ("sr_code", "academic_year", "semester"):
+    if not fields.get(key):
+      problems.append(f"missing {key}")
+  rows = parse_cog_course_rows(raw_text)
+  total_courses, total_units = cog_document_totals(raw_text)
+  if total_courses is None:
+    problems.append("missing Total no of Course")
+  elif len(rows) != total_courses:
+    problems.append(f"{len(rows)} rows parsed, document says {total_courses}")
+  if total_units is None:
+    problems.append("missing Total no of Units")
+  else:
+    try:
+      unit_sum = sum(int(r["units"]) for r in rows if r.get("units") is not None)
+    except (TypeError, ValueError):
+      unit_sum = None
+    if unit_sum != total_units:
+      problems.append(f"units sum {unit_sum}, document says {total_units}")
+  return problems
+
+class LazyPdfPages:
+  """
+  PDF pages rendered on first access (one poppler call per page) and kept,
+  so callers that stop early never render the pages they skip.
+  """
+
+  def __init__(self, pdf_bytes: bytes, page_count: int = None):
+    self.pdf_bytes = pdf_bytes
+    self.count = page_count or _pdf_page_count(pdf_bytes)
+    self._pages = {}
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self, i):
+    if not 0 <= i < self.count:
+      raise IndexError(i)
+    if i not in self._pages:
+      images = render_pdf(self.pdf_bytes, first_page=i + 1, last_page=i + 1)
+      if not images:
+        raise IndexError(i)
+      self._pages[i] = images[0]
+    return self._pages[i]
+
+  def __iter__(self):
+    for i in range(self.count):
+      try:
+        yield self[i]
+      except IndexError:
+        return
+
+  @property
+  def rendered(self) -> int:
+    return len(self._pages)
+
+_NOTHING_FOLLOWS_RE = re.compile(r"N[O0]THING\s*F[O0]LL[O0]WS", re.I)
+
+def cog_table_end(text: str) -> str | None:
+  """'totals' once the totals lines are read, 'marker' for NOTHING FOLLOWS alone, else None."""
+  if cog_document_totals(text)[1] is not None:
+    return "totals"
+  if _NOTHING_FOLLOWS_RE.search(text or ""):
+    return "marker"
+  return None
+
+def find_cog_qr(pages, scan_pages=QR_SCAN_PAGES):
+  """URL in the first QR code found on the first `scan_pages` pages, or None."""
+  for i in range(min(len(pages), scan_pages)):
+    try:
+      codes = decode(scale_image(pages[i], scale_factor=2).convert("RGB"))
+      if codes:
+        data = codes[0].data.decode('utf-8', errors='ignore')
+        if data.startswith('http'):
+          return data
+    except DeadlineExceeded:
+      raise
+    except Exception:
+      pass
+  return None
+
+def cog_page_grades(page_texts, corrections=None) -> list:
+  """Grades parsed page by page from COG OCR text, in document order."""
+  grades_all = []
+  for raw_txt in page_texts:
+    lines = [ln.strip() for ln in raw_txt.splitlines() if ln.strip()]
+    _, _, _, grades = extract_course_grade_only(lines, corrections)
+    grades_all.extend(grades)
+  return grades_all
+
+def ocr_cog_pages(pages, stop_at_table_end=True) -> dict:
+  """
+  Run the OCR tiers until the document's own totals check out.
+  With stop_at_table_end, pages after the totals (or one page past
+  NOTHING FOLLOWS, in case the totals spilled over) are neither rendered
+  nor OCR'd.
+  Returns {page_texts, cell_repairs, tier, checks_passed, attempts, pages_processed}.
+  """
+  result = None
+  attempts = []
+  for n, tier in enumerate(OCR_TIERS):
+    page_texts, repairs = [], []
+    t0 = time.monotonic()
+    marker_seen = False
+    try:
+      for im in pages:
+        try:
+          img = im if tier["scale"] == 1 else scale_image(im, scale_factor=tier["scale"])
+          text, page_repairs = ocr_cog_page(img, config=tier["config"])
+          page_texts.append(text)
+          repairs.extend(page_repairs)
+        except DeadlineExceeded:
+          raise
+        except Exception as e:
+          page_texts.append("")
+          warn_log(f"COG page OCR ({tier['name']}) failed: {e}")
+          continue
+        if stop_at_table_end:
+          end = cog_table_end(text)
+          if end == "totals" or marker_seen:
+            break
+          marker_seen = end == "marker"
+    except DeadlineExceeded as e:
+      if result is None:
+        raise
+      note_stage_timeout(e.stage)
+      attempts.append({"tier": tier["name"], "problems": ["deadline"], "ms": round((time.monotonic() - t0) * 1000.0)})
+      break
+    problems = cog_consistency_problems("\n".join(page_texts))
+    attempts.append({"tier": tier["name"], "problems": problems, "ms": round((time.monotonic() - t0) * 1000.0)})
+    result = {"page_texts": page_texts, "cell_repairs": repairs, "tier": tier["name"],
+              "checks_passed": not problems, "pages_processed": len(page_texts)}
+    if not problems:
+      break
+    if n + 1 < len(OCR_TIERS):
+      debug_log(f"OCR tier {tier['name']} escalating: {'; '.join(problems)}", stage="ocr")
+  result["attempts"] = attempts
+  return result
+
+# === COR zone OCR ===
+# The Certificate of Registration has two zones we care about: the header
+# block (semester/AY, SR Code, Name, Program) and the course-list table.
+# Anchors ("REGISTRATION FORM", the "COURSE CODE" table header and the
+# "Scholarship" line under the table) are found with a sparse-text pass on a
+# downscaled copy of the page. Each zone is then OCR'd on its own with the
+# page-segmentation mode that suits it, in parallel. Zone coordinates (page
+# fractions) are cached per layout version + page shape, so later documents
+# skip the anchor pass; a cached layout that stops producing an SR Code and
+# course rows is dropped and re-learned. The old top-60% full pass remains
+# the fallback.
+COR_LAYOUT_VERSION = os.environ.get("COR_LAYOUT_VERSION", "BatStateU-FO-REG-1/rev02")
+COR_LAYOUTS_PATH = os.environ.get("COR_LAYOUTS_PATH", os.path.join(os.path.dirname(RESULTS_DIR), "cor_layouts.json"))
+COR_ANCHOR_WIDTH = 1000  # px width of the anchor-search copy
+COR_ZONE_CONFIG = {
+  "header": "--psm 4",  # label/value rows across two columns: keep each row together
+  "table": "--psm 6",   # uniform block of course rows
+}
+_cor_zone_executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(COR_ZONE_CONFIG), thread_name_prefix="cor-zone")
+_cor_layouts_lock = threading.Lock()
+_cor_layouts = None  # key -> {zone: [x0, y0, x1, y1] as page fractions}
+
+def _cor_layout_key(page) -> str:
+  return f"{COR_LAYOUT_VERSION}:{page.width / page.height:.3f}"
+
+def _load_cor_layouts() -> dict:
+  global _cor_layouts
+  with _cor_layouts_lock:
+    if _cor_layouts is None:
+      _cor_layouts = {}
+      try:
+        with open(COR_LAYOUTS_PATH, "r", encoding="utf-8") as f:
+          saved = json.load(f)
+        if saved.get("version") == COR_LAYOUT_VERSION:
+          _cor_layouts = saved.get("layouts", {})
+      except (OSError, ValueError):
+        pass
+    return _cor_layouts
+
+def _store_cor_layout(key, zones):
+  layouts = _load_cor_layouts()
+  with _cor_layouts_lock:
+    if zones is None:
+      layouts.pop(key, None)
+    else:
+      layouts[key] = zones
+    try:
+      atomic_write_text(COR_LAYOUTS_PATH, json.dumps({"version": COR_LAYOUT_VERSION, "layouts": layouts}, indent=2))
+    except OSError as e:
+      warn_log(f"could not persist COR layouts: {e}")
+
+def find_cor_anchors(page):
+  """Zone fractions from anchor words on a downscaled page, or None when the anchors are missing."""
+  ratio = min(1.0, COR_ANCHOR_WIDTH / page.width)
+  small = page.convert("L")
+  if ratio < 1.0:
+    small = small.resize((COR_ANCHOR_WIDTH, max(1, round(page.height * ratio))), Image.BILINEAR)
+  words = ocr_words(small, config="--psm 11")
+  h = small.height
+
+  def top_of(pred):
+    return min((w["top"] for w in words if pred(w)), default=None)
+
+  reg_top = top_of(lambda w: w["text"].upper().startswith("REGISTRATION"))
+  course_hits = [w for w in words if w["text"].upper() == "COURSE"]
+  table_top = None
+  for w in sorted(course_hits, key=lambda w: w["top"]):
+    if any(o["text"].upper().startswith("CODE") and abs(o["top"] - w["top"]) <= w["height"]
+           for o in words):
+      table_top = w["top"]
+      break
+  if reg_top is None or table_top is None or table_top <= reg_top:
+    return None
+  line_h = max(8, sorted(w["height"] for w in words)[len(words) // 2]) if words else 12
+
+  end_top = top_of(lambda w: w["text"].upper().startswith("SCHOLARSHIP") and w["top"] > table_top)
+  table_bottom = end_top if end_top is not None else min(h, table_top + int(0.35 * h))
+  header_top = max(0, reg_top - 4 * line_h)  # semester/AY line sits just above the title
+  pad = line_h // 2
+  return {
+    "header": [0.0, round(header_top / h, 4), 1.0, round(min(h, table_top + pad) / h, 4)],
+    "table": [0.0, round(max(0, table_top - pad) / h, 4), 1.0, round(min(h, table_bottom + pad) / h, 4)],
+  }
+
+def _crop_zone(page, frac):
+  x0, y0, x1, y1 = frac
+  return page.crop((int(x0 * page.width), int(y0 * page.height), int(x1 * page.width), int(y1 * page.height)))
+
+def _ocr_cor_zones(page, zones) -> dict:
+  budget = stage_budget("ocr")
+  t0 = time.monotonic()
+  futures = {
+    name: _cor_zone_executor.submit(ocr_image, scale_image(_crop_zone(page, zones[name]), scale_factor=2),
+                                    timeout=budget, config=COR_ZONE_CONFIG[name])
+    for name in COR_ZONE_CONFIG
+  }
+  texts = {name: f.result() for name, f in futures.items()}
+  note_stage_time("ocr", time.monotonic() - t0)
+  return texts
+
+def _cor_zones_valid(texts) -> bool:
+  return bool(re.search(r"SR\s*Code\s*:?\s*\d", texts.get("header", ""), re.I)) and any(
+    extract_course_data(line) for line in texts.get("table", "").splitlines()
+  )
+
+def ocr_cor_page(page):
+  """
+  OCR a COR page via anchor zones -> (raw_text, info). info reports
+  ocr_mode (zones | full_page) and layout_source (cache | anchors).
+  """
+  key = _cor_layout_key(page)
+  zones = _load_cor_layouts().get(key)
+  attempts = [("cache", zones)] if zones else []
+  attempts.append(("anchors", None))
+  for source, zones in attempts:
+    try:
+      if zones is None:
+        zones = find_cor_anchors(page)
+        if zones is None:
+          debug_log("COR anchors not found", stage="ocr")
+          continue
+      texts = _ocr_cor_zones(page, zones)
+    except DeadlineExceeded:
+      raise
+    except Exception as e:
+      warn_log(f"COR zone OCR ({source}) failed: {e}")
+      continue
+    if _cor_zones_valid(texts):
+      if source == "anchors":
+        _store_cor_layout(key, zones)
+      return texts["header"] + "\n" + texts["table"], {"ocr_mode": "zones", "layout_source": source, "zones": zones}
+    if source == "cache":
+      debug_log("cached COR layout no longer matches; re-learning anchors", stage="ocr")
+      _store_cor_layout(key, None)
+
+  width, height = page.size
+  top_part = page.crop((0, 0, width, int(height * 0.60)))
+  return ocr_image(scale_image(top_part, scale_factor=2)), {"ocr_mode": "full_page", "layout_source": None}
 
 # === Flask Routes ===
 @app.route('/upload_registration_summary_pdf', methods=['POST'])
+@admission_controlled('upload_registration_summary_pdf')
 def upload_registration_summary_pdf():
-  if 'pdf' not in request.files:
+  if _uploaded_file('pdf') is None:
     return jsonify({"error": "No PDF uploaded"}), 400
 
-  pdf_file = request.files['pdf']
+  pdf_file = _uploaded_file('pdf')
   pdf_bytes = pdf_file.read()
+  pdf_sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+  preview_id = pdf_sha256[:16]
 
   try:
-    images = convert_from_bytes(
+    images = render_pdf(
       pdf_bytes,
       first_page=1,
-      last_page=1,
-      poppler_path=POPPLER_PATH
+      last_page=1
     )
+  except DeadlineExceeded:
+    raise
   except Exception as e:
     return jsonify({"error": f"PDF conversion failed: {str(e)}"}), 500
 
@@ -782,22 +2326,18 @@ def upload_registration_summary_pdf():
   cropped_image = original_image.crop((left, top, right, bottom))
 
   cropped_path = os.path.join(RESULTS_DIR, "COR_pdf_image.png")
-  cropped_image.save(cropped_path)
-
-  scaled = scale_image(cropped_image, scale_factor=2)
-  raw_text = pytesseract.image_to_string(scaled)
-
-  raw_ocr_path = os.path.join(RESULTS_DIR, "raw_certificate_of_enrollment.txt")
-  atomic_write_text(raw_ocr_path, raw_text)
+  queue_preview(cropped_image, preview_id, legacy_name=os.path.basename(cropped_path))
 
-  parsed_data = process_ocr_text(raw_text)
-
-  atomic_write_text(RESULT_FILE_COE, parsed_data)
+  raw_text, ocr_info = ocr_cor_page(original_image)
+  parsed_data, code_corrections = store_cor_text(
+    raw_text, pdf_sha256, "upload_registration_summary_pdf", ocr_mode=ocr_info["ocr_mode"]
+  )
 
   base = (PUBLIC_RESULTS_BASE or request.host_url).rstrip('/')
   saved_image_rel = "results/COR_pdf_image.png"
   saved_image_url = f"{base}/{saved_image_rel}"
-  cor_public_url = f"{PUBLIC_RESULTS_BASE}/{os.path.basename(cropped_path)}"
+  previews = preview_urls(preview_id)
+  cor_public_url = previews["preview_url"]  # mobile-sized; full resolution stays at saved_image_url
 
   return jsonify({
     "message": "COR top section cropped and processed.",
@@ -807,23 +2347,47 @@ def upload_registration_summary_pdf():
     "raw_ocr_text_file": "results/raw_certificate_of_enrollment.txt",
     "ocr_text_file": "results/result_certificate_of_enrollment.txt",
     "ocr_preview": parsed_data[:500],
-    "result": parsed_data
+    "code_corrections": code_corrections,
+    "result": parsed_data,
+    "ocr_mode": ocr_info["ocr_mode"],
+    "layout_source": ocr_info["layout_source"],
+    **previews
   })
 
+def store_cor_text(raw_text, doc_sha256, source, **record_extra):
+  """Everything after OCR for a COR: parse, write the result files and the ingestion record."""
+  atomic_write_text(os.path.join(RESULTS_DIR, "raw_certificate_of_enrollment.txt"), raw_text)
+
+  code_corrections = []
+  parsed_data = process_ocr_text(raw_text, code_corrections)
+
+  atomic_write_text(RESULT_FILE_COE, parsed_data)
+  write_ingestion_record(
+    "cor", fields=parse_from_coe(raw_text), result=parsed_data, raw_text=raw_text,
+    document_sha256=doc_sha256, source=source, **record_extra
+  )
+  return parsed_data, code_corrections
+
 # -------------------- OLD image-based upload (kept for compatibility) --------------------
 @app.route('/upload', methods=['POST'])
+@admission_controlled('upload')
 def upload_image():
-  if 'image' not in request.files:
+  if _uploaded_file('image') is None:
     return jsonify({"error": "No image uploaded"}), 400
 
-  image_file = request.files['image']
+  image_file = _uploaded_file('image')
   try:
-    image = Image.open(image_file.stream).convert("RGB")
+    with Image.open(image_file.stream) as im:
+      image = im.convert("RGB")
   except Exception:
     return jsonify({"error": "Unsupported image format"}), 400
 
-  image = image.resize((image.width * 3, image.height * 3))
-  qr_result = decode(image)
+  qr_result = decode(image.resize((image.width * 3, image.height * 3)))
+  if not qr_result:
+    # Skewed phone photo? Straighten the photo as uploaded (the scale the
+    # deskew is tuned for, and a fraction of the cost), then upscale and retry
+    corrected, _ = correct_orientation(image)
+    qr_result = decode(corrected.resize((corrected.width * 3, corrected.height * 3)))
 
   if not qr_result:
     return jsonify({"error": "No QR code detected"}), 400
@@ -832,35 +2396,9 @@ def upload_image():
   if not qr_data.startswith('http'):
     return jsonify({"error": "QR code does not contain a valid URL"}), 400
 
-  driver = None
   try:
-    if not CHROME_BINARY:
-      raise RuntimeError("Chrome/Chromium binary not found. Install google-chrome or chromium-browser and set GOOGLE_CHROME_BIN if needed.")
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.binary_location = CHROME_BINARY
-
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    driver.set_window_size(995, 795)
-    driver.get(qr_data)
-    time.sleep(3)
-
-    screenshot_path = os.path.join(RESULTS_DIR, "qr_website_screenshot.png")
-    driver.save_screenshot(screenshot_path)
-
-    screenshot = Image.open(screenshot_path)
-    cropped = crop_to_content(screenshot)
-    if cropped is not screenshot:
-      cropped.save(screenshot_path)
-      debug_log(f"/upload screenshot cropped {screenshot.width}x{screenshot.height} -> {cropped.width}x{cropped.height}")
-    else:
-      cropped = screenshot
-    scaled_image = scale_image(cropped, scale_factor=2)
-    raw_text = pytesseract.image_to_string(scaled_image)
-    debug_log(f"/upload webpage OCR produced {len(raw_text.splitlines())} lines")
+    raw_text, portal_cached = fetch_portal_text(qr_data, use_cache=not _wants_fresh_run())
+    debug_log(f"/upload webpage OCR produced {len(raw_text.splitlines())} lines (cached={portal_cached})")
 
     raw_txt_path = os.path.join(RESULTS_DIR, "raw_ocr_text.txt")
     atomic_write_text(raw_txt_path, raw_text)
@@ -868,14 +2406,13 @@ def upload_image():
     raw_cog_path = os.path.join(RESULTS_DIR, "raw_cog_text.txt")
     atomic_write_text(raw_cog_path, raw_text)
 
-    # --- Update Grade_with_Units.txt after new upload ---
-    grade_with_units_path = os.path.join(RESULTS_DIR, "Grade_with_Units.txt")
-    grade_with_units_str = parse_grade_with_units(raw_text)
-    atomic_write_text(grade_with_units_path, grade_with_units_str)
+    # --- Update Grade_with_Units.txt/.json after new upload ---
+    upload_gwa = write_grade_with_units(raw_text)
 
     lines = raw_text.splitlines()
     filtered_lines = [line.strip() for line in lines if line.strip() and not re.fullmatch(r"[#,\]\|\“”=()\-\_. ]+", line)]
-    grouped_result, skipped, _, grades = extract_course_grade_only(filtered_lines)
+    code_corrections = []
+    grouped_result, skipped, _, grades = extract_course_grade_only(filtered_lines, code_corrections)
 
     legacy_path = os.path.join(RESULTS_DIR, "parsed_course_grade_result.txt")
     atomic_write_text(legacy_path, grouped_result)
@@ -885,10 +2422,13 @@ def upload_image():
     grade_web_path = os.path.join(RESULTS_DIR, "grade_webpage.txt")
     atomic_write_text(grade_web_path, "Grade{\n" + "\n".join(grades) + "\n}\n")
     debug_log(f"/upload saved {len(grades)} grades to grade_webpage.txt")
+    write_ingestion_record("cog", merge=True, fields=parse_from_cog(raw_text), gwa=upload_gwa,
+                           grades_webpage=grades, qr_url=qr_data, raw_text=raw_text, source="upload")
 
     return jsonify({
       "mode": "qr + ocr + parse",
       "qr_url": qr_data,
+      "portal_cached": portal_cached,
       "saved_image": "results/qr_website_screenshot.png",
       "raw_ocr_text_file": "results/raw_ocr_text.txt",
       "ocr_text_file": "results/result_course_grade.txt",
@@ -897,21 +2437,129 @@ def upload_image():
       "grouped_result": grouped_result,
       "skipped_count": len(skipped),
       "skipped_lines": skipped[:10],
+      "code_corrections": code_corrections,
       "ocr_preview": raw_text[:500],
       "result": grouped_result
     })
 
+  except DeadlineExceeded:
+    raise
+  except PortalUnavailable as e:
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
   except Exception as e:
     return jsonify({"error": f"Failed to process: {str(e)}"}), 500
-  finally:
+
+def grade_for_review_text(raw_cog_text: str, coe_text=None) -> str:
+  """grade_for_review text for a COG, with Track taken from the COR text when given."""
+  grade_for_review_str = parse_grade_for_review(raw_cog_text)
+  m = re.search(r"-([A-Za-z]{1,10})/", coe_text or "")
+  if m:
+    track = m.group(1).upper().strip()
+    if track:
+      lines = grade_for_review_str.split("\n")
+      inserted = False
+      for i, ln in enumerate(lines):
+        if ln.strip().lower().startswith("year level"):
+          lines.insert(i + 1, f"Track : {track}")
+          inserted = True
+          break
+      if not inserted:
+        lines.append(f"Track : {track}")
+      grade_for_review_str = "\n".join(lines)
+  return grade_for_review_str
+
+def write_grade_for_review(raw_cog_text: str):
+  """Write results/grade_for_review.txt, injecting Track from the last COR when available."""
+  try:
+    # Inject Track from raw_certificate_of_enrollment.txt if available
+    coe_text = None
     try:
-      if driver:
-        driver.quit()
-    except:
+      coe_path = os.path.join(RESULTS_DIR, "raw_certificate_of_enrollment.txt")
+      if os.path.exists(coe_path):
+        with open(coe_path, "r", encoding="utf-8") as cf:
+          coe_text = cf.read()
+    except Exception:
       pass
+    atomic_write_text(os.path.join(RESULTS_DIR, "grade_for_review.txt"), grade_for_review_text(raw_cog_text, coe_text))
+  except Exception as e:
+    # Log or ignore error, but don't break upload
+    warn_log(f"grade_for_review generation failed: {e}")
+
+def _grade_pdf_payload(qr_data, grades_all, gwa, raw_pdf_text, preview_id, **extra):
+  """Response body for COG uploads; preview_id=None (text-only ingestion) leaves the image fields null."""
+  base = (PUBLIC_RESULTS_BASE or request.host_url).rstrip('/')
+  previews = preview_urls(preview_id) if preview_id else {}
+  saved_preview_rel = "results/" + _preview_rel(preview_id, f"{PREVIEW_DEFAULT_WIDTH}.{PREVIEW_DEFAULT_FORMAT}") if preview_id else None
+  saved_preview_url = previews.get("preview_url")
+  saved_preview_public_url = previews.get("preview_url")
+  qr_screenshot_rel = "results/qr_website_screenshot.png"
+  qr_screenshot_url = f"{base}/{qr_screenshot_rel}"
+  qr_screenshot_public_url = f"{PUBLIC_RESULTS_BASE}/qr_website_screenshot.png"
+
+  # Build a visible "result" string like your other endpoints
+  result_str = "Grade{\n" + "\n".join(grades_all) + "\n}\n"
+
+  return {
+    "mode": "pdf + qr + ocr",
+    "saved_preview": saved_preview_rel,
+    "saved_preview_url": saved_preview_url,
+    "saved_preview_public_url": saved_preview_public_url,
+    "qr_screenshot": qr_screenshot_rel,
+    "qr_screenshot_url": qr_screenshot_url,
+    "qr_screenshot_public_url": qr_screenshot_public_url,
+    "qr_url": qr_data,
+    "grade_count_pdf": len(grades_all),
+    "gwa": {k: v for k, v in gwa.items() if k != "rows"},
+    "ocr_preview": raw_pdf_text[:500],
+    "result": result_str,
+    **previews,
+    **extra
+  }
+
+def restore_cog_record(record: dict, pdf_bytes: bytes, preview_id: str, first_page=None, **extra) -> dict:
+  """
+  Re-materialize a stored record's result files (so /validate_grade_tamper,
+  /validate_cross_fields and /grade_with_units keep working) and build the
+  upload response without any browser or OCR work. Only page 1 is rendered,
+  for the app's preview (skipped when the caller already rendered and queued
+  it, or the submission's preview is still on disk).
+  """
+  try:
+    if first_page is None and not preview_exists(preview_id):
+      first = render_pdf(pdf_bytes, first_page=1, last_page=1)
+      if first:
+        queue_preview(first[0], preview_id)
+  except DeadlineExceeded:
+    raise
+  except Exception as e:
+    warn_log(f"stored-record preview render failed: {e}")
+
+  raw_text = record["raw_text"]
+  atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"),
+                    "Grade{\n" + "\n".join(record["webpage_grades"]) + "\n}\n")
+  atomic_write_text(os.path.join(RESULTS_DIR, "raw_cog_text.txt"), raw_text)
+  gwa = write_grade_with_units(raw_text)
+  grade_block = "Grade{\n" + "\n".join(record["grades"]) + "\n}\n"
+  atomic_write_text(os.path.join(RESULTS_DIR, "grade_pdf_ocr.txt"), grade_block)
+  atomic_write_text(os.path.join(RESULTS_DIR, "result_course_grade.txt"), grade_block)
+  write_grade_for_review(raw_text)
+  write_ingestion_record(
+    "cog", fields=parse_from_cog(raw_text), gwa=gwa, grades_pdf=record["grades"],
+    grades_webpage=record["webpage_grades"], qr_url=record["qr_url"], record_id=record["record_id"],
+    raw_text=raw_text, source="record_store"
+  )
+  return _grade_pdf_payload(
+    record["qr_url"], record["grades"], gwa, raw_text, preview_id,
+    code_corrections=[], cached=True, record_id=record["record_id"],
+    verified_at=record["verified_at"], **extra
+  )
 
 # -------------------- NEW PDF-based Step 3 --------------------
 @app.route('/upload_grade_pdf', methods=['POST'])
+@admission_controlled('upload_grade_pdf', cost_fn=_grade_pdf_cost)
 def upload_grade_pdf():
   """
   Step 3: Accept a PDF of the grades.
@@ -920,124 +2568,138 @@ def upload_grade_pdf():
   - Visit QR URL (headless) and OCR -> results/grade_webpage.txt
   - OCR the PDF pages themselves -> results/grade_pdf_ocr.txt
   - Also write raw text for cross-field checks -> results/raw_cog_text.txt
-  - Return a PNG preview (first page) for the mobile UI
+  - Queue page-1 previews (full PNG + mobile WebP/JPEG) for the mobile UI
   """
-  if 'pdf' not in request.files:
+  if _uploaded_file('pdf') is None:
     return jsonify({"error": "No PDF uploaded"}), 400
 
-  pdf_file = request.files['pdf']
+  pdf_file = _uploaded_file('pdf')
   pdf_bytes = pdf_file.read()
+  pdf_sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+  preview_id = pdf_sha256[:16]
 
+  # ---- 0) Already verified this exact document? Answer from the record store ----
+  if not _wants_fresh_run():
+    try:
+      record = find_record_by_document(pdf_sha256)
+    except Exception as e:
+      record = None
+      warn_log(f"/upload_grade_pdf record lookup failed: {e}")
+    if record:
+      debug_log(f"/upload_grade_pdf reusing verified record {record['record_id']} for {pdf_sha256[:12]}")
+      return jsonify(restore_cog_record(record, pdf_bytes, preview_id))
+
+  # Pages are rendered on demand; OCR stops once the grade table has ended
+  full_document = _wants_full_document()
+  pages = LazyPdfPages(pdf_bytes, getattr(g, "pdf_page_count", None))
   try:
-    # Render ALL pages (you can limit to first 1–2 if needed)
-    pages = convert_from_bytes(
-      pdf_bytes,
-      poppler_path=POPPLER_PATH
-    )
+    pages[0]
+  except IndexError:
+    return jsonify({"error": "No pages in PDF"}), 400
+  except DeadlineExceeded:
+    raise
   except Exception as e:
     return jsonify({"error": f"PDF conversion failed: {str(e)}"}), 500
 
-  if not pages:
-    return jsonify({"error": "No pages in PDF"}), 400
+  # Preview of page 1 for the app (encoded in the background)
+  queue_preview(pages[0], preview_id)
 
-  # Save preview of page 1 for the app
-  preview_png = os.path.join(RESULTS_DIR, "qr_website_screenshot.png")
-  pages[0].save(preview_png)
+  # ---- 1) Detect QR from PDF pages (the COG's QR is on its first page(s)) ----
+  grades_web = None
+  qr_data = find_cog_qr(pages, len(pages) if full_document else QR_SCAN_PAGES)
 
-  # ---- 1) Detect QR from PDF pages ----
-  qr_data = None
-  for im in pages:
-    try:
-      bigger = scale_image(im, scale_factor=2)
-      codes = decode(bigger.convert("RGB"))
-      if codes:
-        data = codes[0].data.decode('utf-8', errors='ignore')
-        if data.startswith('http'):
-          qr_data = data
-          break
-    except Exception:
-      pass
+  # ---- 1b) Re-export / re-scan of a document we already verified? ----
+  page_phash = None
+  try:
+    page_phash = compute_dhash(pages[0])
+    if qr_data and not _wants_fresh_run():
+      near = find_near_duplicate("cog_pdf", page_phash, qr_data)
+      record = get_record_by_id(near["record_id"]) if near and near["record_id"] else None
+      if record:
+        debug_log(f"/upload_grade_pdf near-duplicate of record {record['record_id']} (distance {near['distance']})")
+        return jsonify(restore_cog_record(record, pdf_bytes, preview_id, first_page=pages[0],
+                                          near_duplicate_distance=near["distance"]))
+  except Exception as e:
+    warn_log(f"/upload_grade_pdf phash lookup failed: {e}")
 
   # ---- 2) If QR found, load webpage & OCR for comparison ----
-  if qr_data:
-    driver = None
+  grades_web, portal_status = verify_with_portal(qr_data, "/upload_grade_pdf")
+  if portal_status != "live":
+    # No fresh portal screenshot (no QR, portal down, cached text): the app
+    # shows results/qr_website_screenshot.png as the COG image, so give it page 1
     try:
-      if not CHROME_BINARY:
-        raise RuntimeError("Chrome/Chromium binary not found. Install google-chrome or chromium-browser and set GOOGLE_CHROME_BIN if needed.")
-      debug_log(f"/upload_grade_pdf launching headless browser for {qr_data}")
-      chrome_options = Options()
-      chrome_options.add_argument("--headless=new")
-      chrome_options.add_argument("--no-sandbox")
-      chrome_options.add_argument("--disable-dev-shm-usage")
-      chrome_options.binary_location = CHROME_BINARY
-
-      service = Service(ChromeDriverManager().install())
-      driver = webdriver.Chrome(service=service, options=chrome_options)
-      driver.set_window_size(995, 795)
-      driver.get(qr_data)
-      time.sleep(3)
-
-      screenshot_path = os.path.join(RESULTS_DIR, "qr_website_screenshot.png")
-      driver.save_screenshot(screenshot_path)
-      debug_log("/upload_grade_pdf captured webpage screenshot")
-
-      screenshot = Image.open(screenshot_path)
-      cropped = crop_to_content(screenshot)
-      if cropped is not screenshot:
-        cropped.save(screenshot_path)
-        debug_log(f"/upload_grade_pdf screenshot cropped {screenshot.width}x{screenshot.height} -> {cropped.width}x{cropped.height}")
-      else:
-        cropped = screenshot
-      scaled_image = scale_image(cropped, scale_factor=2)
-      grade_web_txt = pytesseract.image_to_string(scaled_image)
-      debug_log(f"/upload_grade_pdf webpage OCR produced {len(grade_web_txt.splitlines())} lines")
-
-      # Extract grades from webpage OCR and store as block
-      lines_web = [ln.strip() for ln in grade_web_txt.splitlines() if ln.strip()]
-      grouped_result_web, skipped_web, _, grades_web = extract_course_grade_only(lines_web)
-      atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"),
-                        "Grade{\n" + "\n".join(grades_web) + "\n}\n")
-      debug_log(f"/upload_grade_pdf saved {len(grades_web)} grades to grade_webpage.txt")
-    except Exception as e:
-      # If webpage fails, just write empty -> tamper check will fail (as intended)
-      atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"), "")
-      debug_log(f"/upload_grade_pdf webpage OCR failed: {e}\n{traceback.format_exc()}")
-    finally:
-      try:
-        if driver:
-          driver.quit()
-      except:
-        pass
-  else:
-    # No QR → create empty webpage grades so tamper check fails (as intended)
-    atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"), "")
-    debug_log("/upload_grade_pdf no QR found; grade_webpage.txt cleared")
+      atomic_save_image(pages[0], os.path.join(RESULTS_DIR, "qr_website_screenshot.png"))
+    except OSError as e:
+      warn_log(f"/upload_grade_pdf could not write qr_website_screenshot.png: {e}")
 
   # ---- 3) OCR the PDF pages themselves ----
-  raw_pdf_text_parts = []
-  grades_all = []
-  for im in pages:
-    try:
-      bigger = scale_image(im, scale_factor=2)
-      raw_txt = pytesseract.image_to_string(bigger)
-      raw_pdf_text_parts.append(raw_txt)
-
-      # Parse grades per page
-      lines = [ln.strip() for ln in raw_txt.splitlines() if ln.strip()]
-      grouped_result, skipped, _, grades = extract_course_grade_only(lines)
-      grades_all.extend(grades)
-    except Exception:
-      continue
+  # Cheap OCR tier first; escalates only when the COG's own totals disagree
+  ocr_run = ocr_cog_pages(pages, stop_at_table_end=not full_document)
 
-  raw_pdf_text = "\n".join(raw_pdf_text_parts)
+  # ---- 4) Parse, write results, remember verified documents ----
+  stored = store_cog_text(
+    ocr_run["page_texts"], qr_data, grades_web, portal_status, pdf_sha256, "/upload_grade_pdf",
+    page_phash=page_phash, ocr_tier=ocr_run["tier"]
+  )
 
-  raw_cog_path = os.path.join(RESULTS_DIR, "raw_cog_text.txt")
-  atomic_write_text(raw_cog_path, raw_pdf_text)
+  return jsonify(_grade_pdf_payload(
+    qr_data, stored["grades"], stored["gwa"], stored["raw_text"], preview_id,
+    code_corrections=stored["code_corrections"], cell_repairs=ocr_run["cell_repairs"], cached=False,
+    record_id=stored["record_id"],
+    ocr_tier=ocr_run["tier"], ocr_checks_passed=ocr_run["checks_passed"], ocr_attempts=ocr_run["attempts"],
+    pages_total=len(pages), pages_processed=ocr_run["pages_processed"],
+    stage_timeouts=stage_timeouts(), portal_status=portal_status,
+    pending_verification_id=stored["pending_verification_id"]
+  ))
+
+def verify_with_portal(qr_data, log_prefix):
+  """
+  Portal side of the tamper check: (grades_web, portal_status). Writes
+  grade_webpage.txt, empty when there is no QR or the portal failed so the
+  tamper check fails (as intended). "deferred" = portal down or too slow;
+  the caller queues a retry.
+  """
+  if not qr_data:
+    atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"), "")
+    debug_log(f"{log_prefix} no QR found; grade_webpage.txt cleared")
+    return None, "no_qr"
+  try:
+    grade_web_txt, portal_cached = fetch_portal_text(qr_data, use_cache=not _wants_fresh_run())
+    portal_status = "cached" if portal_cached else "live"
+    debug_log(f"{log_prefix} webpage OCR produced {len(grade_web_txt.splitlines())} lines ({portal_status})")
+
+    # Extract grades from webpage OCR and store as block
+    grades_web = portal_grades(grade_web_txt)
+    atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"),
+                      "Grade{\n" + "\n".join(grades_web) + "\n}\n")
+    debug_log(f"{log_prefix} saved {len(grades_web)} grades to grade_webpage.txt")
+    return grades_web, portal_status
+  except (DeadlineExceeded, PortalUnavailable) as e:
+    if isinstance(e, DeadlineExceeded):
+      note_stage_timeout(e.stage)
+    atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"), "")
+    debug_log(f"{log_prefix} portal verification deferred: {e}")
+    return None, "deferred"
+  except Exception as e:
+    atomic_write_text(os.path.join(RESULTS_DIR, "grade_webpage.txt"), "")
+    warn_log(f"{log_prefix} webpage OCR failed: {e}\n{traceback.format_exc()}")
+    return None, "failed"
+
+def store_cog_text(page_texts, qr_data, grades_web, portal_status, doc_sha256, source, page_phash=None, **record_extra) -> dict:
+  """
+  Everything after OCR for a COG: parse grades, write the result files and the
+  ingestion record, store the document when PDF and portal grades agree, queue
+  a retry when the portal was deferred.
+  Returns {grades, gwa, raw_text, code_corrections, record_id, pending_verification_id}.
+  """
+  code_corrections = []
+  grades_all = cog_page_grades(page_texts, code_corrections)
+  raw_text = "\n".join(page_texts)
+
+  atomic_write_text(os.path.join(RESULTS_DIR, "raw_cog_text.txt"), raw_text)
 
-  # --- Update Grade_with_Units.txt after new upload ---
-  grade_with_units_path = os.path.join(RESULTS_DIR, "Grade_with_Units.txt")
-  grade_with_units_str = parse_grade_with_units(raw_pdf_text)
-  atomic_write_text(grade_with_units_path, grade_with_units_str)
+  # --- Update Grade_with_Units.txt/.json after new upload ---
+  gwa = write_grade_with_units(raw_text)
 
   # Save parsed grade block from PDF OCR
   atomic_write_text(os.path.join(RESULTS_DIR, "grade_pdf_ocr.txt"),
@@ -1048,61 +2710,427 @@ def upload_grade_pdf():
                     "Grade{\n" + "\n".join(grades_all) + "\n}\n")
 
   # --- NEW: After writing raw_cog_text.txt, also write grade_for_review.txt ---
+  write_grade_for_review(raw_text)
+
+  write_ingestion_record(
+    "cog", fields=parse_from_cog(raw_text), gwa=gwa, grades_pdf=grades_all,
+    grades_webpage=grades_web if grades_web is not None else [], qr_url=qr_data, raw_text=raw_text,
+    document_sha256=doc_sha256, source=source.lstrip("/"), **record_extra
+  )
+
+  # Remember verified documents (PDF grades == QR webpage grades)
+  record_id = None
+  if qr_data and grades_all and grades_web == grades_all:
+    try:
+      record_id = save_verified_record(doc_sha256, parse_from_cog(raw_text), raw_text, grades_all, grades_web, gwa, qr_url=qr_data)
+      if record_id and page_phash is not None:
+        remember_phash("cog_pdf", page_phash, qr_data, record_id=record_id)
+    except Exception as e:
+      warn_log(f"{source} record store failed: {e}")
+
+  pending_verification_id = None
+  if portal_status == "deferred" and grades_all:
+    try:
+      pending_verification_id = queue_verification(qr_data, doc_sha256, raw_text, grades_all)
+    except Exception as e:
+      warn_log(f"{source} could not queue verification: {e}")
+
+  return {"grades": grades_all, "gwa": gwa, "raw_text": raw_text, "code_corrections": code_corrections,
+          "record_id": record_id, "pending_verification_id": pending_verification_id}
+
+# === Text-only ingestion (on-device OCR) ===
+# Clients that run text recognition on the phone POST the recognized text
+# instead of an image; only parsing, normalization and the tamper/cross-field
+# stages run here, and they write the same result files and ingestion records
+# as the image endpoints. Body (JSON):
+#   {"kind": "cog"|"cor", "text": "...", "pages": ["...", ...],
+#    "words": [{"text", "left", "top", "width", "height", "page"?}, ...],
+#    "qr_url": "https://..."}
+# One of text/pages/words is required; words are only used when no text is
+# given and are regrouped into lines by their boxes.
+TEXT_INGEST_MAX_CHARS = env_int("TEXT_INGEST_MAX_CHARS", 200000)
+
+def words_to_text(words) -> str:
+  """Reading-order text from word boxes: words whose vertical centres overlap form a line."""
+  words = [w for w in words if str(w.get("text", "")).strip()]
+  words.sort(key=lambda w: (float(w["top"]) + float(w["height"]) / 2.0, float(w["left"])))
+  lines, current, center, height = [], [], None, None
+  for w in words:
+    c = float(w["top"]) + float(w["height"]) / 2.0
+    if current and abs(c - center) > max(height, float(w["height"])) / 2.0:
+      lines.append(current)
+      current = []
+    if not current:
+      center, height = c, float(w["height"])
+    current.append(w)
+  if current:
+    lines.append(current)
+  return "\n".join(" ".join(str(w["text"]).strip() for w in sorted(ln, key=lambda w: float(w["left"])))
+                   for ln in lines)
+
+def _ingest_pages(body) -> list:
+  """Page texts from `pages`, `text` or `words`; ValueError when one has the wrong shape."""
+  pages = body.get("pages")
+  if pages:
+    if not isinstance(pages, list) or not all(isinstance(p, str) for p in pages):
+      raise ValueError("pages must be a list of strings")
+    return pages
+  text = body.get("text")
+  if text:
+    if not isinstance(text, str):
+      raise ValueError("text must be a string")
+    return [text]
+  words = body.get("words") or []
+  if not isinstance(words, list) or not all(isinstance(w, dict) for w in words):
+    raise ValueError("words must be a list of objects")
+  by_page = {}
+  for w in words:
+    by_page.setdefault(int(w.get("page", 1)), []).append(w)
+  return [words_to_text(ws) for _, ws in sorted(by_page.items())]
+
+@app.route('/ingest_text', methods=['POST'])
+def ingest_text():
+  body = request.get_json(silent=True)
+  if not isinstance(body, dict):
+    return jsonify({"error": "Expected a JSON body"}), 400
+  kind = str(body.get("kind", "")).strip().lower()
+  if kind not in ("cog", "cor"):
+    return jsonify({"error": "kind must be 'cog' or 'cor'"}), 400
   try:
-    with open(raw_cog_path, "r", encoding="utf-8") as f:
-      raw_cog_text = f.read()
-    grade_for_review_str = parse_grade_for_review(raw_cog_text)
-    # Inject Track from raw_certificate_of_enrollment.txt if available
+    pages = _ingest_pages(body)
+  except KeyError as e:
+    return jsonify({"error": f"Invalid input: word without {e}"}), 400
+  except (TypeError, ValueError) as e:
+    return jsonify({"error": f"Invalid input: {e}"}), 400
+  if not any(p.strip() for p in pages):
+    return jsonify({"error": "Provide text, pages or words"}), 400
+  if sum(len(p) for p in pages) > TEXT_INGEST_MAX_CHARS:
+    return jsonify({"error": f"Text longer than {TEXT_INGEST_MAX_CHARS} characters"}), 413
+
+  doc_sha256 = hashlib.sha256("\f".join(pages).encode("utf-8")).hexdigest()
+  if kind == "cor":
+    t0 = time.monotonic()
+    raw_text = "\n".join(pages)
+    parsed_data, code_corrections = store_cor_text(raw_text, doc_sha256, "ingest_text", ocr_mode="client")
+    return jsonify({
+      "message": "COR text processed.",
+      "raw_ocr_text_file": "results/raw_certificate_of_enrollment.txt",
+      "ocr_text_file": "results/result_certificate_of_enrollment.txt",
+      "ocr_preview": parsed_data[:500],
+      "code_corrections": code_corrections,
+      "result": parsed_data,
+      "ocr_mode": "client",
+      "parse_ms": round((time.monotonic() - t0) * 1000.0, 1),
+    })
+
+  qr_data = str(body.get("qr_url") or "").strip() or None
+  if qr_data and not qr_data.startswith("http"):
+    return jsonify({"error": "qr_url must be an http(s) URL"}), 400
+  grades_web, portal_status = verify_with_portal(qr_data, "/ingest_text")
+  t0 = time.monotonic()  # parse_ms leaves out the portal round trip
+  stored = store_cog_text(pages, qr_data, grades_web, portal_status, doc_sha256, "/ingest_text", ocr_tier="client")
+  return jsonify(_grade_pdf_payload(
+    qr_data, stored["grades"], stored["gwa"], stored["raw_text"], None,
+    mode="text + qr" if qr_data else "text", code_corrections=stored["code_corrections"], cached=False,
+    record_id=stored["record_id"], ocr_tier="client", pages_total=len(pages),
+    stage_timeouts=stage_timeouts(), portal_status=portal_status,
+    pending_verification_id=stored["pending_verification_id"],
+    parse_ms=round((time.monotonic() - t0) * 1000.0, 1),
+  ))
+
+# === Document type classification (anchor scoring: classification.py) ===
+# /upload_document takes any COR/COG upload (PDF or photo) and routes it to the
+# right pipeline. The decision uses only cheap signals: the first page's PDF
+# text layer when there is one, otherwise one OCR pass over the top of a
+# low-resolution thumbnail, plus whether the page carries a QR code (COGs do).
+# When the scores are too close the client is asked to say which document it
+# is (kind=cor|cog skips classification).
+CLASSIFY_THUMB_DPI = env_int("CLASSIFY_THUMB_DPI", 100)
+CLASSIFY_THUMB_WIDTH = env_int("CLASSIFY_THUMB_WIDTH", 1000)  # photos are downscaled to this
+CLASSIFY_TOP_FRACTION = 0.5   # header anchors live in the top half
+
+def _pdf_text_layer(pdf_bytes: bytes, timeout=5) -> str:
+  """First-page text layer via pdftotext ("" for scans or on any failure)."""
+  cmd = [os.path.join(POPPLER_PATH, "pdftotext") if POPPLER_PATH else "pdftotext",
+         "-f", "1", "-l", "1", "-q", "-", "-"]
+  note_child_spawn()
+  try:
+    out = subprocess.run(cmd, input=pdf_bytes, capture_output=True, timeout=timeout)
+    return out.stdout.decode("utf-8", errors="ignore")
+  except (OSError, subprocess.SubprocessError):
+    return ""
+
+def _classification_thumbnail(data: bytes, is_pdf: bool):
+  if is_pdf:
+    return render_pdf(data, first_page=1, last_page=1, dpi=CLASSIFY_THUMB_DPI, grayscale=True)[0]
+  with Image.open(io.BytesIO(data)) as im:
+    im.draft("L", (CLASSIFY_THUMB_WIDTH, CLASSIFY_THUMB_WIDTH * 2))  # JPEG: decode at reduced scale
+    thumb = im.convert("L")
+  if thumb.width > CLASSIFY_THUMB_WIDTH:
+    thumb = thumb.resize((CLASSIFY_THUMB_WIDTH, round(thumb.height * CLASSIFY_THUMB_WIDTH / thumb.width)), Image.BILINEAR)
+  return thumb
+
+def classify_document(data: bytes, is_pdf: bool) -> dict:
+  """{kind: "cor"|"cog"|None, scores, anchors, qr, source, ms}"""
+  t0 = time.monotonic()
+  text = _pdf_text_layer(data) if is_pdf else ""
+  source = "text_layer"
+  qr = None
+  kind = None
+  if len(text.strip()) >= CLASSIFY_MIN_TEXT:
+    kind, scores, hits = classify_text(text)
+  if kind is None:
+    thumb = _classification_thumbnail(data, is_pdf)
     try:
-      coe_path = os.path.join(RESULTS_DIR, "raw_certificate_of_enrollment.txt")
-      if os.path.exists(coe_path):
-        with open(coe_path, "r", encoding="utf-8") as cf:
-          coe_text = cf.read()
-        m = re.search(r"-([A-Za-z]{1,10})/", coe_text)
-        if m:
-          track = m.group(1).upper().strip()
-          if track:
-            lines = grade_for_review_str.split("\n")
-            inserted = False
-            for i, ln in enumerate(lines):
-              if ln.strip().lower().startswith("year level"):
-                lines.insert(i + 1, f"Track : {track}")
-                inserted = True
-                break
-            if not inserted:
-              lines.append(f"Track : {track}")
-            grade_for_review_str = "\n".join(lines)
+      qr = bool(decode(thumb))
     except Exception:
-      pass
-    atomic_write_text(os.path.join(RESULTS_DIR, "grade_for_review.txt"), grade_for_review_str)
-  except Exception as e:
-    # Log or ignore error, but don't break upload
-    print(f"[grade_for_review] Failed to generate: {e}")
-
-  base = (PUBLIC_RESULTS_BASE or request.host_url).rstrip('/')
-  saved_preview_rel = f"results/{os.path.basename(preview_png)}"
-  saved_preview_url = f"{base}/{saved_preview_rel}"
-  saved_preview_public_url = f"{PUBLIC_RESULTS_BASE}/{os.path.basename(preview_png)}"
-  qr_screenshot_rel = "results/qr_website_screenshot.png"
-  qr_screenshot_url = f"{base}/{qr_screenshot_rel}"
-  qr_screenshot_public_url = f"{PUBLIC_RESULTS_BASE}/qr_website_screenshot.png"
+      qr = False
+    if len(text.strip()) < CLASSIFY_MIN_TEXT:
+      source = "thumbnail_ocr"
+      top = thumb.crop((0, 0, thumb.width, int(thumb.height * CLASSIFY_TOP_FRACTION)))
+      text = ocr_image(top, stage="classify")
+    kind, scores, hits = classify_text(text, qr=qr)
+  return {"kind": kind, "scores": scores, "anchors": hits, "qr": qr, "source": source,
+          "ms": round((time.monotonic() - t0) * 1000.0, 1)}
+
+def _uploaded_file(field: str):
+  """
+  The upload a view should process: the one handed to it by /upload_document
+  or /submit_documents, else `field`, else the generic "file" field.
+  """
+  return getattr(g, "routed_upload", None) or request.files.get(field) or request.files.get("file")
 
-  # Build a visible "result" string like your other endpoints
-  result_str = "Grade{\n" + "\n".join(grades_all) + "\n}\n"
+@app.route('/upload_document', methods=['POST'])
+def upload_document():
+  """
+  One upload endpoint for CORs and COGs (PDF or image). Classifies the first
+  page, then runs the matching pipeline; its JSON response gains a
+  "document_type" block and an X-Document-Type header.
+  """
+  upload = request.files.get("file") or request.files.get("pdf") or request.files.get("image")
+  if upload is None:
+    return jsonify({"error": "No file uploaded"}), 400
+  data = upload.read()
+  upload.stream.seek(0)
+  if not data:
+    return jsonify({"error": "Empty upload"}), 400
+  is_pdf = data[:1024].lstrip().startswith(b"%PDF")
+
+  asked = (request.form.get("kind") or request.args.get("kind") or "").strip().lower()
+  if asked in DOC_ANCHORS:
+    info = {"kind": asked, "source": "client"}
+  else:
+    try:
+      with admission_slot("classify"):
+        info = classify_document(data, is_pdf)
+    except AdmissionRejected as e:
+      return admission_rejected_response("classify", e)
+    except DeadlineExceeded:
+      raise
+    except Exception as e:
+      return jsonify({"error": f"Could not read upload: {e}"}), 400
+  debug_log("/upload_document classified", **info)
 
-  return jsonify({
-    "mode": "pdf + qr + ocr",
-    "saved_preview": saved_preview_rel,
-    "saved_preview_url": saved_preview_url,
-    "saved_preview_public_url": saved_preview_public_url,
-    "qr_screenshot": qr_screenshot_rel,
-    "qr_screenshot_url": qr_screenshot_url,
-    "qr_screenshot_public_url": qr_screenshot_public_url,
-    "qr_url": qr_data,
-    "grade_count_pdf": len(grades_all),
-    "ocr_preview": raw_pdf_text[:500],
-    "result": result_str
+  kind = info["kind"]
+  if kind is None:
+    return jsonify({
+      "error": "Could not tell whether this is a COR or a COG; retry with kind=cor or kind=cog",
+      "document_type": info,
+    }), 422
+  if is_pdf:
+    route, view = ("/upload_grade_pdf", upload_grade_pdf) if kind == "cog" else \
+                  ("/upload_registration_summary_pdf", upload_registration_summary_pdf)
+  elif kind == "cog":
+    # Photo with the portal QR -> portal-verified grades; otherwise OCR the photo
+    if info.get("qr") is None:
+      try:
+        with admission_slot("classify"):
+          info["qr"] = bool(decode(_classification_thumbnail(data, is_pdf)))
+      except AdmissionRejected as e:
+        return admission_rejected_response("classify", e)
+      except Exception:
+        info["qr"] = False
+    route, view = ("/upload", upload_image) if info["qr"] else ("/upload_grade_image", upload_grade_image)
+  else:
+    return jsonify({"error": "Certificates of Registration must be uploaded as PDF", "document_type": info}), 415
+
+  info["routed_to"] = route
+  # The view gets the upload classified here, whichever field it came in
+  g.routed_upload = upload
+  routed = app.make_response(view())
+  routed.headers["X-Document-Type"] = kind
+  body = routed.get_json(silent=True) if routed.is_json else None
+  if isinstance(body, dict):
+    body["document_type"] = info
+    routed.set_data(json.dumps(body))
+  return routed
+
+# === Combined COR + COG submission ===
+# A Dean's List application needs both documents plus every derived view
+# (grade-for-review text, weighted-grade table, tamper and cross-field
+# verdicts). /submit_documents takes both uploads in one request, runs the COR
+# and COG pipelines concurrently (each through its own view, so admission
+# control, the record store and previews behave exactly as for separate
+# uploads) and answers with everything the app used to fetch one call at a time.
+# Pipeline threads share the request's deadline and stage timings; each keeps
+# its own g, so the ingestion records it wrote come back with its response.
+SUBMISSION_SHARED_G = ("deadline", "request_started", "stage_timeouts", "stage_timings",
+                       "request_id", "log_verbose", "temp_files")
+_submission_executor = concurrent.futures.ThreadPoolExecutor(
+  max_workers=env_int("SUBMISSION_THREADS", 8), thread_name_prefix="submission"
+)
+
+def _submit_view(view, upload):
+  """Run `view` on a pipeline thread with `upload` as its file; future -> (status, body, records written)."""
+  shared = {k: getattr(g, k) for k in SUBMISSION_SHARED_G if hasattr(g, k)}
+
+  @copy_current_request_context
+  def run():
+    for k, v in shared.items():
+      setattr(g, k, v)
+    g.pages_rendered = 0
+    g.routed_upload = upload
+    resp = app.make_response(view())
+    body = resp.get_json(silent=True) if resp.is_json else resp.get_data(as_text=True)
+    return resp.status_code, body, getattr(g, "ingested_records", {})
+
+  return _submission_executor.submit(run)
+
+@app.route('/submit_documents', methods=['POST'])
+def submit_documents():
+  """
+  Multipart with "cor" and "cog" PDFs. Returns both upload responses plus
+  grade_for_review, grade_with_units, tamper and cross_fields in one body.
+  """
+  cor_file, cog_file = request.files.get("cor"), request.files.get("cog")
+  if cor_file is None or cog_file is None:
+    return jsonify({"error": "Upload both 'cor' and 'cog' PDFs"}), 400
+
+  t0 = time.monotonic()
+  cor_future = _submit_view(upload_registration_summary_pdf, cor_file)
+  cog_future = _submit_view(upload_grade_pdf, cog_file)
+  cor_status, cor_body, cor_written = cor_future.result()
+  cog_status, cog_body, cog_written = cog_future.result()
+
+  out = {
+    "cor": cor_body, "cog": cog_body,
+    "statuses": {"cor": cor_status, "cog": cog_status},
+  }
+  failed = [s for s in (cor_status, cog_status) if s >= 400]
+  if failed:
+    out["error"] = "One or both documents could not be processed"
+    return jsonify(out), max(failed)
+
+  # Derived views come only from the records these two pipelines wrote, never
+  # from the shared results/ files another submission may have replaced since
+  cor_record, cog_record = cor_written.get("cor"), cog_written.get("cog")
+  if not cor_record or not cog_record:
+    out["error"] = "Document processed but no record was produced"
+    return jsonify(out), 500
+  out.update({
+    "grade_for_review": grade_for_review_text(cog_record["raw_text"], cor_record["raw_text"]),
+    "grade_with_units": {
+      "table": derived_view("grade_with_units", lambda r: render_grade_with_units_table(r["gwa"]), cog_record),
+      "gwa": cog_record["gwa"],
+    },
+    "tamper": grade_tamper_verdict(cog_record),
+    "cross_fields": cross_field_verdict(cor_record, cog_record),
+    "elapsed_ms": round((time.monotonic() - t0) * 1000.0, 1),
   })
+  return jsonify(out)
+
+# === Ingestion records ===
+# Every upload writes one structured record per document kind
+# (results/cor_meta.json, results/cog_meta.json) at ingestion time. The
+# validation and derived-view endpoints read that record instead of
+# re-parsing raw text files: records are cached in memory by file mtime
+# (one stat per read, so other workers' writes are picked up) and derived
+# views are cached by the versions of the records they were built from.
+INGESTION_SCHEMA = 1
+INGESTION_PATHS = {
+  "cor": os.path.join(RESULTS_DIR, "cor_meta.json"),
+  "cog": os.path.join(RESULTS_DIR, "cog_meta.json"),
+}
+_ingestion_lock = threading.Lock()
+_ingestion_cache = {}  # kind -> (mtime_ns, record)
+_derived_views = {}    # (view, versions...) -> value
+_DERIVED_VIEWS_MAX = 64
+
+def write_ingestion_record(kind: str, merge=False, **data) -> dict:
+  """Write the canonical record for `kind`; merge=True keeps fields not given here."""
+  with _ingestion_lock:
+    record = dict(get_ingestion_record(kind, migrate=False) or {}) if merge else {}
+    record.update(data)
+    record.update({
+      "schema": INGESTION_SCHEMA,
+      "kind": kind,
+      "version": f"{time.time_ns():x}",
+      "ingested_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    path = INGESTION_PATHS[kind]
+    atomic_write_text(path, json.dumps(record, indent=2))
+    _ingestion_cache[kind] = (os.stat(path).st_mtime_ns, record)
+  if has_request_context():
+    # The records this request wrote (/submit_documents builds its verdicts from these)
+    if not hasattr(g, "ingested_records"):
+      g.ingested_records = {}
+    g.ingested_records[kind] = record
+  return record
+
+def get_ingestion_record(kind: str, migrate=True):
+  path = INGESTION_PATHS[kind]
+  try:
+    mtime = os.stat(path).st_mtime_ns
+  except FileNotFoundError:
+    return _migrate_ingestion_record(kind) if migrate else None
+  cached = _ingestion_cache.get(kind)
+  if cached and cached[0] == mtime:
+    return cached[1]
+  try:
+    with open(path, "r", encoding="utf-8") as f:
+      record = json.load(f)
+  except (OSError, ValueError):
+    record = None
+  if not record or record.get("schema") != INGESTION_SCHEMA:
+    # Pre-ingestion-record file (old hand-written meta); rebuild once from the raw results
+    return _migrate_ingestion_record(kind) if migrate else None
+  _ingestion_cache[kind] = (mtime, record)
+  return record
+
+def _read_result_text(name: str):
+  path = os.path.join(RESULTS_DIR, name)
+  if not os.path.exists(path):
+    return None
+  with open(path, "r", encoding="utf-8") as f:
+    return f.read()
+
+def _migrate_ingestion_record(kind: str):
+  """Build a record from result files written before ingestion records existed."""
+  if kind == "cor":
+    raw = _read_result_text("raw_certificate_of_enrollment.txt")
+    if raw is None:
+      return None
+    return write_ingestion_record("cor", fields=parse_from_coe(raw), raw_text=raw, source="migrated")
+  raw = _read_result_text("raw_cog_text.txt")
+  if raw is None:
+    return None
+  grades_pdf = _read_grade_block_or_tokens(os.path.join(RESULTS_DIR, "grade_pdf_ocr.txt"))
+  grades_web = _read_grade_block_or_tokens(os.path.join(RESULTS_DIR, "grade_webpage.txt"))
+  return write_ingestion_record(
+    "cog", fields=parse_from_cog(raw), gwa=compute_gwa(parse_cog_course_rows(raw)),
+    grades_pdf=grades_pdf, grades_webpage=grades_web, raw_text=raw, source="migrated"
+  )
+
+def derived_view(view: str, builder, *records):
+  """Cache `builder(*records)` until any of the records gets a new version."""
+  key = (view,) + tuple(r.get("version") for r in records)
+  value = _derived_views.get(key)
+  if value is None:
+    value = builder(*records)
+    if len(_derived_views) >= _DERIVED_VIEWS_MAX:
+      _derived_views.clear()
+    _derived_views[key] = value
+  return value
 
 def _read_grade_block_or_tokens(path):
   if not os.path.exists(path):
@@ -1132,31 +3160,72 @@ def upload_grade_image():
   Legacy: image upload – OCR with 300-DPI preprocess.
   Always overwrites results/grade_image.txt on every upload.
   """
-  if 'image' not in request.files:
+  if _uploaded_file('image') is None:
     return jsonify({"error": "No image uploaded"}), 400
-  image_file = request.files['image']
+  image_file = _uploaded_file('image')
 
   tmp_in = None
   tmp_proc = None
   try:
     # Save upload to a temp file
-    tmp_in_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-    tmp_in = tmp_in_file.name
-    tmp_in_file.close()
-    Image.open(image_file.stream).convert("RGB").save(tmp_in)
+    tmp_in = make_temp_png()
+    with Image.open(image_file.stream) as im:
+      upload_img = im.convert("RGB")
+
+    # QR first (zbar reads it at any rotation); its orientation drives the upright fix
+    img_qr = None
+    qr_orientation = None
+    try:
+      codes = decode(upload_img)
+      if codes:
+        img_qr = codes[0].data.decode('utf-8', errors='ignore')
+        qr_orientation = getattr(codes[0], "orientation", None)
+    except Exception as e:
+      warn_log(f"/upload_grade_image QR decode failed: {e}")
+    upload_img, orientation = correct_orientation(upload_img, qr_orientation)
+    upload_img.save(tmp_in)
+
+    # Near-duplicate of an image we already OCR'd? (same QR payload + close page hash)
+    img_phash = None
+    try:
+      img_phash = compute_dhash(upload_img)
+      near = None if _wants_fresh_run() else find_near_duplicate("grade_image", img_phash, img_qr)
+    except Exception as e:
+      near = None
+      warn_log(f"/upload_grade_image phash lookup failed: {e}")
+    if near and near["payload"]:
+      payload = near["payload"]
+      grade_block = "Grade{\n" + "\n".join(payload["grades"]) + "\n}\n"
+      out_path = os.path.join(RESULTS_DIR, "grade_image.txt")
+      atomic_write_text(out_path, grade_block)
+      base = (PUBLIC_RESULTS_BASE or request.host_url).rstrip('/')
+      return jsonify({
+        "message": "Grade image OCR complete",
+        "strategy": payload["strategy"],
+        "grade_image_file": "results/grade_image.txt",
+        "grade_image_url": f"{base}/results/grade_image.txt?t={int(time.time())}",
+        "grade_count": len(payload["grades"]),
+        "preview": grade_block[:300],
+        "cached": True,
+        "near_duplicate_distance": near["distance"],
+        "orientation": orientation,
+      })
 
     # Preprocess: ~300 DPI & min width
     tmp_proc = set_image_dpi(tmp_in)
 
-    # OCR pass 1: original
-    img_orig = Image.open(tmp_proc).convert("RGB")
-    raw_orig = pytesseract.image_to_string(img_orig)
+    # OCR pass 1: original (upright after correct_orientation)
+    with Image.open(tmp_proc) as im:
+      img_orig = im.convert("RGB")
+    raw_orig = ocr_image(img_orig)
     grades_orig = _extract_grades_from_text(raw_orig)
 
-    # OCR pass 2: inverted (helps when text is light on dark)
-    img_inverted = ImageOps.invert(img_orig)
-    raw_inverted = pytesseract.image_to_string(img_inverted)
-    grades_inverted = _extract_grades_from_text(raw_inverted)
+    # OCR pass 2: inverted (light text on dark); only when pass 1 found nothing
+    grades_inverted = []
+    if not grades_orig:
+      img_inverted = ImageOps.invert(img_orig)
+      raw_inverted = ocr_image(img_inverted)
+      grades_inverted = _extract_grades_from_text(raw_inverted)
 
     # Pick whichever yields more grades; still overwrite the same file
     if len(grades_inverted) > len(grades_orig):
@@ -1172,7 +3241,13 @@ def upload_grade_image():
     atomic_write_text(out_path, grade_block)  # unconditional replace
     os.utime(out_path, None)  # optional: bump mtime for watchers
 
-    app.logger.info(f"[{datetime.now()}] WROTE {out_path} via {chosen} (grades={len(grades)})")
+    log_event(logging.INFO, f"wrote {out_path}", strategy=chosen, grades=len(grades))
+
+    if img_phash is not None and img_qr:
+      try:
+        remember_phash("grade_image", img_phash, img_qr, payload={"grades": grades, "strategy": chosen})
+      except Exception as e:
+        warn_log(f"/upload_grade_image phash store failed: {e}")
 
     # cache-busted URL so clients fetch fresh
     base = (PUBLIC_RESULTS_BASE or request.host_url).rstrip('/')
@@ -1185,7 +3260,11 @@ def upload_grade_image():
       "grade_image_url": grade_image_url,
       "grade_count": len(grades),
       "preview": grade_block[:300],
+      "cached": False,
+      "orientation": orientation,
     })
+  except DeadlineExceeded:
+    raise
   except Exception as e:
     return jsonify({"error": f"Failed to process grade image: {str(e)}"}), 500
   finally:
@@ -1208,24 +3287,26 @@ def validate_grade_tamper():
   or grades mismatch. Returns detailed JSON only when grades exactly match.
   Now compares PDF OCR vs QR-webpage OCR.
   """
-  pdf_path = os.path.join(RESULTS_DIR, "grade_pdf_ocr.txt")
-  web_path = os.path.join(RESULTS_DIR, "grade_webpage.txt")
-
-  def tampered_response():
+  verdict = grade_tamper_verdict(get_ingestion_record("cog"))
+  if verdict["tampered"]:
     return Response("Copy of Grades is tampered", mimetype="text/plain")
+  # Match → return detailed JSON (contract unchanged)
+  return jsonify({k: v for k, v in verdict.items() if k != "tampered"})
 
+def grade_tamper_verdict(cog) -> dict:
+  """{tampered: bool, ...} from the COG record: tampered unless PDF and portal grades exist and agree."""
   # Both sources must exist
-  if not os.path.exists(pdf_path) or not os.path.exists(web_path):
-    return tampered_response()
+  if not cog or cog.get("grades_pdf") is None or cog.get("grades_webpage") is None:
+    return {"tampered": True}
 
-  g_pdf = _read_grade_block_or_tokens(pdf_path) or []
-  g_web = _read_grade_block_or_tokens(web_path) or []
+  g_pdf = cog["grades_pdf"] or []
+  g_web = cog["grades_webpage"] or []
 
   if g_pdf != g_web:
-    return tampered_response()
+    return {"tampered": True}
 
-  # Match → return detailed JSON (contract unchanged)
-  return jsonify({
+  return {
+    "tampered": False,
     "grades_from_pdf_ocr": g_pdf,
     "grades_from_webpage": g_web,
     "counts": {"pdf_ocr": len(g_pdf), "webpage": len(g_web)},
@@ -1234,34 +3315,63 @@ def validate_grade_tamper():
     "positional_mismatches": [],
     "only_in_pdf_ocr": [],
     "only_in_webpage": []
-  })
+  }
 
 @app.route('/validate_cross_fields', methods=['GET'])
 def validate_cross_fields():
-  coe_path = os.path.join(RESULTS_DIR, "raw_certificate_of_enrollment.txt")
-  cog_path = os.path.join(RESULTS_DIR, "raw_cog_text.txt")
-
-  if not os.path.exists(coe_path):
+  cor_record = get_ingestion_record("cor")
+  cog_record = get_ingestion_record("cog")
+  if not cor_record:
     return jsonify({"error": "raw_certificate_of_enrollment.txt not found"}), 400
-  if not os.path.exists(cog_path):
+  if not cog_record:
     return jsonify({"error": "raw_cog_text.txt not found"}), 400
 
-  with open(coe_path, "r", encoding="utf-8") as f:
-    coe_text = f.read()
-  with open(cog_path, "r", encoding="utf-8") as f:
-    cog_text = f.read()
+  return jsonify(cross_field_verdict(cor_record, cog_record))
 
-  coe = parse_from_coe(coe_text)
-  cog = parse_from_cog(cog_text)
-  verdict = compare_fields(coe, cog)
-
-  return jsonify({
-    "coe": coe,
-    "cog": cog,
-    "verdict": verdict
-  })
+def cross_field_verdict(cor_record, cog_record) -> dict:
+  return {
+    "coe": cor_record["fields"],
+    "cog": cog_record["fields"],
+    "verdict": derived_view("cross_fields", lambda a, b: compare_fields(a["fields"], b["fields"]), cor_record, cog_record)
+  }
 
-def process_ocr_text(raw_text):
+@app.route('/validate_curriculum_codes', methods=['GET', 'POST'])
+def validate_curriculum_codes():
+  """
+  Validate a COR/COG course list against the curriculum catalog.
+  POST JSON {"codes": [...], "program", "track", "year_level", "semester"}
+  or GET ?codes=IT 321,IT 322&program=...
+  """
+  if request.method == 'POST':
+    data = request.get_json(silent=True)
+    if data is None:
+      data = {}
+    if not isinstance(data, dict):
+      return jsonify({"error": "Expected a JSON object"}), 400
+  else:
+    data = request.args.to_dict()
+  codes = data.get('codes') or []
+  if isinstance(codes, str):
+    codes = [c for c in (s.strip() for s in codes.split(",")) if c]
+  if not isinstance(codes, list) or not all(isinstance(c, str) for c in codes):
+    return jsonify({"error": "codes must be a string or a list of strings"}), 400
+  if not codes:
+    return jsonify({"error": "No course codes provided"}), 400
+  year_level = data.get('year_level') or ''
+  if isinstance(year_level, int) and not isinstance(year_level, bool):
+    year_level = str(year_level)
+  term = {"program": data.get('program') or '', "track": data.get('track') or '',
+          "year_level": year_level, "semester": data.get('semester') or ''}
+  for field, value in term.items():
+    if not isinstance(value, str):
+      return jsonify({"error": f"{field} must be a string"}), 400
+
+  started = time.perf_counter()
+  result = validate_course_codes(codes, **term)
+  result["elapsed_us"] = int((time.perf_counter() - started) * 1_000_000)
+  return jsonify(result)
+
+def process_ocr_text(raw_text, corrections=None):
   lines = raw_text.splitlines()
 
   sr_code, sex, name, program_raw = extract_metadata(lines)
@@ -1270,12 +3380,12 @@ def process_ocr_text(raw_text):
   sem_word = to_semester_word(coe_fields.get("semester", ""))
 
   base_program, track, year_from_program = split_program_track_year(program_raw)
-  year_from_coe = _YEAR_ORDINAL_MAP.get((coe_fields.get("year_level") or "").upper(), "")
+  year_from_coe = YEAR_ORDINAL_MAP.get((coe_fields.get("year_level") or "").upper(), "")
   year_word = year_from_program or year_from_coe
 
   course_codes = []
   for line in lines:
-    res = extract_course_data(line)
+    res = extract_course_data(line, corrections)
     if res:
       course_codes.append(res)
 
@@ -1293,52 +3403,156 @@ def process_ocr_text(raw_text):
   result.append("}")
   return "\n".join(result)
 
+# === Dean's List application form generation ===
+DL_TEMPLATE_PATH = os.environ.get("DL_TEMPLATE_PATH", "assets/DL_Template.pdf")
+MAX_PDF_BATCH = int(os.environ.get("MAX_PDF_BATCH", "1000"))
+
+# (x, y, label, field) positions on the template; adjust to match your template fields
+APPLICATION_FIELDS = [
+  (100, 800, "Name", "name"),
+  (100, 780, "Contact Number", "contact_number"),
+  (100, 760, "Course", "course"),
+  (100, 740, "Yr./Sec.", "yr_sec"),
+  (300, 740, "Track", "track"),
+  (100, 720, "Scholarship Grant", "scholarship_grant"),
+]
+
+_dl_template_lock = threading.Lock()
+_dl_template_cache = {"mtime": None, "xobj": None}
+
+def _load_dl_template_xobj():
+  """
+  Parse DL_Template.pdf once and keep page 1 as a form XObject.
+  Every generated page references the same XObject, so the template's
+  content stream and fonts are shared instead of re-read per call.
+  Re-parsed only when the template file changes on disk.
+  """
+  mtime = os.path.getmtime(DL_TEMPLATE_PATH)
+  with _dl_template_lock:
+    if _dl_template_cache["xobj"] is None or _dl_template_cache["mtime"] != mtime:
+      _dl_template_cache["xobj"] = pagexobj(PdfReader(DL_TEMPLATE_PATH).pages[0])
+      _dl_template_cache["mtime"] = mtime
+      debug_log(f"DL template loaded from {DL_TEMPLATE_PATH}")
+    return _dl_template_cache["xobj"]
+
+def _render_application_pages(students):
+  """
+  Draw all students' fields into ONE reportlab canvas (one page each, so the
+  Helvetica resource is emitted once) and stack each overlay on the template.
+  Returns a list of pdfrw pages in the same order as `students`.
+  """
+  packet = io.BytesIO()
+  c = canvas.Canvas(packet, pagesize=letter)
+  for data in students:
+    c.setFont("Helvetica", 12)
+    for x, y, label, field in APPLICATION_FIELDS:
+      c.drawString(x, y, f"{label}: {data.get(field, '')}")
+    c.showPage()
+  c.save()
+
+  packet.seek(0)
+  template = _load_dl_template_xobj()
+  pages = []
+  for overlay in PdfReader(packet).pages:
+    # A bare PageMerge() has no page box and a form XObject carries none either:
+    # size the page from the template's BBox (its MediaBox when it was a page)
+    merger = PageMerge()
+    merger.mbox = [float(v) for v in template.BBox]
+    merger.add(template)
+    merger.add(overlay)
+    pages.append(merger.render())
+  return pages
+
+def _application_output_name(data, requested=None):
+  """Per-request output file name so concurrent callers never overwrite each other."""
+  stem = secure_filename(str(requested or "")) or secure_filename(
+    str(data.get("sr_code") or data.get("name") or "")
+  ) or "application"
+  if stem.lower().endswith(".pdf"):
+    stem = stem[:-4]
+  return f"generated_application_{stem}_{uuid.uuid4().hex[:8]}.pdf"
+
+def _write_application_pdf(pages, filename):
+  writer = PdfWriter()
+  for page in pages:
+    writer.addpage(page)
+  writer.write(os.path.join(RESULTS_DIR, filename))
+  return f"results/{filename}"
+
 @app.route('/generate_pdf_with_data', methods=['POST'])
 def generate_pdf_with_data():
     try:
         data = request.json if request.is_json else {}
-        name = data.get('name', '')
-        course = data.get('course', '')
-        yr_sec = data.get('yr_sec', '')
-        scholarship_grant = data.get('scholarship_grant', '')
-        track = data.get('track', '')
-        contact_number = data.get('contact_number', '')
-
-        template_pdf_path = "assets/DL_Template.pdf"
-        output_pdf_path = os.path.join(RESULTS_DIR, "generated_application_filled.pdf")
-
-        packet = io.BytesIO()
-        c = canvas.Canvas(packet, pagesize=letter)
-        c.setFont("Helvetica", 12)
-        # Adjust coordinates to match your template fields
-        c.drawString(100, 800, f"Name: {name}")
-        c.drawString(100, 780, f"Contact Number: {contact_number}")
-        c.drawString(100, 760, f"Course: {course}")
-        c.drawString(100, 740, f"Yr./Sec.: {yr_sec}")
-        c.drawString(300, 740, f"Track: {track}")
-        c.drawString(100, 720, f"Scholarship Grant: {scholarship_grant}")
-        c.save()
-
-        packet.seek(0)
-        new_pdf = PdfReader(packet)
-        existing_pdf = PdfReader(template_pdf_path)
-        output_pdf = PdfWriter()
-
-        page = existing_pdf.pages[0]
-        merger = PageMerge(page)
-        merger.add(new_pdf.pages[0]).render()
-
-        output_pdf.addpage(page)
-        output_pdf.write(output_pdf_path)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        pages = _render_application_pages([data])
+        pdf_url = _write_application_pdf(pages, _application_output_name(data, data.get('output_name')))
 
         return jsonify({
             "message": "PDF generated successfully",
-            "pdf_url": f"results/{os.path.basename(output_pdf_path)}"
+            "pdf_url": pdf_url
         })
 
     except Exception as e:
         return jsonify({"error": f"Failed to generate PDF: {str(e)}"}), 500
 
+@app.route('/generate_pdf_batch', methods=['POST'])
+def generate_pdf_batch():
+    """
+    Fill the application form for many students in one call.
+    Body: {"students": [{...same fields as /generate_pdf_with_data...}],
+           "mode": "separate" | "combined", "output_name": "optional"}
+    - separate: one PDF per student (each may carry its own output_name)
+    - combined: one multi-page PDF, one page per student
+    """
+    data = request.get_json(silent=True) if request.is_json else {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object with students"}), 400
+    students = data.get('students') or []
+    mode = data.get('mode') or 'separate'
+    if not isinstance(mode, str):
+        return jsonify({"error": "mode must be 'separate' or 'combined'"}), 400
+    mode = mode.lower()
+
+    if not isinstance(students, list) or not students:
+        return jsonify({"error": "students must be a non-empty list"}), 400
+    if not all(isinstance(st, dict) for st in students):
+        return jsonify({"error": "each entry in students must be an object"}), 400
+    if len(students) > MAX_PDF_BATCH:
+        return jsonify({"error": f"Too many students (max {MAX_PDF_BATCH})"}), 400
+    if mode not in {"separate", "combined"}:
+        return jsonify({"error": "mode must be 'separate' or 'combined'"}), 400
+
+    try:
+        started = time.time()
+        pages = _render_application_pages(students)
+
+        if mode == "combined":
+            name = _application_output_name({"name": "batch"}, data.get('output_name'))
+            files = [{"count": len(pages), "pdf_url": _write_application_pdf(pages, name)}]
+        else:
+            files = []
+            for student, page in zip(students, pages):
+                name = _application_output_name(student, student.get('output_name'))
+                files.append({
+                    "name": student.get('name', ''),
+                    "sr_code": student.get('sr_code', ''),
+                    "pdf_url": _write_application_pdf([page], name)
+                })
+
+        elapsed = time.time() - started
+        debug_log(f"/generate_pdf_batch {mode} {len(students)} forms in {elapsed:.2f}s")
+        return jsonify({
+            "message": "PDFs generated successfully",
+            "mode": mode,
+            "count": len(students),
+            "elapsed_seconds": round(elapsed, 3),
+            "files": files
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Failed to generate PDFs: {str(e)}"}), 500
+
 # --- Simple debug endpoint to verify grade_image.txt on the server
 @app.route('/debug/grade_image_txt', methods=['GET'])
 def debug_grade_image_txt():
@@ -0,0 +1,249 @@
+"""
+Offline batch processor for archived COG/COR scans (no HTTP service needed).
+
+Walks directories or a manifest of PDFs and images, runs them through the
+service's own rasterization, OCR and parsing code (app.py) across a process
+pool and appends one JSON record per document to an output JSONL file:
+
+  python batch.py scans/2023/ --kind cog --out cog_2023.jsonl --workers 8
+  python batch.py --manifest backfill.txt --out backfill.jsonl
+
+A manifest holds one path per line, optionally followed by a tab and the
+document kind (cog/cor), or JSON lines of {"path": ..., "kind": ...}.
+
+Re-running with the same --out resumes: documents that already have an "ok"
+record are skipped (pass --retry-failed to also redo the "error" ones). The
+QR portal is not visited; the QR URL is recorded for later verification.
+A throughput summary is printed at the end (and written to --summary).
+
+Importing app.py creates RESULTS_DIR and opens the records DB, which default
+to the server's /opt/ocr_api paths. Workers get a throwaway directory for
+both instead, unless --results-dir / --records-db point somewhere else.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PDF_EXTS = {".pdf"}
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
+KINDS = ("cog", "cor")
+
+_app = None  # app module, imported once per worker process
+
+# --- Inputs ---
+def walk_inputs(paths, kind):
+  for root in paths:
+    if os.path.isfile(root):
+      yield os.path.abspath(root), kind
+      continue
+    for dirpath, dirnames, filenames in os.walk(root):
+      dirnames.sort()
+      for name in sorted(filenames):
+        if os.path.splitext(name)[1].lower() in PDF_EXTS | IMAGE_EXTS:
+          yield os.path.abspath(os.path.join(dirpath, name)), kind
+
+def read_manifest(path, kind):
+  base = os.path.dirname(os.path.abspath(path))
+  with open(path, "r", encoding="utf-8") as f:
+    for line in f:
+      line = line.strip()
+      if not line or line.startswith("#"):
+        continue
+      if line.startswith("{"):
+        entry = json.loads(line)
+        doc, doc_kind = entry["path"], entry.get("kind", kind)
+      else:
+        doc, _, doc_kind = line.partition("\t")
+        doc_kind = doc_kind.strip() or kind
+      if doc_kind not in KINDS:
+        raise SystemExit(f"{path}: unknown kind {doc_kind!r} for {doc}")
+      yield os.path.abspath(os.path.join(base, doc)), doc_kind
+
+def load_done(out_path, retry_failed):
+  """Paths that already have a record in the output file."""
+  done = set()
+  if not os.path.exists(out_path):
+    return done
+  with open(out_path, "r", encoding="utf-8") as f:
+    for line in f:
+      try:
+        rec = json.loads(line)
+      except ValueError:
+        continue  # torn last line from an interrupted run
+      if rec.get("status") == "ok" or not retry_failed:
+        done.add(rec.get("path"))
+  return done
+
+# --- Worker ---
+def _init_worker(results_dir, records_db):
+  global _app
+  # One tesseract thread per process; the pool provides the parallelism
+  os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+  # Set before the import: app.py creates RESULTS_DIR and opens the DB at import time
+  os.environ["RESULTS_DIR"] = results_dir
+  os.environ["RECORDS_DB_PATH"] = records_db
+  sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+  import app
+  _app = app
+
+def _open_pages(path):
+  """Lazily rendered PDF pages, or the upright image plus its orientation info."""
+  with open(path, "rb") as f:
+    data = f.read()
+  if os.path.splitext(path)[1].lower() in PDF_EXTS:
+    return data, _app.LazyPdfPages(data), None
+  image = _app.Image.open(io.BytesIO(data)).convert("RGB")
+  qr_orientation = None
+  try:
+    codes = _app.decode(image)
+    if codes:
+      qr_orientation = getattr(codes[0], "orientation", None)
+  except Exception:
+    pass
+  image, orientation = _app.correct_orientation(image, qr_orientation)
+  return data, [image], orientation
+
+def process_cog(pages):
+  qr_url = _app.find_cog_qr(pages)
+  run = _app.ocr_cog_pages(pages)
+  raw_text = "\n".join(run["page_texts"])
+  code_corrections = []
+  return {
+    "qr_url": qr_url,
+    "fields": _app.parse_from_cog(raw_text),
+    "grades": _app.cog_page_grades(run["page_texts"], code_corrections),
+    "gwa": _app.compute_gwa(_app.parse_cog_course_rows(raw_text)),
+    "code_corrections": code_corrections,
+    "cell_repairs": run["cell_repairs"],
+    "ocr_tier": run["tier"],
+    "ocr_checks_passed": run["checks_passed"],
+    "pages_processed": run["pages_processed"],
+    "raw_text": raw_text,
+  }
+
+def process_cor(pages):
+  raw_text, ocr_info = _app.ocr_cor_page(pages[0])
+  code_corrections = []
+  return {
+    "fields": _app.parse_from_coe(raw_text),
+    "result": _app.process_ocr_text(raw_text, code_corrections),
+    "code_corrections": code_corrections,
+    "ocr_mode": ocr_info["ocr_mode"],
+    "pages_processed": 1,
+    "raw_text": raw_text,
+  }
+
+def process_document(path, kind):
+  """One JSON-ready record; failures are recorded rather than raised."""
+  t0 = time.monotonic()
+  rec = {"path": path, "kind": kind}
+  try:
+    data, pages, orientation = _open_pages(path)
+    rec["sha256"] = hashlib.sha256(data).hexdigest()
+    rec["pages_total"] = len(pages)
+    rec.update(process_cog(pages) if kind == "cog" else process_cor(pages))
+    if orientation is not None:
+      rec["orientation"] = orientation
+    rec["status"] = "ok"
+  except Exception as e:
+    rec["status"] = "error"
+    rec["error"] = f"{type(e).__name__}: {e}"
+  rec["seconds"] = round(time.monotonic() - t0, 3)
+  return rec
+
+# --- Summary ---
+def percentile(values, p):
+  if not values:
+    return None
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+def summarize(records, elapsed, workers, skipped):
+  ok = [r for r in records if r["status"] == "ok"]
+  secs = [r["seconds"] for r in records]
+  pages = sum(r.get("pages_processed", 0) for r in ok)
+  return {
+    "documents": len(records),
+    "ok": len(ok),
+    "errors": len(records) - len(ok),
+    "skipped_resume": skipped,
+    "workers": workers,
+    "elapsed_s": round(elapsed, 2),
+    "docs_per_s": round(len(records) / elapsed, 3) if elapsed else None,
+    "pages_per_s": round(pages / elapsed, 3) if elapsed else None,
+    "pages_processed": pages,
+    "doc_seconds_p50": percentile(secs, 50),
+    "doc_seconds_p90": percentile(secs, 90),
+    "doc_seconds_p99": percentile(secs, 99),
+    "ocr_tiers": {t: sum(1 for r in ok if r.get("ocr_tier") == t) for t in {r.get("ocr_tier") for r in ok} if t},
+  }
+
+def main():
+  ap = argparse.ArgumentParser(description="Batch OCR of archived COG/COR scans")
+  ap.add_argument("inputs", nargs="*", help="PDF/image files or directories to walk")
+  ap.add_argument("--manifest", help="file listing documents (path[<TAB>kind] or JSON lines)")
+  ap.add_argument("--kind", choices=KINDS, default="cog", help="document kind when not given per entry")
+  ap.add_argument("--out", required=True, help="JSONL output; appended to and used for resume")
+  ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+  ap.add_argument("--retry-failed", action="store_true", help="redo documents whose last record is an error")
+  ap.add_argument("--no-raw-text", action="store_true", help="leave OCR text out of the records")
+  ap.add_argument("--summary", help="also write the throughput summary JSON here")
+  ap.add_argument("--results-dir", help="RESULTS_DIR for app.py in the workers "
+                                        "(default: a temporary directory, removed afterwards)")
+  ap.add_argument("--records-db", help="RECORDS_DB_PATH for app.py in the workers "
+                                       "(default: inside the temporary directory)")
+  args = ap.parse_args()
+
+  if not args.inputs and not args.manifest:
+    ap.error("give input paths or --manifest")
+  jobs = list(walk_inputs(args.inputs, args.kind))
+  if args.manifest:
+    jobs.extend(read_manifest(args.manifest, args.kind))
+
+  done = load_done(args.out, args.retry_failed)
+  todo = [(p, k) for p, k in dict.fromkeys(jobs) if p not in done]
+  skipped = len(jobs) - len(todo)
+  print(f"{len(todo)} documents to process ({skipped} already done), {args.workers} workers", file=sys.stderr)
+
+  state_dir = tempfile.mkdtemp(prefix="ocr-batch-")
+  results_dir = os.path.abspath(args.results_dir or os.path.join(state_dir, "results"))
+  records_db = os.path.abspath(args.records_db or os.path.join(state_dir, "student_records.sqlite3"))
+  os.makedirs(results_dir, exist_ok=True)
+
+  records = []
+  t0 = time.monotonic()
+  try:
+    # spawn: app.py starts logging/preview threads at import, which must not be forked
+    ctx = multiprocessing.get_context("spawn")
+    with open(args.out, "a", encoding="utf-8") as out, concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=ctx, initializer=_init_worker,
+        initargs=(results_dir, records_db)) as pool:
+      futures = {pool.submit(process_document, p, k): p for p, k in todo}
+      for n, fut in enumerate(concurrent.futures.as_completed(futures), start=1):
+        rec = fut.result()
+        records.append(rec)
+        if args.no_raw_text:
+          rec.pop("raw_text", None)
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        out.flush()
+        if n % 50 == 0 or n == len(todo):
+          rate = n / max(time.monotonic() - t0, 1e-9)
+          print(f"  {n}/{len(todo)} ({rate:.2f} docs/s)", file=sys.stderr)
+  finally:
+    shutil.rmtree(state_dir, ignore_errors=True)
+  summary = summarize(records, time.monotonic() - t0, args.workers, skipped)
+  print(json.dumps(summary, indent=2))
+  if args.summary:
+    with open(args.summary, "w", encoding="utf-8") as f:
+      json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+  main()
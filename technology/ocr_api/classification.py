@@ -0,0 +1,58 @@
+"""
+COR vs COG classification from a page's header text.
+
+Each kind has weighted header anchors; the higher score wins when it is at
+least CLASSIFY_MIN_SCORE and CLASSIFY_MIN_MARGIN ahead, otherwise the kind is
+left undecided (None). A QR code on the page counts towards COG. Getting the
+text (PDF text layer or a thumbnail OCR pass) and finding the QR code stay in
+app.py (classify_document).
+"""
+import re
+
+CLASSIFY_MIN_TEXT = 40        # chars of text layer worth scoring
+CLASSIFY_MIN_SCORE = 3
+CLASSIFY_MIN_MARGIN = 2
+CLASSIFY_QR_WEIGHT = 2        # a QR code counts towards COG
+DOC_ANCHORS = {
+  "cog": [
+    ("copy of grades", r"cop[yv]\s*of\s*grades", 4),
+    ("general weighted average", r"general\s+weighted\s+average", 2),
+    ("portal grades link", r"view/grades", 2),
+    ("nothing follows", r"nothing\s+follows", 1),
+    ("total no of units", r"total\s+no\.?\s+of\s+units", 1),
+    ("instructor", r"\binstructor\b", 1),
+  ],
+  "cor": [
+    ("registration form", r"registration\s+form", 4),
+    ("certificate of registration", r"certificate\s+of\s+registration", 4),
+    ("assessment", r"\bassessment\b", 1),
+    ("tuition", r"\btuition\b", 1),
+    ("scholarship", r"scholarship", 1),
+    ("reference no", r"reference\s+no", 1),
+    ("unit(s)", r"unit\(s\)", 1),
+  ],
+}
+
+def score_document_text(text: str) -> tuple:
+  """({kind: score}, {kind: [matched anchors]}) for the header anchors found in text."""
+  norm = re.sub(r"\s+", " ", (text or "").lower().replace("’", "'"))
+  scores, hits = {}, {}
+  for kind, anchors in DOC_ANCHORS.items():
+    matched = [(label, w) for label, pat, w in anchors if re.search(pat, norm)]
+    hits[kind] = [label for label, _ in matched]
+    scores[kind] = sum(w for _, w in matched)
+  return scores, hits
+
+def _decide_kind(scores: dict):
+  ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+  (best, top), (_, second) = ranked[0], ranked[1]
+  if top >= CLASSIFY_MIN_SCORE and top - second >= CLASSIFY_MIN_MARGIN:
+    return best
+  return None
+
+def classify_text(text: str, qr=False) -> tuple:
+  """(kind "cor"|"cog"|None, scores, anchors) for a page's text; qr: the page carries a QR code."""
+  scores, hits = score_document_text(text)
+  if qr:
+    scores["cog"] += CLASSIFY_QR_WEIGHT
+  return _decide_kind(scores), scores, hits
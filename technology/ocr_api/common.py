@@ -0,0 +1,33 @@
+"""
+Settings and file helpers shared by app.py and the modules split out of it.
+"""
+import os
+import uuid
+
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "/opt/ocr_api/results")
+os.makedirs(RESULTS_DIR, exist_ok=True)  # ensure results/ exists
+
+def env_int(name: str, default: int) -> int:
+  try:
+    return int(os.environ.get(name, default))
+  except ValueError:
+    return default
+
+def atomic_write_text(path, text):
+  """Write text atomically to avoid partial writes on Windows/Linux."""
+  tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"  # per call: concurrent writers must not share it
+  with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+    f.write(text)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp, path)
+
+def atomic_save_image(image, path, fmt="PNG", **kwargs):
+  """image.save() via a per-call temp file + os.replace, so concurrent writers never mix bytes."""
+  tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+  try:
+    image.save(tmp, fmt, **kwargs)
+    os.replace(tmp, path)
+  finally:
+    if os.path.exists(tmp):
+      os.remove(tmp)
@@ -0,0 +1,351 @@
+"""
+Curriculum catalog (curriculum.json) and OCR-tolerant course-code correction.
+
+The catalog is indexed once per file change: by course code, by term
+(program, track, year level, semester) and as a symmetric-delete dictionary
+for snapping OCR-garbled codes. Nothing here touches Flask or Tesseract.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+from ocrlog import debug_log, warn_log
+
+# ---------- Program / term words (as printed on the COR and COG) ----------
+YEAR_ORDINAL_MAP = {
+  "1": "FIRST", "1ST": "FIRST", "FIRST": "FIRST",
+  "2": "SECOND", "2ND": "SECOND", "SECOND": "SECOND",
+  "3": "THIRD", "3RD": "THIRD", "THIRD": "THIRD",
+  "4": "FOURTH", "4TH": "FOURTH", "FOURTH": "FOURTH",
+}
+SEM_WORD_MAP = {
+  "1ST": "FIRST", "1": "FIRST", "FIRST": "FIRST",
+  "2ND": "SECOND", "2": "SECOND", "SECOND": "SECOND",
+  "MIDYEAR": "MIDYEAR", "MID-YEAR": "MIDYEAR", "MID YEAR": "MIDYEAR",
+  "SUMMER": "SUMMER"
+}
+
+def _normalize_bs_prefix(text: str) -> str:
+  t = (text or "").strip()
+  m = re.match(r"^\s*B\.?\s*S\.?\s+(.*)$", t, flags=re.I)
+  if m:
+    return "BS " + m.group(1).strip()
+  return t
+
+def split_program_track_year(program_str: str):
+  s = (program_str or "").strip()
+
+  year_word = ""
+  m_year = re.search(r"/\s*(FIRST|SECOND|THIRD|FOURTH|1ST|2ND|3RD|4TH|[1-4])\s*$", s, flags=re.I)
+  if m_year:
+    yl_tok = m_year.group(1).upper()
+    year_word = YEAR_ORDINAL_MAP.get(yl_tok, "")
+    left = s[:m_year.start()].rstrip()
+  else:
+    left = s
+
+  left_upper = left.upper()
+  has_bs_prefix = bool(re.match(r"^\s*B\.?\s*S\.?\b", left_upper)) or left_upper.startswith("BS ")
+  has_bachelor = "BACHELOR" in left_upper
+
+  sep_idx = max(left.rfind('-'), left.rfind('–'))
+  if sep_idx != -1 and (has_bs_prefix or has_bachelor):
+    base_candidate = left[:sep_idx].strip()
+    track_candidate = left[sep_idx + 1:].strip().upper()
+    if has_bs_prefix:
+      base = _normalize_bs_prefix(base_candidate)
+    else:
+      base = base_candidate
+    track = track_candidate
+  else:
+    base = _normalize_bs_prefix(left) if has_bs_prefix else left.strip()
+    track = ""
+
+  return base, track, year_word
+
+def to_semester_word(sem_val: str) -> str:
+  if not sem_val:
+    return ""
+  up = sem_val.upper()
+  if up in {"1ST", "FIRST", "1"}:
+    return "FIRST"
+  if up in {"2ND", "SECOND", "2"}:
+    return "SECOND"
+  return SEM_WORD_MAP.get(up, "")
+
+# ---------- Curriculum catalog ----------
+CURRICULUM_PATH = os.environ.get(
+  "CURRICULUM_PATH",
+  os.path.join(os.path.dirname(os.path.abspath(__file__)), "curriculum.json")
+)
+CURRICULUM_RELOAD_CHECK_SECONDS = float(os.environ.get("CURRICULUM_RELOAD_CHECK_SECONDS", "5"))
+CURRICULUM_ALL_TRACKS = "ALL"  # track key for courses shared by every track
+
+_curriculum_lock = threading.Lock()
+_curriculum = {"mtime": None, "version": "", "by_code": {}, "by_term": {}, "fuzzy": {}, "gwa_rules": {}}
+_curriculum_checked_at = 0.0
+
+def _norm_course_code(code: str) -> str:
+  """'it321', 'IT-321', 'It  321,' -> 'IT 321'."""
+  m = re.fullmatch(r"\s*([A-Za-z]{2,6})\s*-?\s*(\d{3})\s*,?\s*", code or "")
+  if not m:
+    return (code or "").strip().upper()
+  return f"{m.group(1).upper()} {m.group(2)}"
+
+def _norm_program_key(program: str) -> str:
+  return re.sub(r"\s+", " ", _normalize_bs_prefix(program or "")).strip().upper()
+
+def _curriculum_term_key(program, track, year_level, semester):
+  """(PROGRAM, TRACK, YEAR WORD, SEMESTER WORD) – same words the COR/COG parsers emit."""
+  yl = (year_level or "").strip().upper()
+  sem = (semester or "").strip()
+  return (
+    _norm_program_key(program),
+    (track or CURRICULUM_ALL_TRACKS).strip().upper(),
+    YEAR_ORDINAL_MAP.get(yl, yl),
+    to_semester_word(sem) or sem.upper()
+  )
+
+def _build_curriculum_index(doc: dict):
+  """
+  Flatten program -> track -> year level -> semester -> [courses] into two hash indexes:
+  - by_code: course code -> list of catalog entries (a code may appear in several programs)
+  - by_term: term key -> set of course codes
+  """
+  by_code = {}
+  by_term = {}
+  for program, tracks in (doc.get("programs") or {}).items():
+    for track, years in (tracks or {}).items():
+      for year_level, semesters in (years or {}).items():
+        for semester, courses in (semesters or {}).items():
+          key = _curriculum_term_key(program, track, year_level, semester)
+          term_codes = by_term.setdefault(key, set())
+          for course in courses or []:
+            code = _norm_course_code(course.get("code", ""))
+            if not code:
+              continue
+            term_codes.add(code)
+            by_code.setdefault(code, []).append({
+              "code": code,
+              "units": course.get("units"),
+              "title": course.get("title", ""),
+              "program": key[0],
+              "track": key[1],
+              "year_level": key[2],
+              "semester": key[3]
+            })
+  return by_code, by_term
+
+def load_curriculum(force=False) -> dict:
+  """
+  (Re)load curriculum.json when its mtime changed. The catalog is swapped in
+  as a whole, so readers never see a half-built index. A broken file keeps
+  the previous catalog.
+  """
+  global _curriculum, _curriculum_checked_at
+  with _curriculum_lock:
+    _curriculum_checked_at = time.time()
+    try:
+      mtime = os.path.getmtime(CURRICULUM_PATH)
+    except OSError:
+      return _curriculum
+    if not force and mtime == _curriculum["mtime"]:
+      return _curriculum
+    try:
+      with open(CURRICULUM_PATH, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+      by_code, by_term = _build_curriculum_index(doc)
+    except Exception as e:
+      warn_log(f"curriculum load failed, keeping previous catalog: {e}")
+      return _curriculum
+    _curriculum = {
+      "mtime": mtime,
+      "version": str(doc.get("version", "")),
+      "by_code": by_code,
+      "by_term": by_term,
+      "fuzzy": _build_code_fuzzy_index(by_code.keys()),
+      "gwa_rules": doc.get("gwa_rules") or {}
+    }
+    debug_log(f"curriculum loaded: {len(by_code)} codes, {len(by_term)} terms from {CURRICULUM_PATH}")
+    return _curriculum
+
+def get_curriculum() -> dict:
+  """Current catalog; checks the file for changes at most every CURRICULUM_RELOAD_CHECK_SECONDS."""
+  if time.time() - _curriculum_checked_at >= CURRICULUM_RELOAD_CHECK_SECONDS:
+    return load_curriculum()
+  return _curriculum
+
+def curriculum_units(code: str, program: str = ""):
+  """Units for a course code from the catalog, or None if unknown."""
+  entries = get_curriculum()["by_code"].get(_norm_course_code(code), [])
+  if program:
+    prog = _norm_program_key(program)
+    entries = [e for e in entries if e["program"] == prog] or entries
+  return entries[0]["units"] if entries else None
+
+# ---------- OCR-tolerant course-code correction ----------
+# Glyph pairs Tesseract mixes up in course codes; substituting one for the other
+# is cheap. Any other edit that touches a digit (a non-confusable substitution,
+# a dropped, added or swapped digit) is a miss whatever the budget: "IT 327"
+# or "IT 31l" must not silently become "IT 321". The larger budget for
+# malformed tokens only pays for confusions and letter/stray-character edits.
+OCR_CONFUSABLE_GROUPS = ["0OQD", "1IL|", "5S", "8B", "2Z", "6G", "4A", "7T"]
+OCR_CONFUSION_COST = 0.25
+OCR_CODE_MAX_DISTANCE = float(os.environ.get("OCR_CODE_MAX_DISTANCE", "0.5"))             # well-formed codes
+OCR_CODE_MAX_DISTANCE_MALFORMED = float(os.environ.get("OCR_CODE_MAX_DISTANCE_MALFORMED", "1.25"))  # split/garbled tokens
+SYMDEL_MAX_DELETES = 2
+
+_OCR_FOLD = {ch: grp[0] for grp in OCR_CONFUSABLE_GROUPS for ch in grp}
+
+def _code_key(code: str) -> str:
+  """'IT 321' / 'it-321' / 'I T 3 2 1' -> 'IT321' (separators carry no information)."""
+  return re.sub(r"[\s\-_.,]+", "", (code or "").upper())
+
+def _fold_ocr(key: str) -> str:
+  return "".join(_OCR_FOLD.get(ch, ch) for ch in key)
+
+def _ocr_sub_cost(a: str, b: str) -> tuple:
+  """(digit misses, cost) of reading catalog char b as a."""
+  if a == b:
+    return 0, 0.0
+  if _OCR_FOLD.get(a, a) == _OCR_FOLD.get(b, b):
+    return 0, OCR_CONFUSION_COST
+  return int(a.isdigit() or b.isdigit()), 1.0
+
+def _add(x: tuple, misses: int, cost: float) -> tuple:
+  return x[0] + misses, x[1] + cost
+
+def _ocr_weighted_distance(a: str, b: str) -> tuple:
+  """
+  Damerau-Levenshtein with OCR-confusion-weighted substitutions (codes are
+  short) -> (digit misses, cost), minimizing misses first.
+  """
+  la, lb = len(a), len(b)
+  prev2 = None
+  prev = [(0, 0.0)]
+  for j in range(1, lb + 1):
+    prev.append(_add(prev[-1], int(b[j - 1].isdigit()), 1.0))
+  for i in range(1, la + 1):
+    cur = [_add(prev[0], int(a[i - 1].isdigit()), 1.0)] + [(0, 0.0)] * lb
+    for j in range(1, lb + 1):
+      cur[j] = min(
+        _add(prev[j], int(a[i - 1].isdigit()), 1.0),      # stray input char
+        _add(cur[j - 1], int(b[j - 1].isdigit()), 1.0),   # catalog char missing
+        _add(prev[j - 1], *_ocr_sub_cost(a[i - 1], b[j - 1]))
+      )
+      if prev2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+        cur[j] = min(cur[j], _add(prev2[j - 2], int(a[i - 1].isdigit() or a[i - 2].isdigit()), 1.0))
+    prev2, prev = prev, cur
+  return prev[lb]
+
+def _symdel_variants(key: str, depth: int = SYMDEL_MAX_DELETES) -> set:
+  out = {key}
+  frontier = {key}
+  for _ in range(depth):
+    nxt = set()
+    for w in frontier:
+      for i in range(len(w)):
+        nxt.add(w[:i] + w[i + 1:])
+    out |= nxt
+    frontier = nxt
+  return out
+
+def _build_code_fuzzy_index(codes) -> dict:
+  """
+  Symmetric-delete dictionary over OCR-folded code keys. Built once per catalog
+  load; with a preloading server (gunicorn --preload) every worker shares the
+  parent's copy.
+  """
+  exact = {}
+  deletes = {}
+  for code in codes:
+    key = _code_key(code)
+    exact[key] = code
+    for v in _symdel_variants(_fold_ocr(key)):
+      deletes.setdefault(v, set()).add(key)
+  return {"exact": exact, "deletes": deletes}
+
+def snap_course_code(raw: str, max_distance: float = None) -> dict | None:
+  """
+  Snap an OCR'd course code to the nearest catalog code.
+  Returns {"input", "code", "distance", "corrected"} or None when nothing is
+  within max_distance (default depends on whether the input is well-formed).
+  """
+  index = get_curriculum().get("fuzzy") or {}
+  exact = index.get("exact") or {}
+  if not exact:
+    return None
+  key = _code_key(raw)
+  if not key:
+    return None
+  if key in exact:
+    return {"input": raw, "code": exact[key], "distance": 0.0, "corrected": False}
+
+  if max_distance is None:
+    well_formed = re.fullmatch(r"[A-Z]{2,6}\d{3}", key) is not None
+    max_distance = OCR_CODE_MAX_DISTANCE if well_formed else OCR_CODE_MAX_DISTANCE_MALFORMED
+
+  candidates = set()
+  deletes = index["deletes"]
+  for v in _symdel_variants(_fold_ocr(key)):
+    candidates |= deletes.get(v, set())
+
+  best = None
+  for cand in candidates:
+    misses, d = _ocr_weighted_distance(key, cand)
+    if misses:
+      continue
+    if d <= max_distance and (best is None or d < best[0] or (d == best[0] and cand < best[1])):
+      best = (d, cand)
+  if best is None:
+    return None
+  return {"input": raw, "code": exact[best[1]], "distance": round(best[0], 3), "corrected": True}
+
+def validate_course_codes(codes, program="", track="", year_level="", semester="") -> dict:
+  """
+  Check a whole COR/COG course list against the catalog in one pass.
+  With program + year level + semester, a code is ok only if it belongs to
+  that term (its track or the shared ALL track); otherwise ok means known.
+  """
+  cat = get_curriculum()
+  term_codes = None
+  if program and year_level and semester:
+    key = _curriculum_term_key(program, track, year_level, semester)
+    term_codes = set(cat["by_term"].get((key[0], CURRICULUM_ALL_TRACKS, key[2], key[3]), ()))
+    if key[1] != CURRICULUM_ALL_TRACKS:
+      term_codes |= cat["by_term"].get(key, set())
+  prog = _norm_program_key(program) if program else ""
+
+  items = []
+  for raw in codes or []:
+    code = _norm_course_code(str(raw))
+    entries = cat["by_code"].get(code, [])
+    if prog:
+      entries = [e for e in entries if e["program"] == prog]
+    entry = entries[0] if entries else None
+    ok = (code in term_codes) if term_codes is not None else entry is not None
+    items.append({
+      "input": raw,
+      "code": code,
+      "ok": ok,
+      "known": entry is not None,
+      "units": entry["units"] if entry else None,
+      "title": entry["title"] if entry else "",
+      "curriculum_term": {
+        "track": entry["track"],
+        "year_level": entry["year_level"],
+        "semester": entry["semester"]
+      } if entry else None
+    })
+
+  ok_count = sum(1 for it in items if it["ok"])
+  return {
+    "all_ok": bool(items) and ok_count == len(items),
+    "items": items,
+    "summary": {"ok_count": ok_count, "total": len(items)},
+    "catalog_version": cat["version"]
+  }
+
+load_curriculum()
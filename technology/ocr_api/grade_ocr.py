@@ -1,3 +1,8 @@
+"""
+One-off OCR of test_image.png into output.txt (kept for reference).
+For real COG/COR scans use technology/ocr_api/batch.py, which runs the service's own
+rasterization, OCR and parsing over whole directories.
+"""
 import pytesseract
 from PIL import Image
 import re
@@ -0,0 +1,159 @@
+"""
+GWA engine: structured course rows -> weighted average, totals, eligibility.
+
+Rows are {"code", "units", "grade", ...} dicts, whatever produced them (COG
+OCR, the record store, a JSON body), so nothing here parses text.
+"""
+from curriculum import get_curriculum
+
+# Rules table for GWA computation and eligibility. A "gwa_rules" object in
+# curriculum.json overrides these keys (reloaded with the catalog).
+GWA_RULES = {
+  # Course codes / prefixes left out of the GWA ("Not include NSTP in the computation of GWA")
+  "exclude_codes": [],
+  "exclude_prefixes": ["NSTP"],
+  # Grade marks that carry no numeric value; they disqualify but never count in the GWA
+  "non_numeric_grades": ["INC", "DROP", "DRP", "W", "WF", "UD", "NG"],
+  # name -> thresholds; a flag is raised per rule in the result's "eligibility"
+  "eligibility": {
+    "deans_list": {"max_gwa": 1.75, "max_grade": 2.50, "allow_non_numeric": False, "min_units": 1}
+  },
+  # (label, max GWA) checked in order
+  "honors": [["Tech Savant", 1.25], ["Tech Virtuoso", 1.50], ["Tech Prodigy", 1.75]]
+}
+
+def get_gwa_rules() -> dict:
+  overrides = get_curriculum().get("gwa_rules") or {}
+  return {**GWA_RULES, **overrides}
+
+def _gwa_exclusion_reason(code: str, rules: dict) -> str:
+  code = (code or "").upper()
+  if code in {c.upper() for c in rules.get("exclude_codes", [])}:
+    return "excluded_code"
+  if any(code.startswith(p.upper()) for p in rules.get("exclude_prefixes", [])):
+    return "excluded_prefix"
+  return ""
+
+def compute_gwa(rows, rules: dict = None) -> dict:
+  """
+  Weighted average over structured course rows. Every row is kept in the
+  result with a status: counted, excluded (rules table), non_numeric
+  (INC/DROP/...), or incomplete (missing units or grade).
+  """
+  rules = rules or get_gwa_rules()
+  non_numeric = {g.upper() for g in rules.get("non_numeric_grades", [])}
+  out_rows = []
+  total_units = 0
+  total_weighted = 0.0
+  excluded_units = 0
+  worst_grade = None
+  flagged = []
+
+  for row in rows:
+    units = row.get("units")
+    grade = (row.get("grade") or "")
+    grade_up = str(grade).upper()
+    item = {**row, "grade_value": None, "weighted": None}
+    reason = _gwa_exclusion_reason(row.get("code", ""), rules)
+    if reason:
+      item["status"] = "excluded"
+      item["reason"] = reason
+      excluded_units += units or 0
+    elif grade_up in non_numeric:
+      item["status"] = "non_numeric"
+      flagged.append(grade_up)
+    elif units is None or not grade:
+      item["status"] = "incomplete"
+    else:
+      g_val = float(grade)
+      item["grade_value"] = g_val
+      item["weighted"] = round(g_val * units, 4)
+      item["status"] = "counted"
+      total_units += units
+      total_weighted += g_val * units
+      worst_grade = g_val if worst_grade is None else max(worst_grade, g_val)
+    out_rows.append(item)
+
+  gwa = round(total_weighted / total_units, 4) if total_units > 0 else None
+
+  eligibility = {}
+  for name, rule in (rules.get("eligibility") or {}).items():
+    reasons = []
+    if gwa is None:
+      reasons.append("no_gwa")
+    elif rule.get("max_gwa") is not None and gwa > rule["max_gwa"]:
+      reasons.append(f"gwa_above_{rule['max_gwa']:.2f}")
+    if worst_grade is not None and rule.get("max_grade") is not None and worst_grade > rule["max_grade"]:
+      reasons.append(f"grade_below_{rule['max_grade']:.2f}")
+    if flagged and not rule.get("allow_non_numeric", False):
+      reasons.append("has_" + "_".join(sorted(set(flagged))).lower())
+    if rule.get("min_units") and total_units < rule["min_units"]:
+      reasons.append("insufficient_units")
+    if any(r["status"] == "incomplete" for r in out_rows):
+      reasons.append("incomplete_rows")
+    eligibility[name] = {"eligible": not reasons, "reasons": reasons}
+
+  honor = None
+  if gwa is not None:
+    for label, max_gwa in rules.get("honors", []):
+      if gwa <= max_gwa:
+        honor = label
+        break
+
+  return {
+    "rows": out_rows,
+    "course_count": len(out_rows),
+    "total_units": total_units,
+    "total_weighted": round(total_weighted, 4),
+    "excluded_units": excluded_units,
+    "weighted_average": gwa,
+    "weighted_average_str": f"{gwa:.4f}" if gwa is not None else "",
+    "lowest_grade": worst_grade,
+    "non_numeric_grades": sorted(set(flagged)),
+    "eligibility": eligibility,
+    "honor": honor
+  }
+
+def compute_gwa_by_term(terms: dict, rules: dict = None) -> dict:
+  """Per-term results plus a cumulative GWA over all terms' rows. terms: {label: rows}."""
+  rules = rules or get_gwa_rules()
+  per_term = {label: compute_gwa(rows, rules) for label, rows in terms.items()}
+  all_rows = [row for rows in terms.values() for row in rows]
+  return {"terms": per_term, "cumulative": compute_gwa(all_rows, rules)}
+
+def render_grade_with_units_table(result: dict) -> str:
+  """Grades | Units | Weighted Grades text table (Grade_with_Units.txt) from a compute_gwa() result."""
+  out = ["Grades | Units | Weighted Grades |"]
+  for row in result["rows"]:
+    if row["status"] == "excluded":
+      continue
+    units = "" if row.get("units") is None else str(row["units"])
+    weighted = "" if row.get("weighted") is None else str(row["weighted"])
+    out.append(f"{row.get('grade') or '':<6} | {units:<5} | {weighted:<14}|")
+  out.append(f"Total:   | {result['total_units']:<5} | {result['total_weighted']:<14}|")
+  out.append(f"Weighted Average: {result['weighted_average_str']}")
+  return "\n".join(out)
+
+def gwa_rows_problem(rows, where="rows"):
+  """First reason `rows` cannot go into compute_gwa(), naming the field, or None."""
+  if not isinstance(rows, list):
+    return f"{where} must be a list of course rows"
+  non_numeric = {g.upper() for g in get_gwa_rules().get("non_numeric_grades", [])}
+  for i, row in enumerate(rows):
+    if not isinstance(row, dict):
+      return f"{where}[{i}] must be an object"
+    if row.get("code") is not None and not isinstance(row["code"], str):
+      return f"{where}[{i}].code must be a string"
+    units = row.get("units")
+    if units is not None and (isinstance(units, bool) or not isinstance(units, (int, float))):
+      return f"{where}[{i}].units must be a number"
+    grade = row.get("grade")
+    if grade in (None, "") or str(grade).upper() in non_numeric:
+      continue
+    if isinstance(grade, bool) or not isinstance(grade, (str, int, float)):
+      return f"{where}[{i}].grade must be a grade string or number"
+    try:
+      float(grade)
+    except ValueError:
+      return f"{where}[{i}].grade is not a grade: {grade!r}"
+  return None
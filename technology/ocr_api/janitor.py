@@ -0,0 +1,184 @@
+"""
+RESULTS_DIR retention janitor.
+
+A background thread sweeps RESULTS_DIR every JANITOR_INTERVAL seconds. Each
+artifact class (first matching pattern wins) has a TTL and a size budget;
+expired files go first, then least-recently-used files until the class fits.
+"Used" = max(mtime, atime); /results sets the atime of every file it serves
+(note_artifact_access), so all workers see the same access history. Files
+younger than JANITOR_MIN_AGE are never touched (a request may still be
+writing/serving them), nor is the canonical state the validation endpoints
+read (JANITOR_KEEP). One sweep per host at a time (flock), so several
+workers can share the dir.
+"""
+import fcntl
+import fnmatch
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from common import RESULTS_DIR, env_int
+from ocrlog import log_event, warn_log
+
+JANITOR_INTERVAL = env_int("JANITOR_INTERVAL", 300)
+JANITOR_MIN_AGE = env_int("JANITOR_MIN_AGE", 120)
+JANITOR_LOCK_PATH = os.path.join(os.path.dirname(RESULTS_DIR), ".results_janitor.lock")
+# Top-level files in RESULTS_DIR: ingestion records and the files they are migrated from
+JANITOR_KEEP = ["*_meta.json", "raw_cog_text.txt", "raw_certificate_of_enrollment.txt",
+                "grade_pdf_ocr.txt", "grade_webpage.txt"]
+ARTIFACT_CLASSES = [
+  # (class, patterns, ttl hours, size budget MB)
+  ("tmp", ["*.tmp"], 1, 50),
+  ("verdict", ["result_*", "Grade_with_Units.*", "grade_for_review.txt", "parsed_*",
+               "grade_*.txt", "*_meta.json"], 24 * 90, 200),
+  ("raw_text", ["raw_*.txt", "*.txt"], 24 * 14, 200),
+  ("generated_pdf", ["*.pdf"], 24 * 7, 2048),
+  ("image", ["*.png", "*.jpg", "*.jpeg", "*.webp"], 24 * 2, 1024),
+  ("other", ["*"], 24 * 30, 512),
+]
+ARTIFACT_POLICIES = {
+  name: {
+    "patterns": patterns,
+    "ttl_seconds": env_int(f"JANITOR_{name.upper()}_TTL_HOURS", ttl_hours) * 3600,
+    "max_bytes": env_int(f"JANITOR_{name.upper()}_MAX_MB", max_mb) * 1024 * 1024,
+  }
+  for name, patterns, ttl_hours, max_mb in ARTIFACT_CLASSES
+}
+
+_janitor_lock = threading.Lock()
+_janitor_wake = threading.Event()
+_janitor_started = False
+_janitor_stats = {
+  "runs": 0, "last_run": None, "last_duration_ms": None,
+  "reclaimed_bytes": 0, "reclaimed_files": 0, "errors": 0,
+  "by_class": {name: {"files": 0, "bytes": 0, "reclaimed_bytes": 0, "reclaimed_files": 0} for name in ARTIFACT_POLICIES},
+}
+
+def note_artifact_access(relpath: str):
+  """Record that an artifact was served: bump its atime, keeping the mtime."""
+  rel = os.path.normpath(relpath)
+  if os.path.isabs(rel) or rel.startswith(".."):
+    return
+  path = os.path.join(RESULTS_DIR, rel)
+  try:
+    st = os.stat(path)
+    os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+  except OSError:
+    pass
+
+def _artifact_class(filename: str) -> str:
+  for name, patterns, _, _ in ARTIFACT_CLASSES:
+    if any(fnmatch.fnmatch(filename, pat) for pat in patterns):
+      return name
+  return "other"
+
+def _scan_results_dir() -> dict:
+  by_class = {name: [] for name in ARTIFACT_POLICIES}
+  for root, _, files in os.walk(RESULTS_DIR):
+    for fn in files:
+      path = os.path.join(root, fn)
+      try:
+        st = os.stat(path)
+      except FileNotFoundError:
+        continue
+      rel = os.path.normpath(os.path.relpath(path, RESULTS_DIR))
+      if rel == fn and any(fnmatch.fnmatch(fn, pat) for pat in JANITOR_KEEP):
+        continue
+      last_used = max(st.st_mtime, st.st_atime)
+      by_class[_artifact_class(fn)].append((last_used, st.st_mtime, st.st_size, path, rel))
+  return by_class
+
+def sweep_results_dir(now=None) -> dict:
+  """One retention pass; returns {class: (files, bytes)} removed."""
+  now = now or time.time()
+  removed = {}
+  for name, entries in _scan_results_dir().items():
+    policy = ARTIFACT_POLICIES[name]
+    entries.sort()  # least recently used first
+    total = sum(e[2] for e in entries)
+    kept_files, kept_bytes = 0, 0
+    freed_files, freed_bytes = 0, 0
+    for last_used, mtime, size, path, rel in entries:
+      expired = now - last_used > policy["ttl_seconds"]
+      over_budget = total > policy["max_bytes"]
+      if (expired or over_budget) and now - mtime >= JANITOR_MIN_AGE:
+        try:
+          os.remove(path)
+          total -= size
+          freed_files += 1
+          freed_bytes += size
+          continue
+        except FileNotFoundError:
+          total -= size
+          continue
+        except OSError as e:
+          _janitor_stats["errors"] += 1
+          warn_log(f"janitor could not remove {rel}: {e}")
+      kept_files += 1
+      kept_bytes += size
+    cls = _janitor_stats["by_class"][name]
+    cls["files"], cls["bytes"] = kept_files, kept_bytes
+    cls["reclaimed_files"] += freed_files
+    cls["reclaimed_bytes"] += freed_bytes
+    if freed_files:
+      removed[name] = (freed_files, freed_bytes)
+  _remove_empty_dirs()
+  return removed
+
+def _remove_empty_dirs():
+  for root, dirs, files in os.walk(RESULTS_DIR, topdown=False):
+    if root != RESULTS_DIR and not dirs and not files:
+      try:
+        os.rmdir(root)
+      except OSError:
+        pass
+
+def _run_janitor_once():
+  with open(JANITOR_LOCK_PATH, "a") as lock_file:
+    try:
+      fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      return  # another worker is sweeping
+    t0 = time.monotonic()
+    removed = sweep_results_dir()
+    _janitor_stats["runs"] += 1
+    _janitor_stats["last_run"] = datetime.now().isoformat(timespec="seconds")
+    _janitor_stats["last_duration_ms"] = round((time.monotonic() - t0) * 1000.0, 1)
+    for files, size in removed.values():
+      _janitor_stats["reclaimed_files"] += files
+      _janitor_stats["reclaimed_bytes"] += size
+    if removed:
+      log_event(logging.INFO, "janitor sweep", removed={k: {"files": f, "bytes": b} for k, (f, b) in removed.items()},
+                duration_ms=_janitor_stats["last_duration_ms"])
+
+def _janitor_loop():
+  while True:
+    try:
+      _run_janitor_once()
+    except Exception as e:
+      _janitor_stats["errors"] += 1
+      warn_log(f"janitor sweep failed: {e}")
+    _janitor_wake.wait(JANITOR_INTERVAL)
+    _janitor_wake.clear()
+
+def ensure_janitor_started():
+  """Start the sweeper thread once per process (no-op when JANITOR_INTERVAL <= 0)."""
+  global _janitor_started
+  if _janitor_started or JANITOR_INTERVAL <= 0:
+    return
+  with _janitor_lock:
+    if not _janitor_started:
+      threading.Thread(target=_janitor_loop, name="results-janitor", daemon=True).start()
+      _janitor_started = True
+
+def wake_janitor():
+  """Ask the sweeper thread for an immediate pass."""
+  _janitor_wake.set()
+
+def janitor_stats() -> dict:
+  """Sweep counters, per-class usage and the policies in force (for /admin/janitor)."""
+  policies = {k: {"ttl_hours": v["ttl_seconds"] // 3600, "max_mb": v["max_bytes"] // (1024 * 1024)}
+              for k, v in ARTIFACT_POLICIES.items()}
+  return {**_janitor_stats, "policies": policies, "interval_seconds": JANITOR_INTERVAL}
@@ -0,0 +1,344 @@
+"""
+Open-loop load test for the OCR service, runnable on one offline Linux box.
+
+Starts the stub QR portal (stub_portal.py), then for each worker count starts
+the API under gunicorn (or the Flask server for a single worker), drives a
+weighted mix of endpoints at a Poisson arrival rate and reports throughput,
+latency percentiles, error/rejection rates and peak RSS.
+
+  python loadtest.py --cog-pdf samples/cog*.pdf --cor-pdf samples/cor*.pdf \
+      --rate 2 --duration 60 --workers 1,2,4 --portal-latency-ms 400 --portal-fail-rate 0.05
+
+Against an already running server instead (RSS sampled from --pid if given):
+
+  python loadtest.py --target http://127.0.0.1:5000 --cog-pdf ... --cor-pdf ...
+
+Latency is measured from each request's scheduled arrival time, so time spent
+waiting for a free client slot counts against the server (no coordinated omission).
+Uploads are sent with fresh=1, so every one runs the full pipeline instead of
+hitting the record store or portal cache (--reuse turns that off). A started
+server gets its own temporary RESULTS_DIR and RECORDS_DB_PATH.
+"""
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import stub_portal
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MIX = "upload_grade_pdf=3,upload_registration_summary_pdf=3,validate_grade_tamper=2,validate_cross_fields=2"
+PDF_ENDPOINTS = {
+  "upload_grade_pdf": "cog",
+  "upload_registration_summary_pdf": "cor",
+}
+GET_ENDPOINTS = {"validate_grade_tamper", "validate_cross_fields"}
+
+# --- HTTP ---
+def multipart_body(field, filename, data, content_type="application/pdf"):
+  boundary = uuid.uuid4().hex
+  head = (
+    f"--{boundary}\r\n"
+    f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+    f"Content-Type: {content_type}\r\n\r\n"
+  ).encode()
+  return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+def send(base_url, endpoint, samples, timeout, fresh=True):
+  url = f"{base_url}/{endpoint}"
+  if endpoint in GET_ENDPOINTS:
+    req = urllib.request.Request(url, method="GET")
+  else:
+    if fresh:
+      url += "?fresh=1"
+    path = random.choice(samples[PDF_ENDPOINTS[endpoint]])
+    with open(path, "rb") as f:
+      body, ctype = multipart_body("pdf", os.path.basename(path), f.read())
+    req = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": ctype})
+  try:
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+      resp.read()
+      return resp.status
+  except urllib.error.HTTPError as e:
+    return e.code
+  except Exception:
+    return 0  # connection error / client timeout
+
+def wait_for_port(host, port, timeout=60.0):
+  end = time.time() + timeout
+  while time.time() < end:
+    try:
+      with socket.create_connection((host, port), timeout=1):
+        return True
+    except OSError:
+      time.sleep(0.2)
+  return False
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    return s.getsockname()[1]
+
+# --- RSS sampling (Linux /proc) ---
+def _rss_kb(pid):
+  try:
+    with open(f"/proc/{pid}/status", "r") as f:
+      for line in f:
+        if line.startswith("VmRSS:"):
+          return int(line.split()[1])
+  except OSError:
+    pass
+  return 0
+
+def _process_tree(root_pid):
+  children = {}
+  for entry in os.listdir("/proc"):
+    if not entry.isdigit():
+      continue
+    try:
+      with open(f"/proc/{entry}/stat", "r") as f:
+        ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+      continue
+    children.setdefault(ppid, []).append(int(entry))
+  tree, stack = [], [root_pid]
+  while stack:
+    pid = stack.pop()
+    tree.append(pid)
+    stack.extend(children.get(pid, []))
+  return tree
+
+class RssSampler:
+  """Peak RSS of the server process tree (workers, chromedriver, Chrome, tesseract)."""
+
+  def __init__(self, root_pid, interval=0.5):
+    self.root_pid = root_pid
+    self.interval = interval
+    self.peak_total_kb = 0
+    self.peak_process_kb = 0
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+
+  def _run(self):
+    while not self._stop.is_set():
+      sizes = [_rss_kb(pid) for pid in _process_tree(self.root_pid)]
+      if sizes:
+        self.peak_total_kb = max(self.peak_total_kb, sum(sizes))
+        self.peak_process_kb = max(self.peak_process_kb, max(sizes))
+      self._stop.wait(self.interval)
+
+  def __enter__(self):
+    if self.root_pid:
+      self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self._stop.set()
+    if self._thread.is_alive():
+      self._thread.join()
+
+# --- Server under test ---
+def start_server(workers, threads, port, env):
+  if shutil.which("gunicorn"):
+    cmd = ["gunicorn", "-w", str(workers), "--threads", str(threads), "-t", "300",
+           "-b", f"127.0.0.1:{port}", "app:app"]
+  elif workers == 1:
+    cmd = [sys.executable, "-c",
+           f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True, debug=False)"]
+  else:
+    raise SystemExit("gunicorn is required for --workers > 1")
+  log = tempfile.NamedTemporaryFile(prefix=f"loadtest_server_w{workers}_", suffix=".log", delete=False)
+  proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+  if not wait_for_port("127.0.0.1", port):
+    proc.kill()
+    raise SystemExit(f"server did not come up, see {log.name}")
+  return proc, log.name
+
+def stop_server(proc):
+  proc.terminate()
+  try:
+    proc.wait(timeout=20)
+  except subprocess.TimeoutExpired:
+    proc.kill()
+
+# --- Load generation ---
+def parse_mix(spec):
+  mix = {}
+  for part in spec.split(","):
+    name, _, weight = part.partition("=")
+    name = name.strip()
+    if name not in PDF_ENDPOINTS and name not in GET_ENDPOINTS:
+      raise SystemExit(f"unknown endpoint in --mix: {name}")
+    mix[name] = float(weight or 1)
+  return mix
+
+def percentile(sorted_values, pct):
+  if not sorted_values:
+    return None
+  k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+  return sorted_values[k]
+
+def run_load(base_url, mix, samples, rate, duration, max_inflight, timeout, fresh=True):
+  names = list(mix)
+  weights = [mix[n] for n in names]
+  results = []  # (endpoint, status, latency_s)
+  lock = threading.Lock()
+
+  def one(endpoint, scheduled):
+    status = send(base_url, endpoint, samples, timeout, fresh)
+    with lock:
+      results.append((endpoint, status, time.monotonic() - scheduled))
+
+  started = time.monotonic()
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max_inflight) as pool:
+    at = started
+    while True:
+      at += random.expovariate(rate)
+      if at - started >= duration:
+        break
+      delay = at - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+      pool.submit(one, random.choices(names, weights)[0], at)
+  wall = time.monotonic() - started
+  return results, wall
+
+def summarize(results, wall):
+  def block(rows):
+    lat = sorted(r[2] for r in rows)
+    ok = sum(1 for r in rows if 200 <= r[1] < 300)
+    rejected = sum(1 for r in rows if r[1] in (429, 503))
+    errors = len(rows) - ok - rejected
+    return {
+      "requests": len(rows),
+      "ok": ok,
+      "rejected": rejected,
+      "errors": errors,
+      "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+      "throughput_rps": round(ok / wall, 3) if wall else 0.0,
+      "p50_ms": round(percentile(lat, 50) * 1000) if lat else None,
+      "p90_ms": round(percentile(lat, 90) * 1000) if lat else None,
+      "p99_ms": round(percentile(lat, 99) * 1000) if lat else None,
+      "max_ms": round(lat[-1] * 1000) if lat else None,
+    }
+
+  per_endpoint = {}
+  for r in results:
+    per_endpoint.setdefault(r[0], []).append(r)
+  return {"overall": block(results), "endpoints": {k: block(v) for k, v in sorted(per_endpoint.items())}}
+
+def print_report(label, summary, rss):
+  o = summary["overall"]
+  print(f"\n== {label} ==")
+  print(f"  {o['requests']} requests, {o['throughput_rps']} ok/s, "
+        f"errors {o['errors']} ({o['error_rate']:.1%}), rejected {o['rejected']}")
+  if rss:
+    print(f"  peak RSS: {rss['peak_total_mb']} MB total, {rss['peak_process_mb']} MB largest process")
+  print(f"  {'endpoint':34} {'n':>5} {'ok':>5} {'rej':>4} {'err':>4} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}")
+  for name, b in summary["endpoints"].items():
+    print(f"  {name:34} {b['requests']:>5} {b['ok']:>5} {b['rejected']:>4} {b['errors']:>4} "
+          f"{b['p50_ms']:>7} {b['p90_ms']:>7} {b['p99_ms']:>7} {b['max_ms']:>7}")
+
+def expand(patterns):
+  paths = []
+  for p in patterns or []:
+    paths.extend(sorted(glob.glob(p)) or [p])
+  return [p for p in paths if os.path.isfile(p)]
+
+def main():
+  ap = argparse.ArgumentParser(description="Load test the OCR API with a stub QR portal")
+  ap.add_argument("--cog-pdf", nargs="+", default=[], help="COG sample PDFs (globs ok)")
+  ap.add_argument("--cor-pdf", nargs="+", default=[], help="COR sample PDFs (globs ok)")
+  ap.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,...")
+  ap.add_argument("--rate", type=float, default=1.0, help="mean arrivals per second")
+  ap.add_argument("--duration", type=float, default=60.0, help="seconds of arrivals per run")
+  ap.add_argument("--max-inflight", type=int, default=64, help="client-side concurrency cap")
+  ap.add_argument("--timeout", type=float, default=180.0, help="client timeout per request (s)")
+  ap.add_argument("--workers", default="1", help="comma-separated server worker counts to compare")
+  ap.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+  ap.add_argument("--reuse", action="store_true", help="let uploads hit stored records and the portal cache")
+  ap.add_argument("--target", help="use an already running server instead of starting one")
+  ap.add_argument("--pid", type=int, help="server pid for RSS sampling with --target")
+  ap.add_argument("--portal-port", type=int, default=0)
+  ap.add_argument("--portal-latency-ms", type=float, default=300.0)
+  ap.add_argument("--portal-jitter-ms", type=float, default=100.0)
+  ap.add_argument("--portal-fail-rate", type=float, default=0.0)
+  ap.add_argument("--seed", type=int)
+  ap.add_argument("--json", help="also write the report here")
+  args = ap.parse_args()
+
+  if args.seed is not None:
+    random.seed(args.seed)
+  mix = parse_mix(args.mix)
+  samples = {"cog": expand(args.cog_pdf), "cor": expand(args.cor_pdf)}
+  for name in mix:
+    kind = PDF_ENDPOINTS.get(name)
+    if kind and not samples[kind]:
+      raise SystemExit(f"--mix includes {name} but no --{kind}-pdf samples were given")
+
+  portal_port = args.portal_port or free_port()
+  portal = stub_portal.serve(port=portal_port, latency_ms=args.portal_latency_ms,
+                             jitter_ms=args.portal_jitter_ms, fail_rate=args.portal_fail_rate)
+  report = {"config": {k: v for k, v in vars(args).items()}, "runs": []}
+
+  try:
+    if args.target:
+      runs = [(None, args.target.rstrip("/"))]
+    else:
+      runs = [(int(w), None) for w in args.workers.split(",")]
+
+    for workers, target in runs:
+      proc = state_dir = None
+      if target is None:
+        port = free_port()
+        # Never write into the production results/ and record store
+        state_dir = tempfile.mkdtemp(prefix=f"loadtest_state_w{workers}_")
+        env = dict(os.environ, PORTAL_BASE_OVERRIDE=f"http://127.0.0.1:{portal_port}",
+                   RESULTS_DIR=os.path.join(state_dir, "results"),
+                   RECORDS_DB_PATH=os.path.join(state_dir, "student_records.sqlite3"))
+        proc, log_path = start_server(workers, args.threads, port, env)
+        target = f"http://127.0.0.1:{port}"
+        print(f"started {workers} worker(s) on {target} (log: {log_path})")
+      try:
+        with RssSampler(proc.pid if proc else args.pid) as rss:
+          results, wall = run_load(target, mix, samples, args.rate, args.duration,
+                                   args.max_inflight, args.timeout, fresh=not args.reuse)
+      finally:
+        if proc:
+          stop_server(proc)
+        if state_dir:
+          shutil.rmtree(state_dir, ignore_errors=True)
+
+      summary = summarize(results, wall)
+      rss_info = None
+      if rss.peak_total_kb:
+        rss_info = {"peak_total_mb": round(rss.peak_total_kb / 1024, 1),
+                    "peak_process_mb": round(rss.peak_process_kb / 1024, 1)}
+      label = f"{workers} worker(s)" if workers else target
+      print_report(label, summary, rss_info)
+      report["runs"].append({"workers": workers, "target": target, "wall_seconds": round(wall, 2),
+                             "summary": summary, "rss": rss_info})
+  finally:
+    portal.shutdown()
+
+  report["portal"] = portal.stats.snapshot()
+  print(f"\nstub portal: {report['portal']}")
+  if args.json:
+    with open(args.json, "w", encoding="utf-8") as f:
+      json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,80 @@
+"""
+Non-blocking structured logging for the OCR API.
+
+Callers only enqueue records; a QueueListener thread formats and writes them,
+so a slow stdout never blocks a worker. The queue is bounded and drops (and
+counts) records rather than block when it is full.
+
+This module knows nothing about Flask: app.py adds a filter to `log` that
+tags every record with the current request and drops the debug lines of
+requests not picked for verbose logging.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime
+
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()  # json | text
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+class JsonLogFormatter(logging.Formatter):
+  def format(self, record):
+    out = {
+      "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+      "level": record.levelname.lower(),
+      "msg": record.getMessage(),
+    }
+    out.update(getattr(record, "fields", {}))
+    if record.exc_info:
+      out["exc"] = self.formatException(record.exc_info)
+    return json.dumps(out, default=str)
+
+class TextLogFormatter(logging.Formatter):
+  def format(self, record):
+    fields = getattr(record, "fields", {})
+    rid = fields.get("request_id")
+    extra = " ".join(f"{k}={v}" for k, v in fields.items() if k not in ("request_id", "endpoint"))
+    stamp = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+    return f"[{record.levelname} {stamp}]" + (f" [{rid}]" if rid else "") + f" {record.getMessage()}" + (f" ({extra})" if extra else "")
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+  dropped = 0
+
+  def prepare(self, record):
+    # Message is rendered on the listener thread; only freeze the args here
+    record.msg = record.getMessage()
+    record.args = None
+    return record
+
+  def enqueue(self, record):
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      DroppingQueueHandler.dropped += 1
+
+log = logging.getLogger("ocr_api")
+log.setLevel(logging.DEBUG)
+log.propagate = False
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_log_stream = logging.StreamHandler(sys.stdout)
+_log_stream.setFormatter(JsonLogFormatter() if LOG_FORMAT == "json" else TextLogFormatter())
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream, respect_handler_level=False)
+log.addHandler(DroppingQueueHandler(_log_queue))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+def log_event(level: int, message: str, **fields):
+  """Structured log line (stage=, duration_ms= etc. as fields)."""
+  log.log(level, message, extra={"fields": fields})
+
+def debug_log(message: str, **fields):
+  """Verbose stage logging (sampled per request via LOG_VERBOSE_SAMPLE_RATE)."""
+  log_event(logging.DEBUG, message, **fields)
+
+def warn_log(message: str, **fields):
+  """Failures worth seeing on every request (never sampled)."""
+  log_event(logging.WARNING, message, **fields)
@@ -0,0 +1,165 @@
+"""
+QR portal verification client: the machinery around every tamper check
+against the university grade portal.
+
+- a small pool of warm headless browsers (reused sessions keep their
+  connections to the portal host alive instead of cold-starting Chrome)
+- a TTL cache of portal text per QR URL (re-uploads hit it)
+- a per-host circuit breaker: after repeated failures the portal is
+  skipped for a cool-down and verifications are queued for a retry worker
+
+Starting Chrome, loading the page and OCR'ing it stay in app.py
+(fetch_portal_text); BrowserPool is handed the launch and quit functions.
+"""
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from common import env_int
+from ocrlog import warn_log
+
+PORTAL_POOL_SIZE = env_int("PORTAL_POOL_SIZE", 2)
+PORTAL_BROWSER_MAX_USES = env_int("PORTAL_BROWSER_MAX_USES", 50)
+PORTAL_CACHE_TTL = env_int("PORTAL_CACHE_TTL", 600)
+PORTAL_CACHE_MAX = env_int("PORTAL_CACHE_MAX", 1000)
+PORTAL_BREAKER_FAILURES = env_int("PORTAL_BREAKER_FAILURES", 3)
+PORTAL_BREAKER_COOLDOWN = env_int("PORTAL_BREAKER_COOLDOWN", 60)
+PORTAL_RETRY_INTERVAL = env_int("PORTAL_RETRY_INTERVAL", 30)
+PORTAL_RETRY_MAX_ATTEMPTS = env_int("PORTAL_RETRY_MAX_ATTEMPTS", 20)
+# Load tests: send every QR URL to a local stub portal (scheme://host[:port]) instead
+PORTAL_BASE_OVERRIDE = os.environ.get("PORTAL_BASE_OVERRIDE", "").rstrip("/")
+
+class PortalUnavailable(Exception):
+  def __init__(self, host, retry_after):
+    super().__init__(f"QR portal {host} unavailable (circuit open)")
+    self.host = host
+    self.retry_after = max(1, int(retry_after))
+
+_portal_cache = OrderedDict()  # qr_url -> (expires_at, raw_text)
+_portal_lock = threading.Lock()
+_portal_breakers = {}  # host -> {"failures", "opened_at", "trial_in_flight"}
+_portal_stats = {"fetches": 0, "cache_hits": 0, "failures": 0, "short_circuited": 0, "browsers_launched": 0}
+
+def portal_host(url: str) -> str:
+  return urlparse(url).netloc.lower()
+
+def portal_page_url(qr_url: str) -> str:
+  if not PORTAL_BASE_OVERRIDE:
+    return qr_url
+  u = urlparse(qr_url)
+  return PORTAL_BASE_OVERRIDE + (u.path or "/") + (f"?{u.query}" if u.query else "")
+
+def note_portal_stat(name: str):
+  with _portal_lock:
+    _portal_stats[name] += 1
+
+def portal_breaker_before_call(host: str):
+  """Raises PortalUnavailable while `host`'s circuit is open."""
+  with _portal_lock:
+    b = _portal_breakers.setdefault(host, {"failures": 0, "opened_at": None, "trial_in_flight": False})
+    if b["opened_at"] is None:
+      return
+    wait = b["opened_at"] + PORTAL_BREAKER_COOLDOWN - time.time()
+    if wait > 0 or b["trial_in_flight"]:
+      _portal_stats["short_circuited"] += 1
+      raise PortalUnavailable(host, wait if wait > 0 else 5)
+    b["trial_in_flight"] = True  # half-open: let exactly one call probe the portal
+
+def portal_breaker_after_call(host: str, ok):
+  """ok: the portal answered (True) or failed (False); None = the call said nothing about the portal."""
+  with _portal_lock:
+    b = _portal_breakers.setdefault(host, {"failures": 0, "opened_at": None, "trial_in_flight": False})
+    b["trial_in_flight"] = False
+    if ok is None:
+      return
+    if ok:
+      b["failures"] = 0
+      b["opened_at"] = None
+      return
+    _portal_stats["failures"] += 1
+    b["failures"] += 1
+    if b["failures"] >= PORTAL_BREAKER_FAILURES:
+      if b["opened_at"] is None:
+        warn_log(f"QR portal circuit opened for {host}")
+      b["opened_at"] = time.time()
+
+def portal_cache_get(qr_url: str):
+  with _portal_lock:
+    entry = _portal_cache.get(qr_url)
+    if entry is None:
+      return None
+    if entry[0] < time.time():
+      del _portal_cache[qr_url]
+      return None
+    _portal_cache.move_to_end(qr_url)
+    _portal_stats["cache_hits"] += 1
+    return entry[1]
+
+def portal_cache_put(qr_url: str, raw_text: str):
+  with _portal_lock:
+    _portal_cache[qr_url] = (time.time() + PORTAL_CACHE_TTL, raw_text)
+    _portal_cache.move_to_end(qr_url)
+    while len(_portal_cache) > PORTAL_CACHE_MAX:
+      _portal_cache.popitem(last=False)
+
+def portal_client_stats() -> dict:
+  """Counters, cache size and breaker states (for /admin/portal)."""
+  with _portal_lock:
+    return {
+      "stats": dict(_portal_stats),
+      "cache_entries": len(_portal_cache),
+      "breakers": {h: {**b, "open": b["opened_at"] is not None} for h, b in _portal_breakers.items()},
+    }
+
+class BrowserPool:
+  """
+  At most `size` browsers in use at once. Idle ones are reused, newest first,
+  until they have served `max_uses` fetches. launch() -> driver, quit(driver).
+  """
+
+  def __init__(self, size, max_uses, launch, quit):
+    self.max_uses = max_uses
+    self._launch = launch
+    self._quit = quit
+    self._idle = queue.LifoQueue()  # (driver, uses)
+    self._slots = threading.BoundedSemaphore(size)
+
+  def checkout(self, timeout):
+    """(driver, uses), or None when no slot freed up within `timeout` seconds."""
+    if not self._slots.acquire(timeout=timeout):
+      return None
+    try:
+      return self._idle.get_nowait()
+    except queue.Empty:
+      pass
+    try:
+      driver = self._launch()
+    except Exception:
+      self._slots.release()
+      raise
+    note_portal_stat("browsers_launched")
+    return driver, 0
+
+  def checkin(self, driver, uses, healthy):
+    """Return a checked-out browser; a broken or worn-out one is quit instead."""
+    try:
+      if healthy and uses + 1 < self.max_uses:
+        self._idle.put((driver, uses + 1))
+      else:
+        self._quit(driver)
+    finally:
+      self._slots.release()
+
+  def idle_count(self) -> int:
+    return self._idle.qsize()
+
+  def shutdown(self, **quit_kwargs):
+    while True:
+      try:
+        driver, _ = self._idle.get_nowait()
+      except queue.Empty:
+        return
+      self._quit(driver, **quit_kwargs)
@@ -0,0 +1,143 @@
+"""
+Per-request profile capture and the on-disk profile index.
+
+cprofile: deterministic, the request thread only, one request at a time
+(saved as .prof for pstats/snakeviz).
+sample: a shared sampler thread records the request thread's stack every
+PROFILE_INTERVAL_MS (saved as .folded, flamegraph.pl / speedscope format).
+
+Which requests get profiled, and the metadata saved with them, is decided
+by app.py's request hooks.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from common import RESULTS_DIR, env_int, atomic_write_text
+from ocrlog import debug_log
+
+PROFILES_DIR = os.environ.get("PROFILES_DIR", os.path.join(os.path.dirname(RESULTS_DIR), "profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0") or 0)
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0") or 0)
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "10") or 10)
+PROFILE_KEEP = env_int("PROFILE_KEEP", 200)
+PROFILE_MAX_DEPTH = 64
+
+_cprofile_lock = threading.Lock()  # cProfile/sys.setprofile cannot nest across requests
+_sampled_threads = {}  # thread ident -> {collapsed stack: count}
+_sampler_lock = threading.Lock()
+_sampler_wake = threading.Event()
+_sampler_started = False
+
+def start_cprofile():
+  """An enabled cProfile.Profile, or None while another request is being cProfiled."""
+  if not _cprofile_lock.acquire(blocking=False):
+    return None
+  profile = cProfile.Profile()
+  profile.enable()
+  return profile
+
+def stop_cprofile(profile):
+  profile.disable()
+  _cprofile_lock.release()
+
+def _collapse_stack(frame) -> str:
+  parts = []
+  while frame is not None and len(parts) < PROFILE_MAX_DEPTH:
+    code = frame.f_code
+    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+    frame = frame.f_back
+  return ";".join(reversed(parts))
+
+def _sampler_loop():
+  interval = PROFILE_INTERVAL_MS / 1000.0
+  while True:
+    if not _sampled_threads:
+      _sampler_wake.wait()
+      _sampler_wake.clear()
+      continue
+    frames = sys._current_frames()
+    with _sampler_lock:
+      for ident, counts in _sampled_threads.items():
+        frame = frames.get(ident)
+        if frame is not None:
+          key = _collapse_stack(frame)
+          counts[key] = counts.get(key, 0) + 1
+    del frames
+    time.sleep(interval)
+
+def start_sampling(ident):
+  global _sampler_started
+  with _sampler_lock:
+    _sampled_threads[ident] = {}
+    if not _sampler_started:
+      threading.Thread(target=_sampler_loop, name="profile-sampler", daemon=True).start()
+      _sampler_started = True
+  _sampler_wake.set()
+
+def stop_sampling(ident) -> dict:
+  """{collapsed stack: samples} recorded for the thread since start_sampling()."""
+  with _sampler_lock:
+    return _sampled_threads.pop(ident, {})
+
+def save_profile(mode, stats, meta) -> dict:
+  """
+  Write a profile (.prof or .folded) plus its .json metadata, then keep only
+  the newest PROFILE_KEEP. `meta` must carry the request's "endpoint".
+  """
+  os.makedirs(PROFILES_DIR, exist_ok=True)
+  name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{meta['endpoint']}_{uuid.uuid4().hex[:8]}"
+  if mode == "cprofile":
+    data_file = f"{name}.prof"
+    stats.dump_stats(os.path.join(PROFILES_DIR, data_file))
+  else:
+    data_file = f"{name}.folded"
+    atomic_write_text(os.path.join(PROFILES_DIR, data_file),
+                      "".join(f"{stack} {n}\n" for stack, n in sorted(stats.items())))
+  meta = {
+    "name": name,
+    "file": data_file,
+    "mode": mode,
+    **meta,
+    "samples": sum(stats.values()) if mode == "sample" else None,
+    "created_at": datetime.now().isoformat(timespec="seconds")
+  }
+  atomic_write_text(os.path.join(PROFILES_DIR, f"{name}.json"), json.dumps(meta, indent=2))
+  debug_log(f"profile saved: {data_file} ({mode}, {meta.get('elapsed_ms')} ms)")
+  prune_profiles()
+  return meta
+
+def _list_profiles() -> list:
+  if not os.path.isdir(PROFILES_DIR):
+    return []
+  return sorted((f for f in os.listdir(PROFILES_DIR) if f.endswith(".json")), reverse=True)
+
+def prune_profiles():
+  for meta_file in _list_profiles()[PROFILE_KEEP:]:
+    base = meta_file[:-len(".json")]
+    for ext in (".json", ".prof", ".folded"):
+      try:
+        os.remove(os.path.join(PROFILES_DIR, base + ext))
+      except FileNotFoundError:
+        pass
+
+def profile_index(endpoint=None, limit=50) -> list:
+  """Metadata of saved profiles, newest first, optionally for one endpoint."""
+  out = []
+  for meta_file in _list_profiles():
+    try:
+      with open(os.path.join(PROFILES_DIR, meta_file), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    except (OSError, ValueError):
+      continue
+    if endpoint and meta.get("endpoint") != endpoint:
+      continue
+    out.append(meta)
+    if len(out) >= limit:
+      break
+  return out
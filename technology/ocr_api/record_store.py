@@ -0,0 +1,248 @@
+"""
+Local store of verified, parsed COGs (SQLite).
+
+Records are keyed by SR code + academic year + semester; every document hash
+seen for a record links to it, so a re-upload of a document we already
+verified short-circuits to the stored record.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+
+from common import RESULTS_DIR
+
+RECORDS_DB_PATH = os.environ.get(
+  "RECORDS_DB_PATH",
+  os.path.join(os.path.dirname(RESULTS_DIR), "student_records.sqlite3")
+)
+
+_records_local = threading.local()
+
+RECORDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cog_records (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  sr_code TEXT NOT NULL,
+  academic_year TEXT NOT NULL,
+  semester TEXT NOT NULL,
+  year_level TEXT NOT NULL DEFAULT '',
+  qr_url TEXT,
+  raw_text TEXT NOT NULL,
+  grades_json TEXT NOT NULL,
+  webpage_grades_json TEXT NOT NULL,
+  rows_json TEXT NOT NULL,
+  gwa_json TEXT NOT NULL,
+  verified_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_cog_records_term ON cog_records(sr_code, academic_year, semester);
+CREATE TABLE IF NOT EXISTS cog_documents (
+  doc_sha256 TEXT PRIMARY KEY,
+  record_id INTEGER NOT NULL REFERENCES cog_records(id) ON DELETE CASCADE,
+  seen_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_cog_documents_record ON cog_documents(record_id);
+CREATE TABLE IF NOT EXISTS doc_phashes (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL,
+  phash TEXT NOT NULL,
+  qr_url TEXT NOT NULL,
+  record_id INTEGER REFERENCES cog_records(id) ON DELETE CASCADE,
+  payload_json TEXT,
+  created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_doc_phashes_kind ON doc_phashes(kind, id);
+CREATE TABLE IF NOT EXISTS pending_verifications (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  qr_url TEXT NOT NULL,
+  doc_sha256 TEXT NOT NULL,
+  raw_text TEXT NOT NULL,
+  grades_json TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  record_id INTEGER,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_pending_verifications_status ON pending_verifications(status, id);
+"""
+
+def records_db():
+  """One connection per thread (sqlite3 connections are not shareable across threads)."""
+  conn = getattr(_records_local, "conn", None)
+  if conn is None:
+    conn = sqlite3.connect(RECORDS_DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(RECORDS_SCHEMA)
+    _records_local.conn = conn
+  return conn
+
+def _record_to_dict(row) -> dict:
+  return {
+    "record_id": row["id"],
+    "sr_code": row["sr_code"],
+    "academic_year": row["academic_year"],
+    "semester": row["semester"],
+    "year_level": row["year_level"],
+    "qr_url": row["qr_url"],
+    "raw_text": row["raw_text"],
+    "grades": json.loads(row["grades_json"]),
+    "webpage_grades": json.loads(row["webpage_grades_json"]),
+    "rows": json.loads(row["rows_json"]),
+    "gwa": json.loads(row["gwa_json"]),
+    "verified_at": row["verified_at"]
+  }
+
+def find_record_by_document(doc_sha256: str) -> dict | None:
+  row = records_db().execute(
+    "SELECT r.* FROM cog_documents d JOIN cog_records r ON r.id = d.record_id WHERE d.doc_sha256 = ?",
+    (doc_sha256,)
+  ).fetchone()
+  return _record_to_dict(row) if row else None
+
+def save_verified_record(doc_sha256, fields, raw_text, grades, webpage_grades, gwa, qr_url=None) -> int | None:
+  """
+  Upsert the verified COG for its (SR code, academic year, semester) and link the
+  document hash to it. `fields` are the COG header fields (parse_from_cog()).
+  Returns the record id, or None when the fields needed for the key are missing.
+  """
+  if not (fields["sr_code"] and fields["academic_year"] and fields["semester"]):
+    return None
+  now = datetime.now().isoformat(timespec="seconds")
+  conn = records_db()
+  with conn:
+    conn.execute(
+      """INSERT INTO cog_records (sr_code, academic_year, semester, year_level, qr_url, raw_text,
+                                  grades_json, webpage_grades_json, rows_json, gwa_json, verified_at)
+         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+         ON CONFLICT(sr_code, academic_year, semester) DO UPDATE SET
+           year_level = excluded.year_level, qr_url = excluded.qr_url, raw_text = excluded.raw_text,
+           grades_json = excluded.grades_json, webpage_grades_json = excluded.webpage_grades_json,
+           rows_json = excluded.rows_json, gwa_json = excluded.gwa_json, verified_at = excluded.verified_at""",
+      (fields["sr_code"], fields["academic_year"], fields["semester"], fields["year_level"], qr_url, raw_text,
+       json.dumps(grades), json.dumps(webpage_grades), json.dumps(gwa["rows"]),
+       json.dumps({k: v for k, v in gwa.items() if k != "rows"}), now)
+    )
+    record_id = conn.execute(
+      "SELECT id FROM cog_records WHERE sr_code = ? AND academic_year = ? AND semester = ?",
+      (fields["sr_code"], fields["academic_year"], fields["semester"])
+    ).fetchone()["id"]
+    conn.execute(
+      "INSERT OR REPLACE INTO cog_documents (doc_sha256, record_id, seen_at) VALUES (?, ?, ?)",
+      (doc_sha256, record_id, now)
+    )
+  return record_id
+
+def get_student_records(sr_code: str) -> list:
+  """Every stored term of a student, oldest first; sr_code as parse_from_cog() emits it."""
+  rows = records_db().execute(
+    "SELECT * FROM cog_records WHERE sr_code = ? ORDER BY academic_year, semester",
+    (sr_code,)
+  ).fetchall()
+  return [_record_to_dict(r) for r in rows]
+
+def get_record_by_id(record_id: int) -> dict | None:
+  row = records_db().execute("SELECT * FROM cog_records WHERE id = ?", (record_id,)).fetchone()
+  return _record_to_dict(row) if row else None
+
+# --- Perceptual-hash index for re-scanned / re-photographed documents ---
+# Page hashes (app.compute_dhash) of recent uploads per kind, with the QR
+# payload they came with. Every COG shares one template, so a near-identical
+# page hash alone would happily match two different students: a hash hit is
+# only reused when the QR payload (a per-student, per-term portal URL) is
+# identical as well.
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", "24"))
+PHASH_INDEX_SIZE = int(os.environ.get("PHASH_INDEX_SIZE", "5000"))
+
+_phash_lock = threading.Lock()
+_phash_recent = {}  # kind -> deque[(hash_int, qr_url, row_id)], newest last
+
+def _phash_bucket(kind: str):
+  """Recent hashes for `kind`, loaded from SQLite on first use in this process."""
+  bucket = _phash_recent.get(kind)
+  if bucket is None:
+    rows = records_db().execute(
+      "SELECT id, phash, qr_url FROM doc_phashes WHERE kind = ? ORDER BY id DESC LIMIT ?",
+      (kind, PHASH_INDEX_SIZE)
+    ).fetchall()
+    bucket = deque(((int(r["phash"], 16), r["qr_url"], r["id"]) for r in reversed(rows)), maxlen=PHASH_INDEX_SIZE)
+    _phash_recent[kind] = bucket
+  return bucket
+
+def find_near_duplicate(kind: str, phash: int, qr_url: str) -> dict | None:
+  """Closest recent entry within PHASH_MAX_DISTANCE whose QR payload matches, or None."""
+  if not qr_url:
+    return None
+  with _phash_lock:
+    best = None
+    for h, q, row_id in _phash_bucket(kind):
+      if q != qr_url:
+        continue
+      d = (h ^ phash).bit_count()
+      if d <= PHASH_MAX_DISTANCE and (best is None or d < best[0]):
+        best = (d, row_id)
+  if best is None:
+    return None
+  row = records_db().execute("SELECT * FROM doc_phashes WHERE id = ?", (best[1],)).fetchone()
+  if row is None:
+    return None
+  return {
+    "distance": best[0],
+    "record_id": row["record_id"],
+    "payload": json.loads(row["payload_json"]) if row["payload_json"] else None
+  }
+
+def remember_phash(kind: str, phash: int, qr_url: str, record_id=None, payload=None):
+  if not qr_url:
+    return
+  conn = records_db()
+  with conn:
+    cur = conn.execute(
+      "INSERT INTO doc_phashes (kind, phash, qr_url, record_id, payload_json, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+      (kind, f"{phash:x}", qr_url, record_id, json.dumps(payload) if payload is not None else None,
+       datetime.now().isoformat(timespec="seconds"))
+    )
+  with _phash_lock:
+    _phash_bucket(kind).append((phash, qr_url, cur.lastrowid))
+
+# --- Deferred portal verifications (retried by app.py's verification worker) ---
+def add_pending_verification(qr_url, doc_sha256, raw_text, grades) -> int:
+  now = datetime.now().isoformat(timespec="seconds")
+  conn = records_db()
+  with conn:
+    cur = conn.execute(
+      """INSERT INTO pending_verifications (qr_url, doc_sha256, raw_text, grades_json, created_at, updated_at)
+         VALUES (?, ?, ?, ?, ?, ?)""",
+      (qr_url, doc_sha256, raw_text, json.dumps(grades), now, now)
+    )
+  return cur.lastrowid
+
+def pending_verifications(limit=20) -> list:
+  """Oldest pending rows: id, qr_url, doc_sha256, raw_text, grades_json, attempts, ..."""
+  return records_db().execute(
+    "SELECT * FROM pending_verifications WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,)
+  ).fetchall()
+
+def finish_verification_attempt(verification_id, status, record_id=None):
+  conn = records_db()
+  with conn:
+    conn.execute(
+      "UPDATE pending_verifications SET status = ?, attempts = attempts + 1, record_id = ?, updated_at = ? WHERE id = ?",
+      (status, record_id, datetime.now().isoformat(timespec="seconds"), verification_id)
+    )
+
+def get_verification(verification_id) -> dict | None:
+  row = records_db().execute(
+    "SELECT id, status, attempts, record_id, created_at, updated_at FROM pending_verifications WHERE id = ?",
+    (verification_id,)
+  ).fetchone()
+  return dict(row) if row else None
+
+def count_pending_verifications() -> int:
+  return records_db().execute(
+    "SELECT COUNT(*) AS n FROM pending_verifications WHERE status = 'pending'"
+  ).fetchone()["n"]
@@ -0,0 +1,126 @@
+"""
+Local stand-in for the university grade portal behind COG QR codes.
+
+Serves a "Student's Copy of Grades" page for any path, with configurable
+latency and failure rate, so the OCR service can be load tested offline:
+
+  python stub_portal.py --port 8765 --latency-ms 300 --jitter-ms 200 --fail-rate 0.05
+  PORTAL_BASE_OVERRIDE=http://127.0.0.1:8765 python app.py
+
+Grades come from --grades (JSON list of {code, title, units, grade}) or the
+built-in sample below, which matches the sample COG in results/.
+"""
+import argparse
+import html
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_GRADES = [
+  {"code": "BAT 401", "title": "Fundamentals of Business Analytics", "units": 3, "grade": "2.50"},
+  {"code": "BAT 402", "title": "Fundamentals of Analytics Modeling", "units": 3, "grade": "2.00"},
+  {"code": "GEd 107", "title": "Ethics", "units": 3, "grade": "2.50"},
+  {"code": "IT 311", "title": "Systems Administration and Maintenance", "units": 3, "grade": "1.75"},
+  {"code": "IT 312", "title": "Systems Integration and Architecture", "units": 3, "grade": "2.00"},
+  {"code": "IT 313", "title": "System Analysis and Design", "units": 3, "grade": "2.25"},
+  {"code": "IT 314", "title": "Web Systems and Technologies", "units": 3, "grade": "2.00"},
+]
+
+PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Student's Copy of Grades</title>
+<style>
+body {{ font-family: Arial, sans-serif; font-size: 15px; background: #fff; color: #000; margin: 24px; }}
+td, th {{ padding: 4px 10px; text-align: left; }}
+</style></head>
+<body>
+<h3>Student's Copy of Grades</h3>
+<table>
+<tr><th>#</th><th>Course Code</th><th>Course Title</th><th>Units</th><th>Grade</th></tr>
+{rows}
+</table>
+</body></html>
+"""
+
+class PortalStats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.served = 0
+    self.failed = 0
+
+  def snapshot(self):
+    with self.lock:
+      return {"served": self.served, "failed": self.failed}
+
+def render_page(grades):
+  rows = "\n".join(
+    f"<tr><td>{i}</td><td>{html.escape(g['code'])}</td><td>{html.escape(g['title'])}</td>"
+    f"<td>{g['units']}</td><td>{html.escape(str(g['grade']))}</td></tr>"
+    for i, g in enumerate(grades, start=1)
+  )
+  return PAGE.format(rows=rows).encode("utf-8")
+
+def make_handler(page: bytes, latency_ms: float, jitter_ms: float, fail_rate: float, stats: PortalStats):
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+      pass
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8"):
+      self.send_response(status)
+      self.send_header("Content-Type", content_type)
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def do_GET(self):
+      if self.path == "/__stats":
+        return self._send(200, json.dumps(stats.snapshot()).encode(), "application/json")
+      time.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000.0)
+      if random.random() < fail_rate:
+        with stats.lock:
+          stats.failed += 1
+        return self._send(503, b"<h1>Service Unavailable</h1>")
+      with stats.lock:
+        stats.served += 1
+      self._send(200, page)
+
+  return Handler
+
+def serve(host="127.0.0.1", port=8765, latency_ms=300.0, jitter_ms=0.0, fail_rate=0.0, grades=None):
+  """Start the stub in a background thread; returns the server (call .shutdown() to stop)."""
+  stats = PortalStats()
+  handler = make_handler(render_page(grades or SAMPLE_GRADES), latency_ms, jitter_ms, fail_rate, stats)
+  server = ThreadingHTTPServer((host, port), handler)
+  server.daemon_threads = True
+  server.stats = stats
+  threading.Thread(target=server.serve_forever, name="stub-portal", daemon=True).start()
+  return server
+
+def main():
+  ap = argparse.ArgumentParser(description="Stub QR grade portal for offline load tests")
+  ap.add_argument("--host", default="127.0.0.1")
+  ap.add_argument("--port", type=int, default=8765)
+  ap.add_argument("--latency-ms", type=float, default=300.0)
+  ap.add_argument("--jitter-ms", type=float, default=0.0)
+  ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+  ap.add_argument("--grades", help="JSON file with a list of {code, title, units, grade}")
+  args = ap.parse_args()
+
+  grades = None
+  if args.grades:
+    with open(args.grades, "r", encoding="utf-8") as f:
+      grades = json.load(f)
+  server = serve(args.host, args.port, args.latency_ms, args.jitter_ms, args.fail_rate, grades)
+  print(f"stub portal on http://{args.host}:{args.port} "
+        f"(latency {args.latency_ms}±{args.jitter_ms} ms, fail rate {args.fail_rate})")
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    server.shutdown()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The service modules are imported by file name, the way app.py and batch.py do it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Module defaults point at /opt/ocr_api; keep every test on throwaway state
+os.environ.setdefault("RESULTS_DIR", os.path.join(tempfile.mkdtemp(prefix="ocr_api_tests-"), "results"))
+
+import curriculum
+import record_store
+
+CATALOG = {
+  "version": "test",
+  "programs": {
+    "BS Information Technology": {
+      "ALL": {
+        "FIRST": {
+          "FIRST": [{"code": "NSTP 111", "units": 3, "title": "National Service Training Program 1"}]
+        },
+        "THIRD": {
+          "SECOND": [
+            {"code": "IT 321", "units": 3, "title": "Human-Computer Interaction"},
+            {"code": "IT 324", "units": 3, "title": "Capstone Project 1"}
+          ]
+        }
+      },
+      "NT": {
+        "THIRD": {
+          "SECOND": [{"code": "NTT 403", "units": 3, "title": "Computer Networking 4"}]
+        }
+      }
+    }
+  }
+}
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+  """curriculum.py serving CATALOG from a temp file; the shipped catalog is reloaded afterwards."""
+  path = tmp_path / "curriculum.json"
+  path.write_text(json.dumps(CATALOG), encoding="utf-8")
+  monkeypatch.setattr(curriculum, "CURRICULUM_PATH", str(path))
+  curriculum.load_curriculum(force=True)
+  yield path
+  monkeypatch.undo()
+  curriculum.load_curriculum(force=True)
+
+@pytest.fixture
+def records(tmp_path, monkeypatch):
+  """record_store.py on an empty database of its own (this thread's connection is reset)."""
+  monkeypatch.setattr(record_store, "RECORDS_DB_PATH", str(tmp_path / "records.sqlite3"))
+  monkeypatch.setattr(record_store, "_phash_recent", {})
+  _close_records_db()
+  yield record_store
+  _close_records_db()
+
+def _close_records_db():
+  conn = record_store._records_local.__dict__.pop("conn", None)
+  if conn is not None:
+    conn.close()
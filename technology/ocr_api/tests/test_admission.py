@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import AdmissionRejected, admission_slot
+
+
+@pytest.fixture
+def pool(monkeypatch):
+  def make(capacity=2, max_queue=1, max_wait=0):
+    p = admission._admission_pool("test", capacity=capacity, max_queue=max_queue, max_wait=max_wait)
+    monkeypatch.setitem(admission.ADMISSION_POOLS, "test", p)
+    return p
+  return make
+
+
+def test_slots_up_to_capacity_then_timeout(pool):
+  p = pool(capacity=2, max_queue=1, max_wait=0)
+  with admission_slot("test"), admission_slot("test"):
+    assert p["in_use"] == 2
+    with pytest.raises(AdmissionRejected) as e:
+      with admission_slot("test"):
+        pass
+    assert e.value.status == 503
+    assert e.value.retry_after >= 1
+  assert (p["in_use"], p["active"], p["waiting"]) == (0, 0, 0)
+  assert (p["admitted"], p["rejected_timeout"]) == (2, 1)
+
+
+def test_full_queue_is_rejected_with_429(pool):
+  p = pool(capacity=1, max_queue=0)
+  with admission_slot("test"):
+    with pytest.raises(AdmissionRejected) as e:
+      with admission_slot("test"):
+        pass
+  assert e.value.status == 429
+  assert p["rejected_queue_full"] == 1
+
+
+def test_cost_is_clamped_to_capacity(pool):
+  p = pool(capacity=2)
+  with admission_slot("test", cost=10):
+    assert p["in_use"] == 2
+  assert p["in_use"] == 0
+
+
+def test_release_wakes_a_waiter(pool):
+  p = pool(capacity=1, max_queue=1, max_wait=5)
+  held = threading.Event()
+  release = threading.Event()
+
+  def holder():
+    with admission_slot("test"):
+      held.set()
+      release.wait(5)
+
+  t = threading.Thread(target=holder)
+  t.start()
+  held.wait(5)
+  threading.Timer(0.05, release.set).start()
+  started = time.monotonic()
+  with admission_slot("test"):
+    assert p["active"] == 1
+  t.join(5)
+  assert time.monotonic() - started < 5
+  assert p["admitted"] == 2
+
+
+def test_retry_after_grows_with_backlog(pool):
+  p = pool(capacity=1)
+  p["avg_seconds"] = 10.0
+  idle = admission._retry_after_seconds(p)
+  p["active"], p["waiting"] = 1, 3
+  assert admission._retry_after_seconds(p) > idle
+
+
+def test_stats_leave_out_the_condition(pool):
+  pool()
+  stats = admission.admission_stats()
+  assert "cond" not in stats["test"]
+  assert {"upload", "upload_grade_pdf", "upload_registration_summary_pdf", "classify"} <= set(stats)
@@ -0,0 +1,63 @@
+import pytest
+
+from classification import CLASSIFY_QR_WEIGHT, classify_text, score_document_text
+
+COG_HEADER = """
+BATANGAS STATE UNIVERSITY
+COPY OF GRADES
+Course Code   Course Title   Units   Grade   Instructor
+IT 321        Human-Computer Interaction   3   1.25
+TOTAL NO. OF UNITS 21   GENERAL WEIGHTED AVERAGE 1.45
+*** NOTHING FOLLOWS ***
+"""
+
+COR_HEADER = """
+BATANGAS STATE UNIVERSITY
+CERTIFICATE OF REGISTRATION
+Reference No. 2024-00123
+Course Code   Description   Unit(s)
+Tuition Fee   Scholarship   Assessment
+"""
+
+
+def test_copy_of_grades_is_a_cog():
+  kind, scores, hits = classify_text(COG_HEADER)
+  assert kind == "cog"
+  assert scores == {"cog": 9, "cor": 0}
+  assert hits["cog"] == ["copy of grades", "general weighted average", "nothing follows",
+                         "total no of units", "instructor"]
+
+
+def test_certificate_of_registration_is_a_cor():
+  kind, scores, hits = classify_text(COR_HEADER)
+  assert kind == "cor"
+  assert scores == {"cog": 0, "cor": 9}
+  assert "certificate of registration" in hits["cor"]
+
+
+def test_anchor_matching_tolerates_ocr_noise():
+  scores, hits = score_document_text("COPV  OF\nGRADES")
+  assert hits["cog"] == ["copy of grades"]
+  assert scores["cog"] == 4
+
+
+@pytest.mark.parametrize("text", [
+  "",
+  "Batangas State University",
+  "Instructor: J. Dela Cruz   Assessment",  # a point each: too weak
+  "Copy of Grades   Registration Form",     # strong anchors for both: too close
+])
+def test_weak_or_ambiguous_text_is_undecided(text):
+  assert classify_text(text)[0] is None
+
+
+def test_qr_code_counts_towards_cog():
+  text = "General Weighted Average"  # 2 points, below the minimum score
+  assert classify_text(text)[0] is None
+  kind, scores, _ = classify_text(text, qr=True)
+  assert kind == "cog"
+  assert scores["cog"] == 2 + CLASSIFY_QR_WEIGHT
+
+
+def test_qr_code_does_not_override_a_clear_cor():
+  assert classify_text(COR_HEADER, qr=True)[0] == "cor"
@@ -0,0 +1,52 @@
+import pytest
+
+from curriculum import snap_course_code
+
+
+@pytest.mark.parametrize("raw, code", [
+  ("IT 321", "IT 321"),
+  ("I T 3 2 1", "IT 321"),
+  ("IT 3 21.", "IT 321"),
+])
+def test_separators_are_not_corrections(catalog, raw, code):
+  snapped = snap_course_code(raw)
+  assert snapped == {"input": raw, "code": code, "distance": 0.0, "corrected": False}
+
+
+@pytest.mark.parametrize("raw, code, distance", [
+  ("IT 32l", "IT 321", 0.25),   # l read for 1
+  ("lT 321", "IT 321", 0.25),   # l read for I
+  ("IT32I", "IT 321", 0.25),
+  ("IT-3Z1", "IT 321", 0.25),   # Z read for 2
+  ("1T 3Z4", "IT 324", 0.5),    # two confusions in a malformed token
+  ("NTT4O3", "NTT 403", 0.25),  # O read for 0
+  ("IT 321|", "IT 321", 1.0),   # stray non-digit character
+])
+def test_ocr_confusions_snap_to_the_catalog(catalog, raw, code, distance):
+  snapped = snap_course_code(raw)
+  assert snapped["code"] == code
+  assert snapped["distance"] == distance
+  assert snapped["corrected"]
+
+
+@pytest.mark.parametrize("raw", [
+  "IT 327",   # a real, different digit
+  "IT 311",
+  "IT 31l",   # confusion plus a real digit edit
+  "IT 327l",  # extra digit: within the malformed budget, but a digit edit
+  "IT 3l4",   # l for 2 is not a confusion
+  "TI 321",   # swapped letters cost a full edit on a well-formed code
+  "NT 403",   # dropped letter
+])
+def test_real_edits_never_snap(catalog, raw):
+  assert snap_course_code(raw) is None
+
+
+def test_explicit_budget(catalog):
+  assert snap_course_code("TI 321", max_distance=1.0)["code"] == "IT 321"
+  assert snap_course_code("IT 32l", max_distance=0.0) is None
+
+
+def test_empty_input(catalog):
+  assert snap_course_code("") is None
+  assert snap_course_code(" - ") is None
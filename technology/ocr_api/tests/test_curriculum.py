@@ -0,0 +1,66 @@
+import json
+import os
+
+import curriculum
+from curriculum import curriculum_units, validate_course_codes
+
+
+def test_known_codes_are_ok_whatever_their_spelling(catalog):
+  result = validate_course_codes(["it321", "IT-324", "NSTP  111,"])
+  assert result["all_ok"]
+  assert [it["code"] for it in result["items"]] == ["IT 321", "IT 324", "NSTP 111"]
+  assert result["summary"] == {"ok_count": 3, "total": 3}
+  assert result["catalog_version"] == "test"
+
+
+def test_unknown_code_is_reported_not_ok(catalog):
+  result = validate_course_codes(["IT 321", "IT 999"])
+  assert not result["all_ok"]
+  unknown = result["items"][1]
+  assert unknown == {"input": "IT 999", "code": "IT 999", "ok": False, "known": False,
+                     "units": None, "title": "", "curriculum_term": None}
+
+
+def test_empty_list_is_not_all_ok(catalog):
+  assert not validate_course_codes([])["all_ok"]
+
+
+def test_term_scope_includes_shared_track(catalog):
+  result = validate_course_codes(["IT 321", "NTT 403"], program="B.S. Information Technology",
+                                 track="nt", year_level="3rd", semester="2nd")
+  assert result["all_ok"]
+  assert result["items"][0]["curriculum_term"] == {"track": "ALL", "year_level": "THIRD", "semester": "SECOND"}
+
+
+def test_term_scope_rejects_other_tracks_and_terms(catalog):
+  result = validate_course_codes(["NTT 403", "NSTP 111"], program="BS Information Technology",
+                                 track="BA", year_level="THIRD", semester="SECOND")
+  assert [it["ok"] for it in result["items"]] == [False, False]
+  assert [it["known"] for it in result["items"]] == [True, True]
+
+
+def test_program_filter(catalog):
+  result = validate_course_codes(["IT 321"], program="BS Computer Science")
+  assert not result["all_ok"]
+  assert not result["items"][0]["known"]
+
+
+def test_units_lookup(catalog):
+  assert curriculum_units("it-324") == 3
+  assert curriculum_units("IT 999") is None
+
+
+def test_reload_on_change_and_keep_previous_on_broken_file(catalog):
+  doc = json.loads(catalog.read_text(encoding="utf-8"))
+  doc["version"] = "v2"
+  doc["programs"]["BS Information Technology"]["ALL"]["THIRD"]["SECOND"].append(
+    {"code": "IT 325", "units": 3, "title": "IT Project Management"})
+  catalog.write_text(json.dumps(doc), encoding="utf-8")
+  os.utime(catalog, (1, 1))  # mtime must differ from the loaded file's
+  assert curriculum.load_curriculum()["version"] == "v2"
+  assert validate_course_codes(["IT 325"])["all_ok"]
+
+  catalog.write_text("{not json", encoding="utf-8")
+  os.utime(catalog, (2, 2))
+  assert curriculum.load_curriculum()["version"] == "v2"
+  assert validate_course_codes(["IT 325"])["all_ok"]
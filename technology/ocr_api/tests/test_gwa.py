@@ -0,0 +1,110 @@
+import pytest
+
+from gwa import GWA_RULES, compute_gwa, compute_gwa_by_term, gwa_rows_problem, render_grade_with_units_table
+
+
+def row(code, units, grade):
+  return {"code": code, "units": units, "grade": grade}
+
+
+def test_weighted_average_and_exclusions():
+  result = compute_gwa([
+    row("IT 321", 3, "1.25"),
+    row("IT 322", 2, "2.00"),
+    row("NSTP 121", 3, "1.00"),
+  ], GWA_RULES)
+  assert result["total_units"] == 5
+  assert result["total_weighted"] == 7.75
+  assert result["weighted_average"] == 1.55
+  assert result["weighted_average_str"] == "1.5500"
+  assert result["excluded_units"] == 3
+  assert [r["status"] for r in result["rows"]] == ["counted", "counted", "excluded"]
+  assert result["rows"][2]["reason"] == "excluded_prefix"
+  assert result["lowest_grade"] == 2.0
+  assert result["honor"] == "Tech Prodigy"
+  assert result["eligibility"]["deans_list"] == {"eligible": True, "reasons": []}
+
+
+def test_honors_are_checked_in_order():
+  assert compute_gwa([row("IT 321", 3, "1.00")], GWA_RULES)["honor"] == "Tech Savant"
+  assert compute_gwa([row("IT 321", 3, "1.50")], GWA_RULES)["honor"] == "Tech Virtuoso"
+
+
+def test_non_numeric_and_incomplete_rows_disqualify_without_counting():
+  result = compute_gwa([
+    row("IT 321", 3, "1.25"),
+    row("IT 322", 3, "INC"),
+    row("IT 323", None, "1.50"),
+  ], GWA_RULES)
+  assert result["weighted_average"] == 1.25
+  assert [r["status"] for r in result["rows"]] == ["counted", "non_numeric", "incomplete"]
+  assert result["non_numeric_grades"] == ["INC"]
+  assert result["eligibility"]["deans_list"] == {"eligible": False, "reasons": ["has_inc", "incomplete_rows"]}
+
+
+def test_low_grade_and_high_gwa_are_reported():
+  result = compute_gwa([row("IT 321", 3, "3.00"), row("IT 322", 3, "1.00")], GWA_RULES)
+  assert result["weighted_average"] == 2.0
+  assert result["eligibility"]["deans_list"]["reasons"] == ["gwa_above_1.75", "grade_below_2.50"]
+
+
+def test_no_counted_rows():
+  result = compute_gwa([row("NSTP 111", 3, "1.00")], GWA_RULES)
+  assert result["weighted_average"] is None
+  assert result["weighted_average_str"] == ""
+  assert result["eligibility"]["deans_list"]["reasons"] == ["no_gwa", "insufficient_units"]
+
+
+def test_rules_override():
+  rules = {**GWA_RULES, "exclude_prefixes": [], "exclude_codes": ["it 322"]}
+  result = compute_gwa([row("IT 322", 3, "1.00"), row("NSTP 111", 3, "2.00")], rules)
+  assert [r["status"] for r in result["rows"]] == ["excluded", "counted"]
+  assert result["rows"][0]["reason"] == "excluded_code"
+
+
+def test_by_term_and_cumulative():
+  result = compute_gwa_by_term({
+    "2023-2024 FIRST": [row("IT 321", 3, "1.00")],
+    "2023-2024 SECOND": [row("IT 322", 3, "2.00")],
+  }, GWA_RULES)
+  assert result["terms"]["2023-2024 FIRST"]["weighted_average"] == 1.0
+  assert result["terms"]["2023-2024 SECOND"]["weighted_average"] == 2.0
+  assert result["cumulative"]["weighted_average"] == 1.5
+  assert result["cumulative"]["course_count"] == 2
+
+
+def test_grade_with_units_table_skips_excluded_rows():
+  table = render_grade_with_units_table(
+    compute_gwa([row("IT 321", 3, "1.25"), row("NSTP 121", 3, "1.00")], GWA_RULES))
+  assert table.splitlines() == [
+    "Grades | Units | Weighted Grades |",
+    "1.25   | 3     | 3.75          |",
+    "Total:   | 3     | 3.75          |",
+    "Weighted Average: 1.2500",
+  ]
+
+
+@pytest.mark.parametrize("rows", [
+  [],
+  [row("IT 321", 3, "1.25"), row("IT 322", 3, "INC"), row("IT 323", None, None)],
+  [{"code": "IT 321", "units": 3.0, "grade": 1.5}],
+])
+def test_valid_rows(catalog, rows):
+  assert gwa_rows_problem(rows) is None
+
+
+@pytest.mark.parametrize("rows, problem", [
+  ({"code": "IT 321"}, "rows must be a list of course rows"),
+  (["IT 321"], "rows[0] must be an object"),
+  ([row(321, 3, "1.00")], "rows[0].code must be a string"),
+  ([row("IT 321", "3", "1.00")], "rows[0].units must be a number"),
+  ([row("IT 321", True, "1.00")], "rows[0].units must be a number"),
+  ([row("IT 321", 3, "1.00"), row("IT 322", 3, ["1.00"])], "rows[1].grade must be a grade string or number"),
+  ([row("IT 321", 3, "A+")], "rows[0].grade is not a grade: 'A+'"),
+])
+def test_rows_problem_names_the_field(catalog, rows, problem):
+  assert gwa_rows_problem(rows) == problem
+
+
+def test_rows_problem_prefix(catalog):
+  assert gwa_rows_problem([None], "terms['2024 FIRST']") == "terms['2024 FIRST'][0] must be an object"
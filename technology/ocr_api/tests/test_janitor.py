@@ -0,0 +1,64 @@
+import os
+import time
+
+import pytest
+
+import janitor
+
+YEAR_AGO = time.time() - 365 * 86400
+
+
+@pytest.fixture
+def results_dir(tmp_path, monkeypatch):
+  monkeypatch.setattr(janitor, "RESULTS_DIR", str(tmp_path))
+  return tmp_path
+
+
+def put(results_dir, rel, data="x", when=YEAR_AGO):
+  path = results_dir / rel
+  path.parent.mkdir(parents=True, exist_ok=True)
+  path.write_text(data, encoding="utf-8")
+  os.utime(path, (when, when))
+  return path
+
+
+def remaining(results_dir):
+  return sorted(str(p.relative_to(results_dir)) for p in results_dir.rglob("*") if p.is_file())
+
+
+def test_expired_artifacts_go_and_canonical_state_stays(results_dir):
+  for rel in ("raw_cog_text.txt", "cog_meta.json", "a.png", "raw_ocr_text.txt", "previews/x/raw_cog_text.txt"):
+    put(results_dir, rel)
+  removed = janitor.sweep_results_dir()
+  assert removed == {"raw_text": (2, 2), "image": (1, 1)}
+  assert remaining(results_dir) == ["cog_meta.json", "raw_cog_text.txt"]
+  assert not (results_dir / "previews" / "x").exists()
+
+
+def test_served_artifacts_count_as_used(results_dir):
+  path = put(results_dir, "a.png")
+  mtime = path.stat().st_mtime_ns
+  janitor.note_artifact_access("a.png")
+  janitor.note_artifact_access("../outside.png")
+  assert path.stat().st_mtime_ns == mtime
+  assert janitor.sweep_results_dir() == {}
+  assert remaining(results_dir) == ["a.png"]
+
+
+def test_young_files_are_never_removed(results_dir, monkeypatch):
+  monkeypatch.setattr(janitor, "ARTIFACT_POLICIES", {
+    name: {**policy, "ttl_seconds": 0, "max_bytes": 0} for name, policy in janitor.ARTIFACT_POLICIES.items()})
+  put(results_dir, "a.tmp", when=time.time())
+  assert janitor.sweep_results_dir() == {}
+  assert remaining(results_dir) == ["a.tmp"]
+
+
+def test_over_budget_class_drops_least_recently_used_first(results_dir, monkeypatch):
+  policies = {**janitor.ARTIFACT_POLICIES, "image": {**janitor.ARTIFACT_POLICIES["image"], "max_bytes": 10}}
+  monkeypatch.setattr(janitor, "ARTIFACT_POLICIES", policies)
+  now = time.time()
+  put(results_dir, "old.png", "x" * 6, when=now - 3600)
+  put(results_dir, "new.png", "x" * 6, when=now - 600)
+  assert janitor.sweep_results_dir(now=now) == {"image": (1, 6)}
+  assert remaining(results_dir) == ["new.png"]
+  assert janitor.janitor_stats()["by_class"]["image"]["files"] == 1
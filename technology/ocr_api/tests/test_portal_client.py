@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+import pytest
+
+import portal_client
+from portal_client import BrowserPool, PortalUnavailable
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+  monkeypatch.setattr(portal_client, "_portal_cache", OrderedDict())
+  monkeypatch.setattr(portal_client, "_portal_breakers", {})
+  monkeypatch.setattr(portal_client, "_portal_stats", dict.fromkeys(portal_client._portal_stats, 0))
+
+
+def fail(host, times):
+  for _ in range(times):
+    portal_client.portal_breaker_before_call(host)
+    portal_client.portal_breaker_after_call(host, ok=False)
+
+
+def test_breaker_opens_after_repeated_failures(monkeypatch):
+  monkeypatch.setattr(portal_client, "PORTAL_BREAKER_FAILURES", 3)
+  fail("portal", 2)
+  portal_client.portal_breaker_before_call("portal")  # still closed
+  portal_client.portal_breaker_after_call("portal", ok=False)
+  with pytest.raises(PortalUnavailable) as e:
+    portal_client.portal_breaker_before_call("portal")
+  assert e.value.retry_after >= 1
+  portal_client.portal_breaker_before_call("other-host")  # per host
+  stats = portal_client.portal_client_stats()
+  assert stats["breakers"]["portal"]["open"]
+  assert stats["stats"]["failures"] == 3
+  assert stats["stats"]["short_circuited"] == 1
+
+
+def test_half_open_lets_one_probe_through(monkeypatch):
+  monkeypatch.setattr(portal_client, "PORTAL_BREAKER_FAILURES", 1)
+  monkeypatch.setattr(portal_client, "PORTAL_BREAKER_COOLDOWN", 0)
+  fail("portal", 1)
+  portal_client.portal_breaker_before_call("portal")  # the probe
+  with pytest.raises(PortalUnavailable):
+    portal_client.portal_breaker_before_call("portal")
+  portal_client.portal_breaker_after_call("portal", ok=True)
+  portal_client.portal_breaker_before_call("portal")
+  assert not portal_client.portal_client_stats()["breakers"]["portal"]["open"]
+
+
+def test_calls_that_say_nothing_about_the_portal_do_not_count(monkeypatch):
+  monkeypatch.setattr(portal_client, "PORTAL_BREAKER_FAILURES", 1)
+  for _ in range(3):
+    portal_client.portal_breaker_before_call("portal")
+    portal_client.portal_breaker_after_call("portal", ok=None)
+  portal_client.portal_breaker_before_call("portal")
+
+
+def test_cache_expiry_and_size_limit(monkeypatch):
+  monkeypatch.setattr(portal_client, "PORTAL_CACHE_MAX", 2)
+  portal_client.portal_cache_put("a", "text a")
+  portal_client.portal_cache_put("b", "text b")
+  assert portal_client.portal_cache_get("a") == "text a"  # a is now the most recent
+  portal_client.portal_cache_put("c", "text c")
+  assert portal_client.portal_cache_get("b") is None
+  assert portal_client.portal_cache_get("a") == "text a"
+
+  monkeypatch.setattr(portal_client, "PORTAL_CACHE_TTL", -1)
+  portal_client.portal_cache_put("d", "text d")
+  assert portal_client.portal_cache_get("d") is None
+
+
+def test_page_url_override(monkeypatch):
+  url = "https://dione.batstate-u.edu.ph/public/sites/apps/grades/?code=abc"
+  assert portal_client.portal_page_url(url) == url
+  monkeypatch.setattr(portal_client, "PORTAL_BASE_OVERRIDE", "http://127.0.0.1:8765")
+  assert portal_client.portal_page_url(url) == "http://127.0.0.1:8765/public/sites/apps/grades/?code=abc"
+
+
+def test_browser_pool_reuses_and_retires_browsers():
+  launched, quit = [], []
+  pool = BrowserPool(1, 2, launch=lambda: launched.append(len(launched)) or f"driver{len(launched)}",
+                     quit=lambda driver, **kw: quit.append(driver))
+  driver, uses = pool.checkout(timeout=1)
+  assert (driver, uses) == ("driver1", 0)
+  assert pool.checkout(timeout=0) is None  # the only slot is taken
+  pool.checkin(driver, uses, healthy=True)
+  assert pool.checkout(timeout=1) == ("driver1", 1)
+  pool.checkin("driver1", 1, healthy=True)  # second use was its last
+  assert quit == ["driver1"]
+  driver, _ = pool.checkout(timeout=1)
+  assert driver == "driver2"
+  pool.checkin(driver, 0, healthy=False)
+  assert quit == ["driver1", "driver2"]
+  assert pool.idle_count() == 0
+
+
+def test_browser_pool_frees_the_slot_when_launch_fails():
+  def launch():
+    raise RuntimeError("no chrome")
+  pool = BrowserPool(1, 5, launch=launch, quit=lambda driver: None)
+  with pytest.raises(RuntimeError):
+    pool.checkout(timeout=0)
+  with pytest.raises(RuntimeError):
+    pool.checkout(timeout=0)  # would return None if the slot had leaked
+
+
+def test_browser_pool_shutdown_quits_idle_browsers():
+  quit = []
+  pool = BrowserPool(2, 5, launch=lambda: object(), quit=lambda driver, **kw: quit.append(kw))
+  a, b = pool.checkout(timeout=0), pool.checkout(timeout=0)
+  pool.checkin(*a, healthy=True)
+  pool.checkin(*b, healthy=True)
+  pool.shutdown(grace_seconds=2)
+  assert quit == [{"grace_seconds": 2}, {"grace_seconds": 2}]
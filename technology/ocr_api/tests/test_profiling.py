@@ -0,0 +1,52 @@
+import json
+import threading
+import time
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def profiles_dir(tmp_path, monkeypatch):
+  monkeypatch.setattr(profiling, "PROFILES_DIR", str(tmp_path / "profiles"))
+  return tmp_path / "profiles"
+
+
+def test_sampler_records_the_request_thread():
+  ident = threading.get_ident()
+  profiling.start_sampling(ident)
+  deadline = time.monotonic() + 0.2
+  while time.monotonic() < deadline:
+    sum(range(1000))
+  stacks = profiling.stop_sampling(ident)
+  assert sum(stacks.values()) > 0
+  assert any("test_profiling.py:test_sampler_records_the_request_thread" in s for s in stacks)
+  assert profiling.stop_sampling(ident) == {}
+
+
+def test_cprofile_is_one_request_at_a_time():
+  first = profiling.start_cprofile()
+  assert first is not None
+  assert profiling.start_cprofile() is None
+  profiling.stop_cprofile(first)
+  second = profiling.start_cprofile()
+  assert second is not None
+  profiling.stop_cprofile(second)
+
+
+def test_saved_sample_profile_and_index(profiles_dir):
+  meta = profiling.save_profile("sample", {"a;b": 3, "a": 1}, {"endpoint": "upload", "elapsed_ms": 12.5})
+  assert meta["samples"] == 4
+  assert (profiles_dir / meta["file"]).read_text(encoding="utf-8") == "a 1\na;b 3\n"
+  assert json.loads((profiles_dir / f"{meta['name']}.json").read_text(encoding="utf-8")) == meta
+  assert profiling.profile_index() == [meta]
+  assert profiling.profile_index(endpoint="classify") == []
+
+
+def test_only_the_newest_profiles_are_kept(profiles_dir, monkeypatch):
+  monkeypatch.setattr(profiling, "PROFILE_KEEP", 2)
+  for endpoint in ("a", "b", "c"):
+    profiling.save_profile("sample", {"x": 1}, {"endpoint": endpoint})
+  assert len(profiling.profile_index()) == 2
+  assert len(list(profiles_dir.iterdir())) == 4  # .json + .folded each
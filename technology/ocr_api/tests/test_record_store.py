@@ -0,0 +1,78 @@
+FIELDS = {"sr_code": "2112345", "academic_year": "2023-2024", "semester": "2nd", "year_level": "3"}
+GWA = {"rows": [{"code": "IT 321", "units": 3, "grade": "1.25"}], "weighted_average": 1.25}
+
+
+def save(records, doc, fields=FIELDS, raw_text="raw", gwa=GWA):
+  return records.save_verified_record(doc, fields, raw_text, ["1.25"], ["1.25"], gwa, qr_url="https://portal/q")
+
+
+def test_save_and_find_by_document(records):
+  record_id = save(records, "a" * 64)
+  record = records.find_record_by_document("a" * 64)
+  assert record["record_id"] == record_id
+  assert record["sr_code"] == "2112345"
+  assert record["rows"] == GWA["rows"]
+  assert record["gwa"] == {"weighted_average": 1.25}
+  assert records.get_record_by_id(record_id) == record
+  assert records.find_record_by_document("b" * 64) is None
+
+
+def test_rescan_of_the_same_term_updates_one_record(records):
+  first = save(records, "a" * 64, raw_text="first scan")
+  second = save(records, "b" * 64, raw_text="second scan")
+  assert first == second
+  assert records.find_record_by_document("a" * 64)["raw_text"] == "second scan"
+  assert [r["raw_text"] for r in records.get_student_records("2112345")] == ["second scan"]
+
+
+def test_student_records_are_ordered_by_term(records):
+  save(records, "b" * 64, fields={**FIELDS, "semester": "2nd"})
+  save(records, "a" * 64, fields={**FIELDS, "semester": "1st"})
+  save(records, "c" * 64, fields={**FIELDS, "academic_year": "2022-2023"})
+  terms = [(r["academic_year"], r["semester"]) for r in records.get_student_records("2112345")]
+  assert terms == [("2022-2023", "2nd"), ("2023-2024", "1st"), ("2023-2024", "2nd")]
+
+
+def test_missing_key_fields_are_not_stored(records):
+  assert save(records, "a" * 64, fields={**FIELDS, "semester": ""}) is None
+  assert records.get_student_records("2112345") == []
+
+
+def test_near_duplicate_needs_the_same_qr_payload(records):
+  phash = (1 << 200) | 0xF0F0
+  records.remember_phash("cog_pdf", phash, "https://portal/q1", payload={"grades": ["1.25"]})
+  near = records.find_near_duplicate("cog_pdf", phash ^ 0b111, "https://portal/q1")
+  assert near == {"distance": 3, "record_id": None, "payload": {"grades": ["1.25"]}}
+  assert records.find_near_duplicate("cog_pdf", phash, "https://portal/q2") is None
+  assert records.find_near_duplicate("grade_image", phash, "https://portal/q1") is None
+  assert records.find_near_duplicate("cog_pdf", phash, "") is None
+
+
+def test_near_duplicate_distance_limit_and_closest_match(records):
+  records.remember_phash("cog_pdf", 0, "https://portal/q", payload="far")
+  records.remember_phash("cog_pdf", 0b11, "https://portal/q", payload="near")
+  assert records.find_near_duplicate("cog_pdf", 0b111, "https://portal/q")["payload"] == "near"
+  too_far = (1 << (records.PHASH_MAX_DISTANCE + 1)) - 1
+  assert records.find_near_duplicate("cog_pdf", too_far << 8, "https://portal/q") is None
+
+
+def test_phash_index_is_reloaded_from_the_database(records):
+  records.remember_phash("cog_pdf", 0xABC, "https://portal/q", payload="stored")
+  records._phash_recent.clear()  # as in a fresh worker process
+  assert records.find_near_duplicate("cog_pdf", 0xABC, "https://portal/q")["payload"] == "stored"
+
+
+def test_pending_verification_lifecycle(records):
+  vid = records.add_pending_verification("https://portal/q", "a" * 64, "raw", ["1.25"])
+  assert records.count_pending_verifications() == 1
+  [row] = records.pending_verifications()
+  assert (row["id"], row["attempts"], row["grades_json"]) == (vid, 0, '["1.25"]')
+
+  records.finish_verification_attempt(vid, "pending")
+  assert records.get_verification(vid)["attempts"] == 1
+  assert records.count_pending_verifications() == 1
+
+  records.finish_verification_attempt(vid, "tampered")
+  assert records.get_verification(vid)["status"] == "tampered"
+  assert records.pending_verifications() == []
+  assert records.get_verification(vid + 1) is None